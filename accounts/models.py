@@ -1,6 +1,9 @@
 from django.contrib.auth.base_user import AbstractBaseUser, BaseUserManager
+from django.conf import settings
 from django.contrib.auth.models import PermissionsMixin
+from django.core.cache import cache
 from django.db import models
+from django.db.models import F
 from django.utils import timezone
 
 
@@ -25,6 +28,15 @@ class UserManager(BaseUserManager):
 
         return self.create_user(email, password, **extra_fields)
 
+    def expire_assigned_states(self, user_ids):
+        """
+        Invalidates the cached assigned states of users in every process, by bumping their
+        ``states_version``.
+
+        :param user_ids: Ids of the users, or a queryset of them.
+        """
+        self.filter(pk__in=user_ids).update(states_version=F("states_version") + 1)
+
 
 class User(AbstractBaseUser, PermissionsMixin):
     email = models.EmailField(unique=True, max_length=255)
@@ -39,6 +51,8 @@ class User(AbstractBaseUser, PermissionsMixin):
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)
     date_joined = models.DateTimeField(default=timezone.now)
+    # Bumped whenever the assigned states change; part of the key of their cache.
+    states_version = models.PositiveIntegerField(default=0, editable=False)
 
     objects = UserManager()
 
@@ -48,6 +62,61 @@ class User(AbstractBaseUser, PermissionsMixin):
     def __str__(self):
         return self.email
 
+    @property
+    def states_cache_key(self):
+        return f"accounts:user:{self.pk}:states:{self.states_version}"
+
+    def get_assigned_states(self):
+        """
+        Returns the states assigned to the user as ``(id, name, slug, default)`` tuples,
+        with the default state first.
+
+        The result is cached under the ``states_version`` of the user, which every request
+        reads with the user row: any change of the assignments, in any process, misses the
+        cache on the next request. Entries expire after ``ASSIGNED_STATES_CACHE_TIMEOUT``.
+
+        :return: A list of tuples.
+        """
+        states = cache.get(self.states_cache_key)
+        if states is None:
+            states = list(
+                UserState.objects
+                .filter(user=self)
+                .order_by("-default", "state__name")
+                .values_list("state_id", "state__name", "state__slug", "default")
+            )
+            cache.set(self.states_cache_key, states, timeout=settings.ASSIGNED_STATES_CACHE_TIMEOUT)
+        return states
+
+    def can_view_state(self, state_id):
+        """
+        Checks if the user may see the cameras, photos and videos of a state.
+
+        :param state_id: The id of the state.
+        :return: True for staff users and the states assigned to the user.
+        """
+        return self.is_staff or any(assigned_id == state_id for assigned_id, *_ in self.get_assigned_states())
+
+
+class UserStateQuerySet(models.QuerySet):
+    """
+    Expires the assigned states of the users changed in bulk, which sends no signal.
+    """
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = super().bulk_create(objs, *args, **kwargs)
+        User.objects.expire_assigned_states({obj.user_id for obj in objs})
+        return objs
+
+    def update(self, **kwargs):
+        user_ids = set(self.values_list("user_id", flat=True))
+        count = super().update(**kwargs)
+        user = kwargs.get("user", kwargs.get("user_id"))
+        if user is not None:
+            user_ids.add(getattr(user, "pk", user))
+        User.objects.expire_assigned_states(user_ids)
+        return count
+
 
 class UserState(models.Model):
     user = models.ForeignKey(
@@ -60,6 +129,8 @@ class UserState(models.Model):
     )
     default = models.BooleanField(blank=True, default=False)
 
+    objects = UserStateQuerySet.as_manager()
+
     class Meta:
         constraints = [
             models.UniqueConstraint(fields=["user", "state"], name="user_state_unique_together"),
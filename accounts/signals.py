@@ -0,0 +1,32 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from states.models import State
+from .models import User, UserState
+
+
+def clear_assigned_states_cache(user_ids):
+    User.objects.expire_assigned_states(user_ids)
+
+
+@receiver([post_save, post_delete], sender=UserState)
+def user_state_changed(sender, instance, **kwargs):
+    clear_assigned_states_cache([instance.user_id])
+
+
+@receiver(m2m_changed, sender=UserState)
+def user_states_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action.startswith("post_"):
+            clear_assigned_states_cache([instance.pk])
+    elif action in ("post_add", "post_remove"):
+        clear_assigned_states_cache(pk_set)
+    elif action == "pre_clear":
+        clear_assigned_states_cache(list(instance.users.values_list("pk", flat=True)))
+
+
+@receiver(post_save, sender=State)
+def state_changed(sender, instance, created, **kwargs):
+    # The cached assignments hold the name and slug of the state.
+    if not created:
+        clear_assigned_states_cache(UserState.objects.filter(state=instance).values("user_id"))
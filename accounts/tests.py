@@ -1,3 +1,56 @@
+from django.core.cache import cache
 from django.test import TestCase
 
-# Create your tests here.
+from core.testing import AdminQueryBudgetMixin, make_state, make_user
+from .models import User, UserState
+
+
+class AccountsAdminQueryBudgetTests(AdminQueryBudgetMixin, TestCase):
+    admin_models = [User]
+
+    def setUp(self):
+        self.add_users(3)
+
+    def grow(self):
+        self.add_users(30)
+
+    def add_users(self, count):
+        states = [make_state() for _ in range(3)]
+        for i in range(count):
+            make_user(staff=i % 5 == 0, states=states[:i % 3 + 1])
+
+
+class AssignedStatesTests(TestCase):
+    def setUp(self):
+        self.addCleanup(cache.clear)
+        self.kept, self.revoked = make_state(), make_state()
+        self.user = make_user(states=[self.kept, self.revoked])
+
+    def next_request_user(self):
+        # Every request loads the user row again.
+        return User.objects.get(pk=self.user.pk)
+
+    def test_assigned_states_are_cached(self):
+        user = self.next_request_user()
+        self.assertTrue(user.can_view_state(self.revoked.id))
+        with self.assertNumQueries(0):
+            self.assertTrue(user.can_view_state(self.kept.id))
+
+    def test_revoked_state_is_denied(self):
+        self.assertTrue(self.next_request_user().can_view_state(self.revoked.id))
+        UserState.objects.filter(user=self.user, state=self.revoked).delete()
+        self.assertFalse(self.next_request_user().can_view_state(self.revoked.id))
+
+    def test_states_changed_in_bulk_are_denied(self):
+        other = make_state()
+        self.assertTrue(self.next_request_user().can_view_state(self.revoked.id))
+        UserState.objects.filter(user=self.user, state=self.revoked).update(state=other)
+        user = self.next_request_user()
+        self.assertFalse(user.can_view_state(self.revoked.id))
+        self.assertTrue(user.can_view_state(other.id))
+
+    def test_renamed_state_is_refreshed(self):
+        self.next_request_user().get_assigned_states()
+        self.kept.name = "Renamed"
+        self.kept.save()
+        self.assertIn("Renamed", [name for _, name, *_ in self.next_request_user().get_assigned_states()])
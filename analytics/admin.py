@@ -0,0 +1,40 @@
+from django.contrib import admin
+
+from core.admin import ReplicaChangeListMixin
+from . import models
+
+
+@admin.register(models.StateActivity)
+class StateActivityAdmin(ReplicaChangeListMixin, admin.ModelAdmin):
+    list_display = [
+        "state",
+        "date",
+        "deer_count",
+        "car_count",
+        "truck_count",
+        "person_count",
+        "unique_deer_count",
+        "connected_count",
+        "disconnected_count",
+    ]
+    list_filter = ["state"]
+    list_select_related = ["state"]
+    date_hierarchy = "date"
+
+
+@admin.register(models.RoadActivity)
+class RoadActivityAdmin(ReplicaChangeListMixin, admin.ModelAdmin):
+    list_display = ["road", "state", "date", "deer_count", "car_count", "truck_count", "person_count", "unique_deer_count"]
+    list_filter = ["state"]
+    list_select_related = ["road", "state"]
+    search_fields = ["road__name"]
+    date_hierarchy = "date"
+
+
+@admin.register(models.DeerHeatmapTile)
+class DeerHeatmapTileAdmin(ReplicaChangeListMixin, admin.ModelAdmin):
+    list_display = ["road", "state", "cell_x", "cell_y", "total", "unique_total", "updated_at"]
+    list_filter = ["state"]
+    list_select_related = ["road", "state"]
+    search_fields = ["road__name"]
+    readonly_fields = ["counts", "unique_counts"]
@@ -0,0 +1,271 @@
+"""
+Deer heatmap: deer detections binned by grid cell, road and local hour of the week.
+
+The above-threshold deer detections created since the last run are read through a
+server-side cursor in columnar chunks, binned with NumPy (the cell comes from the location of
+the camera, the hour of the week from ``local_captured_at``) and added to the
+``DeerHeatmapTile`` rows with one upsert per batch of tiles. ``HeatmapProgress`` records up to
+which creation time detections are counted, so every detection is counted once.
+
+Detections are only counted ``lag`` after their creation, which leaves the transactions
+writing them time to commit. Changing ``HEATMAP_CELL_DEGREES`` requires a ``rebuild``.
+"""
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from cameras.models import Camera, DetectedObject
+from .export import Epoch
+from .models import DeerHeatmapTile, HeatmapProgress
+
+HOURS_PER_WEEK = 168
+# 1970-01-01 was a Thursday: hours from the Monday before.
+EPOCH_HOUR_OF_WEEK = 3 * 24
+
+UPSERT_SQL = f"""
+INSERT INTO {DeerHeatmapTile._meta.db_table} AS tile
+    (state_id, road_id, cell_x, cell_y, counts, unique_counts, total, unique_total, updated_at)
+VALUES {{values}}
+ON CONFLICT (state_id, road_id, cell_x, cell_y) DO UPDATE SET
+    counts = ARRAY(
+        SELECT a + b FROM unnest(tile.counts, EXCLUDED.counts) WITH ORDINALITY AS t(a, b, i) ORDER BY i
+    ),
+    unique_counts = ARRAY(
+        SELECT a + b FROM unnest(tile.unique_counts, EXCLUDED.unique_counts) WITH ORDINALITY AS t(a, b, i) ORDER BY i
+    ),
+    total = tile.total + EXCLUDED.total,
+    unique_total = tile.unique_total + EXCLUDED.unique_total,
+    updated_at = EXCLUDED.updated_at
+"""
+
+
+def hour_of_week(local_epoch):
+    """
+    Returns the hour of the week, from Monday 00:00, of local wall-clock times in seconds.
+    """
+    return (np.floor_divide(local_epoch, 3600).astype(np.int64) + EPOCH_HOUR_OF_WEEK) % HOURS_PER_WEEK
+
+
+def camera_cells(cell_degrees):
+    """
+    Returns the grid cells of the cameras with a location.
+
+    :return: A ``(camera_ids, cell_x, cell_y)`` tuple of arrays sorted by camera id.
+    """
+    rows = np.array(
+        Camera.objects
+        .exclude(latitude=0, longitude=0)
+        .order_by("id")
+        .values_list("id", "latitude", "longitude"),
+        dtype=np.float64,
+    ).reshape(-1, 3)
+    return (
+        rows[:, 0].astype(np.int64),
+        np.floor(rows[:, 2] / cell_degrees).astype(np.int64),
+        np.floor(rows[:, 1] / cell_degrees).astype(np.int64),
+    )
+
+
+def cell_bounds(cell_x, cell_y, cell_degrees):
+    """
+    Returns the ``(west, south, east, north)`` bounds of a cell.
+    """
+    return cell_x * cell_degrees, cell_y * cell_degrees, (cell_x + 1) * cell_degrees, (cell_y + 1) * cell_degrees
+
+
+def deer_detections(start, end):
+    """
+    Returns the above-threshold deer detections created in ``[start, end)`` as value tuples
+    ``(camera_id, state_id, road_id, local_epoch, id, track_id)``.
+    """
+    queryset = DetectedObject.objects.above_confidence_level().filter(
+        name=DetectedObject.Name.DEER,
+        created_at__lt=end,
+        deleted_at__isnull=True,
+        photo__deleted_at__isnull=True,
+    )
+    if start is not None:
+        queryset = queryset.filter(created_at__gte=start)
+    return queryset.order_by().values_list(
+        "photo__camera_id",
+        "photo__state_id",
+        "photo__road_id",
+        Epoch("local_captured_at"),
+        "id",
+        # Untracked detections count as their own track.
+        Coalesce("track_id", F("id")),
+    )
+
+
+def iter_columns(queryset, chunk_size=100_000):
+    """
+    Reads the queryset returned by ``deer_detections`` and yields one dict of NumPy columns per chunk.
+    """
+    rows = []
+    for row in queryset.iterator(chunk_size=chunk_size):
+        rows.append(row)
+        if len(rows) == chunk_size:
+            yield _to_columns(rows)
+            rows = []
+    if rows:
+        yield _to_columns(rows)
+
+
+def _to_columns(rows):
+    camera_ids, state_ids, road_ids, local_epochs, ids, track_ids = zip(*rows)
+    ids = np.array(ids, dtype=np.int64)
+    return {
+        "camera_id": np.array(camera_ids, dtype=np.int64),
+        "state_id": np.array(state_ids, dtype=np.int64),
+        "road_id": np.array(road_ids, dtype=np.int64),
+        "local_epoch": np.array(local_epochs, dtype=np.float64),
+        # The track id is the id of the first detection of the track.
+        "first": np.array(track_ids, dtype=np.int64) == ids,
+    }
+
+
+def empty():
+    return (
+        np.empty((0, 4), dtype=np.int64),
+        np.empty((0, HOURS_PER_WEEK), dtype=np.int64),
+        np.empty((0, HOURS_PER_WEEK), dtype=np.int64),
+    )
+
+
+def group(*columns):
+    """
+    Groups rows by the values of several integer columns.
+
+    Each column is first replaced by its codes among its distinct values, which keeps the
+    combined codes small, and the combination is regrouped column by column; this is much
+    faster than ``np.unique(..., axis=0)``.
+
+    :return: An ``(inverse, first)`` pair: the group of every row, and one row of every group.
+    """
+    inverse = np.zeros(len(columns[0]), dtype=np.int64)
+    first = np.zeros(1, dtype=np.int64)
+    for column in columns:
+        values, codes = np.unique(column, return_inverse=True)
+        _, first, inverse = np.unique(inverse * len(values) + codes.reshape(-1), return_index=True, return_inverse=True)
+        inverse = inverse.reshape(-1)
+    return inverse, first
+
+
+def aggregate(columns, cells):
+    """
+    Bins a chunk of detections.
+
+    :param columns: A chunk yielded by ``iter_columns``.
+    :param cells: The result of ``camera_cells``; detections of other cameras are left out.
+    :return: A ``(keys, counts, unique_counts)`` tuple: one ``(state_id, road_id, cell_x, cell_y)``
+        row per tile, and its detections and track starts per hour of the week.
+    """
+    camera_ids, cell_x, cell_y = cells
+    if not len(camera_ids):
+        return empty()
+    index = np.minimum(np.searchsorted(camera_ids, columns["camera_id"]), len(camera_ids) - 1)
+    located = camera_ids[index] == columns["camera_id"]
+    if not located.any():
+        return empty()
+    index = index[located]
+    keys = np.stack(
+        [columns["state_id"][located], columns["road_id"][located], cell_x[index], cell_y[index]],
+        axis=1,
+    )
+    inverse, first = group(*keys.T)
+    bins = inverse * HOURS_PER_WEEK + hour_of_week(columns["local_epoch"][located])
+    size = len(first) * HOURS_PER_WEEK
+    counts = np.bincount(bins, minlength=size).reshape(-1, HOURS_PER_WEEK)
+    unique_counts = np.bincount(bins[columns["first"][located]], minlength=size).reshape(-1, HOURS_PER_WEEK)
+    return keys[first], counts, unique_counts
+
+
+def merge(parts):
+    """
+    Sums the results of ``aggregate`` over several chunks.
+    """
+    parts = list(parts)
+    if not parts:
+        return empty()
+    keys = np.concatenate([part[0] for part in parts])
+    counts = np.concatenate([part[1] for part in parts])
+    unique_counts = np.concatenate([part[2] for part in parts])
+    if len(parts) == 1 or not len(keys):
+        return keys, counts, unique_counts
+    inverse, first = group(*keys.T)
+    merged_counts = np.zeros((len(first), HOURS_PER_WEEK), dtype=np.int64)
+    merged_unique = np.zeros((len(first), HOURS_PER_WEEK), dtype=np.int64)
+    np.add.at(merged_counts, inverse, counts)
+    np.add.at(merged_unique, inverse, unique_counts)
+    return keys[first], merged_counts, merged_unique
+
+
+def upsert(keys, counts, unique_counts, batch_size=500):
+    """
+    Adds binned counts to the tiles, creating the missing ones.
+    """
+    now = timezone.now()
+    with connection.cursor() as cursor:
+        for offset in range(0, len(keys), batch_size):
+            rows = range(offset, min(offset + batch_size, len(keys)))
+            params = []
+            for row in rows:
+                params.extend([
+                    *keys[row].tolist(),
+                    counts[row].tolist(),
+                    unique_counts[row].tolist(),
+                    int(counts[row].sum()),
+                    int(unique_counts[row].sum()),
+                    now,
+                ])
+            values = ", ".join(["(%s, %s, %s, %s, %s, %s, %s, %s, %s)"] * len(rows))
+            cursor.execute(UPSERT_SQL.format(values=values), params)
+
+
+def refresh(lag=timedelta(minutes=10), chunk_size=100_000, cell_degrees=None):
+    """
+    Adds the deer detections created since the last refresh, up to ``lag`` ago, to the tiles.
+
+    Concurrent refreshes wait for each other on the ``HeatmapProgress`` row.
+
+    :return: A ``(detections, tiles)`` tuple of counts.
+    """
+    cell_degrees = cell_degrees or settings.HEATMAP_CELL_DEGREES
+    with transaction.atomic():
+        progress, _ = HeatmapProgress.objects.select_for_update().get_or_create(pk=1)
+        start, end = progress.processed_until, timezone.now() - lag
+        if start is not None and start >= end:
+            return 0, 0
+
+        cells = camera_cells(cell_degrees)
+        detections = 0
+        parts = []
+        for columns in iter_columns(deer_detections(start, end), chunk_size):
+            detections += len(columns["camera_id"])
+            parts.append(aggregate(columns, cells))
+            if len(parts) > 1:
+                # Keep a single partial result, whose size is bound by the number of tiles.
+                parts = [merge(parts)]
+        keys, counts, unique_counts = merge(parts)
+        upsert(keys, counts, unique_counts)
+
+        progress.processed_until = end
+        progress.save(update_fields=["processed_until"])
+    return detections, len(keys)
+
+
+def rebuild(lag=timedelta(minutes=10), chunk_size=100_000, cell_degrees=None):
+    """
+    Recomputes the tiles from every deer detection.
+    """
+    with transaction.atomic():
+        progress, _ = HeatmapProgress.objects.select_for_update().get_or_create(pk=1)
+        DeerHeatmapTile.objects.all().delete()
+        progress.processed_until = None
+        progress.save(update_fields=["processed_until"])
+        return refresh(lag, chunk_size, cell_degrees)
@@ -0,0 +1,68 @@
+import csv
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from analytics import export
+from core.routers import read_alias
+
+
+class _Counter:
+    """
+    A file object counting the bytes written to it.
+    """
+
+    def __init__(self):
+        self.size = 0
+
+    def write(self, data):
+        self.size += len(data)
+        return len(data)
+
+
+class Command(BaseCommand):
+    help = 'Compare the size and duration of the detection export formats with a CSV export of the same rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000, help='Detections exported (default: 1000000)')
+        parser.add_argument('--chunk-size', type=int, default=100_000, help='Rows per chunk (default: 100000)')
+
+    def handle(self, *args, **options):
+        queryset = export.get_detections().using(read_alias())[:options['rows']]
+        if not queryset.exists():
+            self.stdout.write('No detections to export.')
+            return
+
+        results = [('csv', *self.time_csv(queryset, options['chunk_size']))]
+        for fmt in export.FORMATS:
+            try:
+                chunks = export.iter_export(queryset, fmt=fmt, chunk_size=options['chunk_size'])
+            except ImportError as e:
+                self.stdout.write(self.style.WARNING(f'Skipping {fmt}: {e}'))
+                continue
+            results.append((fmt, *self.time_chunks(chunks)))
+
+        _, csv_size, csv_seconds = results[0]
+        self.stdout.write(f'{"format":<8} {"MiB":>10} {"seconds":>9} {"size vs csv":>12} {"speed vs csv":>13}')
+        for fmt, size, seconds in results:
+            self.stdout.write(self.style.SUCCESS(
+                f'{fmt:<8} {size / 2 ** 20:>10.1f} {seconds:>9.2f} {csv_size / size:>11.1f}x {csv_seconds / seconds:>12.1f}x'
+            ))
+
+    @staticmethod
+    def time_chunks(chunks):
+        started = time.perf_counter()
+        size = sum(len(data) for data in chunks)
+        return size, time.perf_counter() - started
+
+    @staticmethod
+    def time_csv(queryset, chunk_size):
+        output = _Counter()
+        started = time.perf_counter()
+        writer = csv.writer(output)
+        # In a transaction like the export, so that the cursor is not materialized first.
+        with transaction.atomic(using=queryset.db):
+            for row in queryset.iterator(chunk_size=chunk_size):
+                writer.writerow(row)
+        return output.size, time.perf_counter() - started
@@ -0,0 +1,84 @@
+import statistics
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from analytics import export
+from core.routers import REPLICA_DB_ALIAS, has_replica
+
+
+def export_forever(alias, stop, exported):
+    """
+    Runs full detection exports from the database ``alias`` until ``stop`` is set.
+    """
+    try:
+        while not stop.is_set():
+            for data in export.iter_export(export.get_detections().using(alias), fmt="npz"):
+                exported[0] += len(data)
+                if stop.is_set():
+                    break
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure the latency of small committed writes to the primary alone, while detection '
+        'exports read from the primary, and while they read from the replica'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writes', type=int, default=2000, help='Writes timed per phase (default: 2000)')
+        parser.add_argument('--readers', type=int, default=2, help='Concurrent exports (default: 2)')
+        parser.add_argument('--warmup', type=float, default=2, help='Seconds given to the exports to start (default: 2)')
+
+    def handle(self, *args, **options):
+        if not has_replica():
+            raise CommandError(f'No "{REPLICA_DB_ALIAS}" database: set DB_REPLICA_HOST')
+
+        with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+            # A temporary table: the writes leave nothing behind.
+            cursor.execute(
+                'CREATE TEMPORARY TABLE IF NOT EXISTS replica_benchmark (id bigserial PRIMARY KEY, payload text)'
+            )
+
+        phases = [('idle', None), ('exports on primary', DEFAULT_DB_ALIAS), ('exports on replica', REPLICA_DB_ALIAS)]
+        self.stdout.write(f'{"phase":<20} {"p50 ms":>9} {"p99 ms":>9} {"writes/s":>9} {"exported MiB":>13}')
+        for name, alias in phases:
+            stop = threading.Event()
+            exported = [0]
+            readers = []
+            if alias is not None:
+                readers = [
+                    threading.Thread(target=export_forever, args=(alias, stop, exported), daemon=True)
+                    for _ in range(options['readers'])
+                ]
+                for reader in readers:
+                    reader.start()
+                time.sleep(options['warmup'])
+            try:
+                latencies, elapsed = self.time_writes(options['writes'])
+            finally:
+                stop.set()
+                for reader in readers:
+                    reader.join()
+
+            latencies.sort()
+            p99 = latencies[min(int(0.99 * len(latencies)), len(latencies) - 1)]
+            self.stdout.write(self.style.SUCCESS(
+                f'{name:<20} {statistics.median(latencies) * 1000:>9.2f} {p99 * 1000:>9.2f} '
+                f'{len(latencies) / elapsed:>9.0f} {exported[0] / 2 ** 20:>13.1f}'
+            ))
+
+    def time_writes(self, count):
+        latencies = []
+        started = time.perf_counter()
+        with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+            for _ in range(count):
+                sent = time.perf_counter()
+                # Autocommit: every write waits for its commit to be flushed, like the ingestion.
+                cursor.execute('INSERT INTO replica_benchmark (payload) VALUES (%s)', ['x' * 200])
+                latencies.append(time.perf_counter() - sent)
+        return latencies, time.perf_counter() - started
@@ -0,0 +1,83 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from analytics import export
+from core.routers import read_alias
+from states.models import State
+
+
+class Command(BaseCommand):
+    help = 'Export detected objects as a zip of npz chunks or an Arrow IPC stream'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', type=str, help='Captured at or after this ISO datetime')
+        parser.add_argument('--end', type=str, help='Captured before this ISO datetime')
+        parser.add_argument('--name', action='append', dest='names', help='Object class, can be repeated')
+        parser.add_argument('--state', action='append', dest='states', help='State abbreviation, can be repeated')
+        parser.add_argument('--camera', action='append', dest='cameras', type=int, help='Camera id, can be repeated')
+        parser.add_argument('--min-conf', type=float, help='Minimum confidence')
+        parser.add_argument(
+            '--format',
+            choices=sorted(export.FORMATS),
+            default='npz',
+            help='Output format (default: npz)'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=100_000,
+            help='Rows per chunk (default: 100000)'
+        )
+        parser.add_argument('-o', '--output', type=str, help='Output file (default: stdout)')
+
+    def handle(self, *args, **options):
+        start = self.parse_datetime(options['start'])
+        end = self.parse_datetime(options['end'])
+
+        state_ids = None
+        if options['states']:
+            state_ids = list(
+                State.objects.filter(abbreviation__in=options['states']).values_list('id', flat=True)
+            )
+            if len(state_ids) != len(set(options['states'])):
+                raise CommandError(f'Unknown state in {options["states"]}')
+
+        queryset = export.get_detections(
+            start=start,
+            end=end,
+            names=options['names'],
+            state_ids=state_ids,
+            camera_ids=options['cameras'],
+            min_conf=options['min_conf'],
+        )
+        try:
+            chunks = export.iter_export(queryset.using(read_alias()), fmt=options['format'], chunk_size=options['chunk_size'])
+        except ImportError as e:
+            raise CommandError(str(e))
+
+        output = open(options['output'], 'wb') if options['output'] else sys.stdout.buffer
+        written = 0
+        try:
+            for data in chunks:
+                output.write(data)
+                written += len(data)
+        finally:
+            if options['output']:
+                output.close()
+
+        if options['output']:
+            self.stdout.write(self.style.SUCCESS(f'Wrote {written} bytes to {options["output"]}'))
+
+    @staticmethod
+    def parse_datetime(value):
+        if value is None:
+            return None
+        parsed = parse_datetime(value)
+        if parsed is None:
+            raise CommandError(f'Invalid datetime: {value}')
+        if timezone.is_naive(parsed):
+            parsed = timezone.make_aware(parsed)
+        return parsed
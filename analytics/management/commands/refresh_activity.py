@@ -0,0 +1,112 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from analytics.models import RoadActivity, StateActivity
+from cameras.managers import CONNECTED_PHOTO
+from cameras.models import DetectedObject, Photo
+
+COUNT_FIELDS = [f"{name}_count" for name in DetectedObject.Name.values]
+UNIQUE_COUNT_FIELDS = [f"unique_{name}_count" for name in DetectedObject.Name.values]
+
+
+def class_sums():
+    return {
+        f"{name}_count": Sum(f"{name}_count_above_system_confidence")
+        for name in DetectedObject.Name.values
+    }
+
+
+def unique_counts(since, group_by):
+    """
+    Counts the distinct tracks of each class above the confidence threshold.
+
+    :param group_by: The photo fields to group by, besides the date.
+    :return: A dict from the group key (ending with the date) to the counts.
+    """
+    rows = (
+        DetectedObject.objects.above_confidence_level()
+        .filter(
+            photo__captured_at__date__gte=since,
+            photo__deleted_at__isnull=True,
+            deleted_at__isnull=True,
+            track_id__isnull=False,
+        )
+        .values(*(f"photo__{field}" for field in group_by), date=TruncDate("photo__captured_at"))
+        .annotate(**{
+            f"unique_{name}_count": Count("track_id", filter=Q(name=name), distinct=True)
+            for name in DetectedObject.Name.values
+        })
+        .order_by()
+    )
+    return {
+        tuple(row.pop(f"photo__{field}") for field in group_by) + (row.pop("date"),): row
+        for row in rows
+    }
+
+
+class Command(BaseCommand):
+    help = 'Recompute the per-state and per-road daily activity used by the dashboard'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=2,
+            help='Number of most recent days to recompute (default: 2)'
+        )
+
+    def handle(self, *args, **options):
+        since = timezone.now().date() - timedelta(days=options['days'] - 1)
+        photos = (
+            Photo.objects
+            .filter(captured_at__date__gte=since, deleted_at__isnull=True)
+            .annotate(date=TruncDate("captured_at"))
+        )
+
+        state_rows = (
+            photos
+            .values("state_id", "date")
+            .annotate(
+                **class_sums(),
+                connected_count=Count("id", filter=CONNECTED_PHOTO),
+                disconnected_count=Count("id", filter=~CONNECTED_PHOTO),
+            )
+            .order_by()
+        )
+        state_uniques = unique_counts(since, ["state_id"])
+        state_activities = StateActivity.objects.bulk_create(
+            [
+                StateActivity(**row, **state_uniques.get((row["state_id"], row["date"]), {}))
+                for row in state_rows
+            ],
+            batch_size=1000,
+            update_conflicts=True,
+            unique_fields=["state", "date"],
+            update_fields=COUNT_FIELDS + UNIQUE_COUNT_FIELDS + ["connected_count", "disconnected_count", "updated_at"],
+        )
+
+        road_rows = (
+            photos
+            .values("state_id", "road_id", "date")
+            .annotate(**class_sums())
+            .order_by()
+        )
+        road_uniques = unique_counts(since, ["state_id", "road_id"])
+        road_activities = RoadActivity.objects.bulk_create(
+            [
+                RoadActivity(**row, **road_uniques.get((row["state_id"], row["road_id"], row["date"]), {}))
+                for row in road_rows
+            ],
+            batch_size=1000,
+            update_conflicts=True,
+            unique_fields=["state", "road", "date"],
+            update_fields=COUNT_FIELDS + UNIQUE_COUNT_FIELDS + ["updated_at"],
+        )
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Refreshed {len(state_activities)} state and {len(road_activities)} road activities since {since}'
+        ))
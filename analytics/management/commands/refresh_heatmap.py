@@ -0,0 +1,36 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from analytics import heatmap
+
+
+class Command(BaseCommand):
+    help = 'Add the deer detections created since the last run to the heatmap tiles'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rebuild',
+            action='store_true',
+            help='Recompute the tiles from every detection, e.g. after changing HEATMAP_CELL_DEGREES'
+        )
+        parser.add_argument(
+            '--lag-minutes',
+            type=int,
+            default=10,
+            help='Only count the detections created at least this long ago (default: 10)'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=100_000,
+            help='Detections read and binned at a time (default: 100000)'
+        )
+
+    def handle(self, *args, **options):
+        refresh = heatmap.rebuild if options['rebuild'] else heatmap.refresh
+        detections, tiles = refresh(
+            lag=timedelta(minutes=options['lag_minutes']),
+            chunk_size=options['chunk_size'],
+        )
+        self.stdout.write(self.style.SUCCESS(f'Counted {detections} deer detections into {tiles} heatmap tiles'))
@@ -0,0 +1,122 @@
+from django.contrib.postgres.fields import ArrayField
+from django.db import models
+
+
+class StateActivity(models.Model):
+    """
+    Precomputed daily activity of a state, built from its photos by ``refresh_activity``.
+    """
+
+    state = models.ForeignKey(
+        to="states.State",
+        on_delete=models.CASCADE,
+        related_name="activities",
+    )
+    date = models.DateField()
+    deer_count = models.PositiveIntegerField(default=0)
+    car_count = models.PositiveIntegerField(default=0)
+    truck_count = models.PositiveIntegerField(default=0)
+    person_count = models.PositiveIntegerField(default=0)
+    unique_deer_count = models.PositiveIntegerField(default=0)
+    unique_car_count = models.PositiveIntegerField(default=0)
+    unique_truck_count = models.PositiveIntegerField(default=0)
+    unique_person_count = models.PositiveIntegerField(default=0)
+    connected_count = models.PositiveIntegerField(default=0)
+    disconnected_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = "state activities"
+        constraints = [
+            models.UniqueConstraint(fields=["state", "date"], name="state_activity_unique_per_day"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.state_id} - {self.date}"
+
+
+class RoadActivity(models.Model):
+    """
+    Precomputed daily activity of a road inside a state, built from its photos by ``refresh_activity``.
+    """
+
+    state = models.ForeignKey(
+        to="states.State",
+        on_delete=models.CASCADE,
+        related_name="road_activities",
+    )
+    road = models.ForeignKey(
+        to="states.Road",
+        on_delete=models.CASCADE,
+        related_name="activities",
+    )
+    date = models.DateField()
+    deer_count = models.PositiveIntegerField(default=0)
+    car_count = models.PositiveIntegerField(default=0)
+    truck_count = models.PositiveIntegerField(default=0)
+    person_count = models.PositiveIntegerField(default=0)
+    unique_deer_count = models.PositiveIntegerField(default=0)
+    unique_car_count = models.PositiveIntegerField(default=0)
+    unique_truck_count = models.PositiveIntegerField(default=0)
+    unique_person_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = "road activities"
+        constraints = [
+            models.UniqueConstraint(fields=["state", "road", "date"], name="road_activity_unique_per_day"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.state_id} - {self.road_id} - {self.date}"
+
+
+class DeerHeatmapTile(models.Model):
+    """
+    Deer detections of a road inside a grid cell, per local hour of the week, built
+    incrementally by ``refresh_heatmap`` (see ``analytics.heatmap``).
+
+    The cell is ``(floor(longitude / HEATMAP_CELL_DEGREES), floor(latitude / HEATMAP_CELL_DEGREES))``
+    of the camera. ``counts`` are detections and ``unique_counts`` the tracks starting there,
+    168 each, from Monday 00:00 local time.
+    """
+
+    state = models.ForeignKey(
+        to="states.State",
+        on_delete=models.CASCADE,
+        related_name="heatmap_tiles",
+    )
+    road = models.ForeignKey(
+        to="states.Road",
+        on_delete=models.CASCADE,
+        related_name="heatmap_tiles",
+    )
+    cell_x = models.IntegerField()
+    cell_y = models.IntegerField()
+    counts = ArrayField(models.PositiveIntegerField(), size=168)
+    unique_counts = ArrayField(models.PositiveIntegerField(), size=168)
+    total = models.PositiveIntegerField(default=0)
+    unique_total = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["state", "road", "cell_x", "cell_y"], name="deer_heatmap_tile_unique"),
+        ]
+        indexes = [
+            models.Index(fields=["cell_x", "cell_y"], name="deer_heatmap_cell_idx"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.road_id} - ({self.cell_x}, {self.cell_y})"
+
+
+class HeatmapProgress(models.Model):
+    """
+    Single row recording up to which creation time the detections are counted in the heatmap tiles.
+    """
+
+    processed_until = models.DateTimeField(null=True, blank=True, default=None)
+
+    def __str__(self) -> str:
+        return str(self.processed_until)
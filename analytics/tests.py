@@ -0,0 +1,147 @@
+import io
+import os
+import zipfile
+from datetime import timedelta
+from unittest import skipIf
+
+import numpy as np
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+
+from cameras.models import DetectedObject
+from core.testing import AdminQueryBudgetMixin, QueryBudgetMixin, build_activity, build_network, make_user
+from . import export, heatmap
+from .models import DeerHeatmapTile, RoadActivity, StateActivity
+
+try:
+    import pyarrow.ipc
+except ImportError:
+    pyarrow = None
+
+
+def add_activity(states, cities_per_state, cameras_per_city, photos_per_camera):
+    cameras = build_network(
+        states=states, cities_per_state=cities_per_state, roads=2, cameras_per_city=cameras_per_city
+    )["cameras"]
+    return build_activity(cameras, photos_per_camera=photos_per_camera, detections_per_photo=3, interval=600)
+
+
+def refresh_activity():
+    with open(os.devnull, "w") as devnull:
+        call_command("refresh_activity", days=3, stdout=devnull)
+
+
+class AnalyticsAdminQueryBudgetTests(AdminQueryBudgetMixin, TestCase):
+    admin_models = [StateActivity, RoadActivity, DeerHeatmapTile]
+
+    def setUp(self):
+        self.add_data(states=1, cameras_per_city=2)
+
+    def grow(self):
+        self.add_data(states=4, cameras_per_city=4)
+
+    def add_data(self, states, cameras_per_city):
+        add_activity(states, cities_per_state=2, cameras_per_city=cameras_per_city, photos_per_camera=12)
+        refresh_activity()
+        heatmap.rebuild(lag=timedelta(0))
+
+
+class RefreshQueryBudgetTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        add_activity(states=1, cities_per_state=1, cameras_per_city=2, photos_per_camera=4)
+
+    def grow(self):
+        add_activity(states=5, cities_per_state=3, cameras_per_city=4, photos_per_camera=24)
+
+    def test_refresh_activity(self):
+        self.assertFixedQueries(refresh_activity, self.grow, budget=12)
+        self.assertEqual(StateActivity.objects.values("state").distinct().count(), 6)
+
+    def test_heatmap_rebuild(self):
+        self.assertFixedQueries(lambda: heatmap.rebuild(lag=timedelta(0)), self.grow, budget=12)
+        self.assertTrue(DeerHeatmapTile.objects.exists())
+
+
+class AnalyticsTimingTests(QueryBudgetMixin, TestCase):
+    def test_heatmap_aggregate_is_fast(self):
+        rows = 1_000_000
+        rng = np.random.default_rng(0)
+        camera_ids = np.arange(1, 5001, dtype=np.int64)
+        cells = (camera_ids, rng.integers(-900, -600, len(camera_ids)), rng.integers(250, 450, len(camera_ids)))
+        columns = {
+            "camera_id": rng.integers(1, 5001, rows),
+            "state_id": rng.integers(1, 50, rows),
+            "road_id": rng.integers(1, 2000, rows),
+            "local_epoch": rng.uniform(1.7e9, 1.8e9, rows),
+            "first": rng.random(rows) < 0.3,
+        }
+
+        keys, counts, unique_counts = self.assertFasterThan(5, lambda: heatmap.aggregate(columns, cells))
+        self.assertEqual(counts.sum(), rows)
+        self.assertEqual(unique_counts.sum(), columns["first"].sum())
+        self.assertEqual(len(keys), len(np.unique(keys, axis=0)))
+
+    def test_export_is_fast(self):
+        _, objects = add_activity(states=1, cities_per_state=1, cameras_per_city=5, photos_per_camera=800)
+
+        data = self.assertFasterThan(5, lambda: b"".join(export.iter_export(export.get_detections(), fmt="npz")))
+        self.assertGreater(len(data), 0)
+        self.assertEqual(len(objects), 5 * 600 * 3)
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        _, self.objects = add_activity(states=1, cities_per_state=1, cameras_per_city=2, photos_per_camera=40)
+
+    def read_npz(self):
+        data = b"".join(export.iter_export(export.get_detections(), chunk_size=100))
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            return [np.load(archive.open(name)) for name in archive.namelist()]
+
+    def test_npz_export(self):
+        parts = self.read_npz()
+        self.assertEqual(len(parts), 2)
+        names = np.concatenate([part["name"] for part in parts])
+        self.assertEqual(len(names), len(self.objects))
+        self.assertEqual(list(parts[0]["name_categories"][names[:3]]), ["deer", "car", "truck"])
+
+    def test_unknown_values_get_the_reserved_category(self):
+        DetectedObject.objects.filter(pk=self.objects[0].pk).update(name="elk", timezone="Mars/Olympus")
+        part = self.read_npz()[0]
+        self.assertEqual(part["name_categories"][part["name"][0]], export.UNKNOWN)
+        self.assertEqual(part["timezone_categories"][part["timezone"][0]], export.UNKNOWN)
+
+    def get_export(self, **params):
+        self.client.force_login(make_user(staff=True))
+        return self.client.get(reverse("analytics:detection-export"), params)
+
+    def test_export_view_npz(self):
+        response = self.get_export()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Disposition"], 'attachment; filename="detections.zip"')
+        with zipfile.ZipFile(io.BytesIO(b"".join(response.streaming_content))) as archive:
+            names = np.concatenate([np.load(archive.open(name))["name"] for name in archive.namelist()])
+        self.assertEqual(len(names), len(self.objects))
+
+    @skipIf(pyarrow is None, "pyarrow is not installed")
+    def test_export_view_arrow(self):
+        response = self.get_export(export_format="arrow", name="deer")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/vnd.apache.arrow.stream")
+        table = pyarrow.ipc.open_stream(b"".join(response.streaming_content)).read_all()
+        self.assertEqual(table.num_rows, sum(1 for obj in self.objects if obj.name == "deer"))
+
+    def test_export_view_rejects_unknown_formats(self):
+        response = self.get_export(export_format="csv")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("export_format", response.json())
+
+    def test_export_view_is_for_staff(self):
+        self.client.force_login(make_user())
+        self.assertEqual(self.client.get(reverse("analytics:detection-export")).status_code, 403)
+
+    def test_benchmark_export(self):
+        output = io.StringIO()
+        call_command("benchmark_export", rows=200, stdout=output)
+        self.assertRegex(output.getvalue(), r"\ncsv .*\nnpz ")
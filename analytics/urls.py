@@ -0,0 +1,11 @@
+from django.urls import path
+
+from . import views
+
+app_name = "analytics"
+
+urlpatterns = [
+    path("dashboard/", views.DashboardView.as_view(), name="dashboard"),
+    path("heatmap/", views.HeatmapView.as_view(), name="heatmap"),
+    path("detections/export/", views.DetectionExportView.as_view(), name="detection-export"),
+]
@@ -0,0 +1,218 @@
+import math
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F, Sum
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from cameras.models import DetectedObject
+from core.routers import read_alias, use_replica
+from . import export, heatmap
+from .models import DeerHeatmapTile, RoadActivity, StateActivity
+
+CLASS_NAMES = DetectedObject.Name.values
+
+
+class DashboardView(APIView):
+    """
+    Returns the recent activity of the states assigned to the user, default state first.
+
+    The figures are read from the precomputed ``StateActivity`` and ``RoadActivity`` tables,
+    so the number of queries does not depend on how many states the user has. ``counts`` are
+    detections, ``unique_counts`` the distinct tracked objects behind them.
+    """
+
+    permission_classes = [IsAuthenticated]
+    max_days = 90
+    top_roads = 5
+
+    @use_replica()
+    def get(self, request):
+        try:
+            days = min(max(int(request.query_params.get("days", 7)), 1), self.max_days)
+        except ValueError:
+            days = 7
+        since = timezone.now().date() - timedelta(days=days - 1)
+
+        states = request.user.get_assigned_states()
+        state_ids = [state_id for state_id, *_ in states]
+        class_sums = {name: Sum(f"{name}_count") for name in CLASS_NAMES}
+        class_sums.update({f"unique_{name}": Sum(f"unique_{name}_count") for name in CLASS_NAMES})
+
+        state_totals = {
+            row.pop("state_id"): row
+            for row in (
+                StateActivity.objects
+                .filter(state_id__in=state_ids, date__gte=since)
+                .values("state_id")
+                .annotate(
+                    **class_sums,
+                    connected=Sum("connected_count"),
+                    disconnected=Sum("disconnected_count"),
+                )
+                .order_by()
+            )
+        }
+
+        roads = {state_id: [] for state_id in state_ids}
+        road_rows = (
+            RoadActivity.objects
+            .filter(state_id__in=state_ids, date__gte=since)
+            .values("state_id", "road_id", road_name=F("road__name"))
+            .annotate(**class_sums)
+            .order_by("state_id", "-deer", "road_name")
+        )
+        for row in road_rows:
+            top = roads[row["state_id"]]
+            if len(top) < self.top_roads:
+                top.append({
+                    "id": row["road_id"],
+                    "name": row["road_name"],
+                    "counts": {name: row[name] for name in CLASS_NAMES},
+                    "unique_counts": {name: row[f"unique_{name}"] for name in CLASS_NAMES},
+                })
+
+        results = []
+        for state_id, name, slug, default in states:
+            totals = state_totals.get(state_id, {})
+            connected = totals.get("connected") or 0
+            disconnected = totals.get("disconnected") or 0
+            results.append({
+                "id": state_id,
+                "name": name,
+                "slug": slug,
+                "default": default,
+                "counts": {class_name: totals.get(class_name) or 0 for class_name in CLASS_NAMES},
+                "unique_counts": {
+                    class_name: totals.get(f"unique_{class_name}") or 0 for class_name in CLASS_NAMES
+                },
+                "connected": connected,
+                "disconnected": disconnected,
+                "connectivity_rate": connected / (connected + disconnected) if connected + disconnected else None,
+                "top_roads": roads[state_id],
+            })
+
+        return Response({
+            "since": since,
+            "default_state": next((state_id for state_id, *_, default in states if default), None),
+            "states": results,
+        })
+
+
+class DetectionExportView(APIView):
+    """
+    Streams the detected objects matching the query as an Arrow IPC stream or a zip of npz chunks.
+
+    Query parameters: ``start``, ``end`` (ISO datetimes), ``name``, ``state``, ``camera``
+    (repeatable), ``min_conf`` and ``export_format`` (``npz``, the default, or ``arrow``); DRF
+    reserves ``format`` to choose a renderer.
+    """
+
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        params = request.query_params
+        fmt = params.get("export_format", "npz")
+        if fmt not in export.FORMATS:
+            raise ValidationError({"export_format": f"Must be one of {sorted(export.FORMATS)}."})
+
+        try:
+            queryset = export.get_detections(
+                start=self.parse_datetime(params, "start"),
+                end=self.parse_datetime(params, "end"),
+                names=params.getlist("name"),
+                state_ids=[int(state_id) for state_id in params.getlist("state")],
+                camera_ids=[int(camera_id) for camera_id in params.getlist("camera")],
+                min_conf=float(params["min_conf"]) if "min_conf" in params else None,
+            )
+        except ValueError as e:
+            raise ValidationError(str(e))
+
+        try:
+            # Streamed after the view returns: the database is chosen now.
+            chunks = export.iter_export(queryset.using(read_alias()), fmt=fmt)
+        except ImportError as e:
+            raise ValidationError({"export_format": str(e)})
+
+        content_type, extension = export.FORMATS[fmt]
+        response = StreamingHttpResponse(chunks, content_type=content_type)
+        response["Content-Disposition"] = f'attachment; filename="detections.{extension}"'
+        return response
+
+    @staticmethod
+    def parse_datetime(params, key):
+        if key not in params:
+            return None
+        value = parse_datetime(params[key])
+        if value is None:
+            raise ValueError(f"Invalid {key} datetime.")
+        return timezone.make_aware(value) if timezone.is_naive(value) else value
+
+
+class HeatmapView(APIView):
+    """
+    Returns the deer heatmap tiles of the states the user can see, most active first.
+
+    Query parameters: ``bbox`` (``west,south,east,north`` in degrees), ``state`` and ``road``
+    (repeatable). The tiles are precomputed by ``refresh_heatmap``; ``counts`` and
+    ``unique_counts`` have one value per local hour of the week, from Monday 00:00.
+    """
+
+    permission_classes = [IsAuthenticated]
+    max_tiles = 5000
+    max_age = 300
+
+    @use_replica()
+    def get(self, request):
+        params = request.query_params
+        cell_degrees = settings.HEATMAP_CELL_DEGREES
+        tiles = DeerHeatmapTile.objects.select_related("road", "state")
+
+        try:
+            state_ids = [int(state_id) for state_id in params.getlist("state")]
+            road_ids = [int(road_id) for road_id in params.getlist("road")]
+            bbox = [float(value) for value in params["bbox"].split(",")] if "bbox" in params else None
+        except ValueError:
+            raise ValidationError("state and road must be ids, bbox four numbers.")
+
+        if not request.user.is_staff:
+            assigned = {state_id for state_id, *_ in request.user.get_assigned_states()}
+            state_ids = [state_id for state_id in state_ids if state_id in assigned] if state_ids else list(assigned)
+        if state_ids or not request.user.is_staff:
+            tiles = tiles.filter(state_id__in=state_ids)
+        if road_ids:
+            tiles = tiles.filter(road_id__in=road_ids)
+        if bbox is not None:
+            if len(bbox) != 4:
+                raise ValidationError({"bbox": "Must be west,south,east,north."})
+            west, south, east, north = bbox
+            tiles = tiles.filter(
+                cell_x__gte=math.floor(west / cell_degrees),
+                cell_x__lte=math.floor(east / cell_degrees),
+                cell_y__gte=math.floor(south / cell_degrees),
+                cell_y__lte=math.floor(north / cell_degrees),
+            )
+
+        results = []
+        for tile in tiles.order_by("-total", "id")[:self.max_tiles]:
+            results.append({
+                "state": {"id": tile.state_id, "name": tile.state.name},
+                "road": {"id": tile.road_id, "name": tile.road.name},
+                "cell": [tile.cell_x, tile.cell_y],
+                "bounds": heatmap.cell_bounds(tile.cell_x, tile.cell_y, cell_degrees),
+                "counts": tile.counts,
+                "unique_counts": tile.unique_counts,
+                "total": tile.total,
+                "unique_total": tile.unique_total,
+            })
+
+        response = Response({"cell_degrees": cell_degrees, "tiles": results})
+        patch_cache_control(response, private=True, max_age=self.max_age)
+        return response
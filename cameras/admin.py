@@ -1,90 +1,248 @@
 from django.contrib import admin
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.urls import reverse
+from django.utils.html import format_html
 from import_export.admin import ImportExportMixin
-from django.db.models import Count
 
-from . import models
+from core.admin import ReplicaChangeListMixin
+from . import models, search
+from .managers import CONNECTED_PHOTO
+from .reference import bump_version
+
+
+class ReferenceAdminMixin:
+    """
+    Invalidates the reference caches whenever the admin changes or imports rows.
+    """
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        bump_version()
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        bump_version()
+
+    def delete_queryset(self, request, queryset):
+        super().delete_queryset(request, queryset)
+        bump_version()
+
+    def process_result(self, result, request):
+        response = super().process_result(result, request)
+        bump_version()
+        return response
+
+class CameraSearchMixin:
+    """
+    Searches by camera name through the trigram index of the cameras, then filters by camera id.
+
+    ``camera_field`` is the camera foreign key of the model, or ``"id"`` for the cameras.
+    """
+
+    camera_field = "camera_id"
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip():
+            return queryset, False
+        return queryset.filter(**{f"{self.camera_field}__in": search.camera_ids(search_term)}), False
+
+
+def count_subquery(queryset, field, aggregate=Count("*")):
+    """
+    Returns the aggregate of the rows of ``queryset`` whose ``field`` is the outer row, 0 without rows.
+    """
+    return Coalesce(
+        Subquery(
+            queryset
+            .filter(**{field: OuterRef("pk")})
+            .order_by()
+            .values(field)
+            .annotate(count=aggregate)
+            .values("count")
+        ),
+        0,
+    )
+
+
+class ActivityCountsMixin:
+    """
+    Annotates the changelist rows with their detection and photo counts.
+
+    Each count is a correlated subquery of the single changelist query, so a page costs the
+    same number of queries whatever its size. ``activity_field`` is the path from ``Photo`` to
+    the model through its camera, e.g. ``camera__city__state``, so the photos count where their
+    camera is now; ``activity_counts`` are the annotations used.
+    """
+
+    activity_field = "camera"
+    activity_counts = []
+
+    def activity_annotations(self):
+        field = self.activity_field
+        objects = models.DetectedObject.objects.all()
+        photos = models.Photo.objects.all()
+        annotations = {
+            f"{name}_count": count_subquery(objects.filter(name=name), f"photo__{field}")
+            for name in models.DetectedObject.Name.values
+        }
+        annotations["unique_deer_count"] = count_subquery(
+            objects.filter(name="deer"), f"photo__{field}", Count("track_id", distinct=True)
+        )
+        annotations["connected_count"] = count_subquery(photos.filter(CONNECTED_PHOTO), field)
+        annotations["disconnected_count"] = count_subquery(photos.exclude(CONNECTED_PHOTO), field)
+        annotations["photo_count"] = count_subquery(photos, field)
+        return annotations
+
+    def get_queryset(self, request):
+        annotations = self.activity_annotations()
+        return super().get_queryset(request).annotate(**{name: annotations[name] for name in self.activity_counts})
+
+    @admin.display(ordering="deer_count")
+    def total_deer(self, obj):
+        return obj.deer_count
+
+    @admin.display(ordering="unique_deer_count")
+    def unique_deer(self, obj):
+        return obj.unique_deer_count
+
+    @admin.display(ordering="car_count")
+    def total_cars(self, obj):
+        return obj.car_count
+
+    @admin.display(ordering="truck_count")
+    def total_trucks(self, obj):
+        return obj.truck_count
+
+    @admin.display(ordering="person_count")
+    def total_people(self, obj):
+        return obj.person_count
+
+    @admin.display(ordering="connected_count")
+    def total_connected(self, obj):
+        return obj.connected_count
+
+    @admin.display(ordering="disconnected_count")
+    def total_disconnected(self, obj):
+        return obj.disconnected_count
+
+    @admin.display(ordering="photo_count")
+    def total_photo(self, obj):
+        return obj.photo_count
+
+
+def thumbnail_tag(kind, obj):
+    if not (obj.file if kind == "photo" else obj.image):
+        return ""
+    url = reverse("cameras:thumbnail", kwargs={"kind": kind, "pk": obj.pk, "size": "small", "ext": "webp"})
+    return format_html('<img src="{}" loading="lazy" alt="">', url)
 
 
 class PhotoTabularInline(admin.TabularInline):
     model = models.Photo
-    fields = ("file", "created_at")
+    fields = ("thumbnail", "file", "created_at")
     readonly_fields = fields
     can_delete = False
     max_num = 3
     extra = 0
 
+    @admin.display
+    def thumbnail(self, obj):
+        return thumbnail_tag("photo", obj)
+
 
 @admin.register(models.Camera)
-class CameraAdmin(ImportExportMixin, admin.ModelAdmin):
+class CameraAdmin(
+    ReferenceAdminMixin, ReplicaChangeListMixin, CameraSearchMixin, ActivityCountsMixin, ImportExportMixin, admin.ModelAdmin
+):
     list_display = [
         "name",
         "road",
         "total_deer",
+        "unique_deer",
         "total_cars",
         "total_trucks",
         "total_people",
-        "total_connected",
-        "total_disconnected",
+        "uptime_24h",
+        "outage_since",
         "total_photo",
     ]
+    list_select_related = ["road", "connectivity"]
+    activity_counts = ["deer_count", "unique_deer_count", "car_count", "truck_count", "person_count", "photo_count"]
     search_fields = ["name"]
-    list_filter = ["city__state"]
+    camera_field = "id"
+    list_filter = ["city__state", "is_frozen"]
     inlines = [PhotoTabularInline]
     prepopulated_fields = {"slug": ("name",)}
 
-    @admin.display
-    def total_deer(self, obj):
-        return models.DetectedObject.objects.filter(name="deer", photo__camera=obj).count()
+    @admin.display(description="Uptime (24h)", ordering="connectivity__uptime_24h")
+    def uptime_24h(self, obj):
+        connectivity = getattr(obj, "connectivity", None)
+        return f"{connectivity.uptime_24h:.1%}" if connectivity is not None else None
 
-    @admin.display
-    def total_cars(self, obj):
-        return models.DetectedObject.objects.filter(name="car", photo__camera=obj).count()
+    @admin.display(ordering="connectivity__changed_at")
+    def outage_since(self, obj):
+        connectivity = getattr(obj, "connectivity", None)
+        return connectivity.outage_started_at if connectivity is not None else None
 
-    @admin.display
-    def total_trucks(self, obj):
-        return models.DetectedObject.objects.filter(name="truck", photo__camera=obj).count()
 
-    @admin.display
-    def total_people(self, obj):
-        return models.DetectedObject.objects.filter(name="person", photo__camera=obj).count()
+@admin.register(models.CameraConnectivity)
+class CameraConnectivityAdmin(ReplicaChangeListMixin, CameraSearchMixin, admin.ModelAdmin):
+    list_display = ["camera", "connected", "observed_at", "changed_at", "uptime_1h", "uptime_24h", "uptime_7d", "mtbf"]
+    list_filter = ["connected", "camera__city__state"]
+    list_select_related = ["camera"]
+    search_fields = ["camera__name"]
 
-    @admin.display
-    def total_connected(self, obj):
-        return models.Photo.objects.filter(camera=obj).exclude(file="").aggregate(Count("id"))["id__count"]
+    @admin.display(description="MTBF")
+    def mtbf(self, obj):
+        return obj.mtbf
 
-    @admin.display
-    def total_disconnected(self, obj):
-        return models.Photo.objects.filter(camera=obj).filter(file="").aggregate(Count("id"))["id__count"]
 
-    @admin.display
-    def total_photo(self, obj):
-        return models.Photo.objects.filter(camera=obj).aggregate(Count("id"))["id__count"]
+@admin.register(models.OutageEvent)
+class OutageEventAdmin(ReplicaChangeListMixin, admin.ModelAdmin):
+    list_display = ["scope", "camera", "city", "cameras_down", "started_at", "ended_at"]
+    list_filter = ["scope", "city__state"]
+    list_select_related = ["camera", "city"]
+    search_fields = ["camera__name", "city__name"]
+    date_hierarchy = "started_at"
 
 
 @admin.register(models.Video)
-class VideoAdmin(ImportExportMixin, admin.ModelAdmin):
+class VideoAdmin(ReplicaChangeListMixin, CameraSearchMixin, ImportExportMixin, admin.ModelAdmin):
     list_display = ["file", "camera"]
     search_fields = ["camera__name"]
     list_filter = ["camera__city__state"]
 
 
 @admin.register(models.Photo)
-class PhotoAdmin(ImportExportMixin, admin.ModelAdmin):
+class PhotoAdmin(ReplicaChangeListMixin, CameraSearchMixin, ImportExportMixin, admin.ModelAdmin):
     list_display = [
+        "thumbnail",
         "file",
         "camera",
         "is_connected",
         "created_at",
     ]
     search_fields = ["camera__name"]
-    list_filter = ["camera__city__state"]
+    # The unfiltered total would count the whole table on every search.
+    show_full_result_count = False
+    list_filter = ["camera__city__state", "is_stale"]
 
     @admin.display(boolean=True)
     def is_connected(self, obj):
         return obj.is_connected
 
+    @admin.display
+    def thumbnail(self, obj):
+        return thumbnail_tag("photo", obj)
+
 
 @admin.register(models.DetectedObject)
-class DetectedObjectAdmin(ImportExportMixin, admin.ModelAdmin):
-    list_display = ["name", "conf", "width", "height"]
+class DetectedObjectAdmin(ReplicaChangeListMixin, ImportExportMixin, admin.ModelAdmin):
+    list_display = ["thumbnail", "name", "conf", "width", "height"]
     list_filter = ["name", "photo__created_at"]
+    raw_id_fields = ["photo"]
+
+    @admin.display
+    def thumbnail(self, obj):
+        return thumbnail_tag("object", obj)
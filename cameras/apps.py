@@ -1,6 +1,12 @@
 from django.apps import AppConfig
+from django.db.models.signals import pre_migrate
 
 
 class CamerasConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'cameras'
+
+    def ready(self):
+        from .search import create_trigram_extension
+
+        pre_migrate.connect(create_trigram_extension, sender=self)
@@ -0,0 +1,402 @@
+"""
+Frame capture pipeline producing ``Photo`` rows.
+
+A cycle runs in three stages:
+
+1. Fetch (asyncio): one frame per camera is downloaded over a long-lived ``aiohttp``
+   session, from ``Camera.preview_url`` when the camera has one, otherwise from the newest
+   segment of its HLS playlist.
+2. Encode and store (thread pool): HLS segments and non-JPEG previews are encoded to JPEG
+   and every frame is written to the storage through ``Photo.file``.
+3. Insert: the photos of the cycle are inserted with ``bulk_create``. A camera that could
+   not be reached gets a photo with an empty ``file``. When the insert fails, the files
+   stored for the cycle are deleted and the cycle is skipped.
+
+The reference fields of the photos (state, city, road, timezone) are resolved with the
+cameras, outside the event loop, as the reference cache may query the database.
+
+The derivatives of the frames of the ``pregenerate`` cameras are rendered from the bytes
+in memory right after the frame is stored, so their thumbnails are ready when requested.
+
+With a ``FrameDeduplicator``, a frame that is a near-duplicate of a recent frame of the
+same camera is not stored: its photo is marked ``is_stale`` and skips the inference.
+"""
+import asyncio
+import io
+import logging
+import shutil
+import subprocess
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from urllib.parse import urljoin, urlsplit
+
+import aiohttp
+from asgiref.sync import sync_to_async
+from django.core.files.base import ContentFile
+from django.db import DatabaseError
+from django.utils import timezone
+from PIL import Image
+
+from core import metrics
+from . import thumbnails
+from .models import Camera, Photo
+from .reference import references
+from .scheduling import CLASS_WEIGHTS
+
+logger = logging.getLogger(__name__)
+
+FRAME_LATENCY = metrics.histogram("capture_frame_latency_seconds", "Time to fetch, encode and store one frame.")
+FRAMES = metrics.counter("capture_frames_total", "Frames captured.")
+FRAME_FAILURES = metrics.counter("capture_frame_failures_total", "Cameras that could not be captured.")
+CYCLE_DURATION = metrics.gauge("capture_cycle_duration_seconds", "Duration of the last capture cycle.")
+CYCLE_FAILURES = metrics.counter("capture_cycle_failures_total", "Capture cycles whose photos could not be inserted.")
+CYCLE_LAG = metrics.gauge("capture_cycle_lag_seconds", "Delay between the scheduled and actual start of the last cycle.")
+
+JPEG_MAGIC = b"\xff\xd8\xff"
+
+
+class CaptureError(Exception):
+    """Raised when a frame cannot be fetched or decoded."""
+
+
+@dataclass
+class Frame:
+    camera: Camera
+    captured_at: object
+    photo: Photo = None
+    error: str = ""
+    stale: bool = False
+
+
+def encode_image(data, quality=85):
+    """
+    Re-encodes an image of any format Pillow can read to JPEG.
+
+    :param data: The raw image bytes.
+    :param quality: The JPEG quality.
+    :return: The JPEG bytes.
+    """
+    with Image.open(io.BytesIO(data)) as image:
+        output = io.BytesIO()
+        image.convert("RGB").save(output, format="JPEG", quality=quality)
+    return output.getvalue()
+
+
+def extract_frame(segment, timeout=10):
+    """
+    Decodes the first frame of an MPEG-TS segment to JPEG with ``ffmpeg``.
+
+    :param segment: The raw segment bytes.
+    :param timeout: Timeout of the ffmpeg process in seconds.
+    :return: The JPEG bytes.
+    """
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is None:
+        raise CaptureError("ffmpeg is required to capture cameras without a preview URL")
+    result = subprocess.run(
+        [ffmpeg, "-loglevel", "error", "-i", "pipe:0", "-frames:v", "1", "-q:v", "3", "-f", "mjpeg", "pipe:1"],
+        input=segment,
+        capture_output=True,
+        timeout=timeout,
+    )
+    if result.returncode or not result.stdout:
+        raise CaptureError(f"ffmpeg failed: {result.stderr.decode(errors='replace')[-200:]}")
+    return result.stdout
+
+
+def newest_segment_url(playlist_url, playlist):
+    """
+    Returns the URL of the newest media segment, or of the first variant for a master playlist.
+    """
+    lines = [line.strip() for line in playlist.splitlines()]
+    if not lines or lines[0] != "#EXTM3U":
+        raise CaptureError("not a playlist")
+    uris = [line for line in lines if line and not line.startswith("#")]
+    if not uris:
+        raise CaptureError("empty playlist")
+    if any(line.startswith("#EXT-X-STREAM-INF") for line in lines):
+        return urljoin(playlist_url, uris[0]), True
+    return urljoin(playlist_url, uris[-1]), False
+
+
+class FrameCapturer:
+    """
+    Captures one frame per camera per cycle.
+
+    :param concurrency: Maximum number of requests in flight.
+    :param per_host: Maximum number of requests in flight to a single host.
+    :param timeout: Timeout of a single request in seconds.
+    :param workers: Number of threads encoding and storing frames.
+    :param dedup: An optional ``FrameDeduplicator`` recognizing the frames of frozen cameras.
+    :param pregenerate: Ids of the cameras whose thumbnails are generated at capture time.
+    """
+
+    def __init__(self, concurrency=500, per_host=8, timeout=10.0, workers=16, dedup=None, pregenerate=()):
+        self.concurrency = concurrency
+        self.per_host = per_host
+        self.timeout = timeout
+        self.dedup = dedup
+        self.pregenerate = frozenset(pregenerate)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="capture")
+        self.session = None
+        self.global_limit = None
+        self.host_limits = None
+
+    async def __aenter__(self):
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=self.concurrency,
+                limit_per_host=self.per_host,
+                ttl_dns_cache=300,
+            ),
+        )
+        self.global_limit = asyncio.Semaphore(self.concurrency)
+        self.host_limits = defaultdict(lambda: asyncio.Semaphore(self.per_host))
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.session.close()
+        self.executor.shutdown(wait=True)
+
+    async def get(self, url):
+        async with self.host_limits[urlsplit(url).netloc], self.global_limit:
+            async with asyncio.timeout(self.timeout):
+                async with self.session.get(url) as response:
+                    if response.status != 200:
+                        raise CaptureError(f"HTTP {response.status}")
+                    return await response.read()
+
+    async def fetch(self, camera):
+        """
+        Downloads the raw frame of a camera.
+
+        :return: A ``(data, is_segment)`` pair.
+        """
+        if camera.preview_url:
+            return await self.get(camera.preview_url), False
+
+        url = camera.url
+        for _ in range(2):
+            playlist = (await self.get(url)).decode("utf-8", errors="replace")
+            url, is_master = newest_segment_url(url, playlist)
+            if not is_master:
+                return await self.get(url), True
+        raise CaptureError("nested master playlists")
+
+    def store(self, frame, data, is_segment):
+        if is_segment:
+            data = extract_frame(data)
+        elif not data.startswith(JPEG_MAGIC):
+            data = encode_image(data)
+        if self.dedup is not None and self.dedup.check(frame.camera.id, data):
+            frame.stale = True
+            return
+        frame.photo.file.save("frame.jpg", ContentFile(data), save=False)
+        if frame.camera.id in self.pregenerate:
+            try:
+                thumbnails.generate(frame.photo.file.name, data)
+            except OSError:
+                # The frame is stored; its thumbnails will be generated on request.
+                pass
+
+    def discard(self, frame):
+        """
+        Deletes the file stored for a frame, and its derivatives, e.g. when its photo could not
+        be inserted.
+        """
+        name = frame.photo.file.name
+        if not name:
+            return
+        storage = frame.photo.file.storage
+        names = [name]
+        if frame.camera.id in self.pregenerate:
+            names += [
+                thumbnails.derivative_name(name, size, ext) for size in thumbnails.sizes() for ext in ("jpg", "webp")
+            ]
+        for stored in names:
+            try:
+                storage.delete(stored)
+            except OSError:
+                pass
+
+    async def capture(self, frame):
+        started = time.monotonic()
+        loop = asyncio.get_running_loop()
+        try:
+            data, is_segment = await self.fetch(frame.camera)
+            await loop.run_in_executor(self.executor, self.store, frame, data, is_segment)
+        except (aiohttp.ClientError, TimeoutError, CaptureError, OSError, subprocess.SubprocessError) as e:
+            frame.error = str(e) or type(e).__name__
+            FRAME_FAILURES.inc()
+        else:
+            FRAMES.inc()
+        FRAME_LATENCY.observe(time.monotonic() - started)
+        return frame
+
+    async def run(self, cameras):
+        """
+        Captures a frame of every camera.
+
+        :param cameras: ``(camera, photo_fields)`` pairs, the latter from
+            ``references.photo_fields``, which must not be called from the event loop.
+        :return: A list of ``Frame`` whose photos are ready to be inserted.
+        """
+        now = timezone.now()
+        frames = [
+            Frame(camera=camera, captured_at=now, photo=Photo(camera=camera, captured_at=now, **photo_fields))
+            for camera, photo_fields in cameras
+        ]
+        return await asyncio.gather(*(self.capture(frame) for frame in frames))
+
+
+class CaptureScheduler:
+    """
+    Runs capture cycles at a fixed cadence and inserts the resulting photos.
+
+    :param capturer: A ``FrameCapturer``.
+    :param queryset: The cameras to capture.
+    :param interval: Seconds between the scheduled starts of two cycles.
+    :param batch_size: Number of photos per insert.
+    :param polling: An optional ``PollingScheduler``; when given, a cycle only captures the
+        cameras it reports as due instead of every camera.
+    :param connectivity: An optional ``ConnectivityTracker`` fed with every photo.
+    """
+
+    def __init__(self, capturer, queryset, interval=60.0, batch_size=1000, polling=None, connectivity=None):
+        self.capturer = capturer
+        self.queryset = queryset
+        self.interval = interval
+        self.batch_size = batch_size
+        self.polling = polling
+        self.connectivity = connectivity
+        # camera id -> (connected, since)
+        self.connection_states = {}
+        # camera id -> the latest photo through inference already fed to ``polling``
+        self.observed_photos = {}
+        # camera id -> the detection counts of its newer photo through inference
+        self.detections = {}
+
+    def load_cameras(self):
+        """
+        Returns the cameras of the cycle as ``(camera, photo_fields)`` pairs.
+        """
+        queryset = self.queryset
+        if self.polling is not None:
+            self.polling.rebalance()
+            queryset = queryset.filter(id__in=self.polling.pop_due())
+        cameras = list(queryset.only("id", "url", "preview_url", "last_connection_status", "is_frozen"))
+        if self.polling is not None:
+            self.detections = self.load_detections([camera.id for camera in cameras])
+        # The state, city, road and timezone of the photos come from the reference cache.
+        return [(camera, references.photo_fields(camera.id)) for camera in cameras]
+
+    def load_detections(self, camera_ids):
+        """
+        Returns the detection counts by class name of the latest photo through inference of
+        each camera, for the cameras whose latest one was not fed to ``polling`` yet.
+        """
+        fields = [f"{name}_count_above_system_confidence" for name in CLASS_WEIGHTS]
+        rows = (
+            Photo.objects
+            .filter(camera_id__in=camera_ids, detected_at__isnull=False, deleted_at__isnull=True)
+            .order_by("camera_id", "-captured_at")
+            .distinct("camera_id")
+            .values_list("camera_id", "id", *fields)
+        )
+        detections = {}
+        for camera_id, photo_id, *counts in rows:
+            if self.observed_photos.get(camera_id) != photo_id:
+                self.observed_photos[camera_id] = photo_id
+                detections[camera_id] = dict(zip(CLASS_WEIGHTS, counts))
+        return detections
+
+    def save(self, frames):
+        """
+        Inserts the photos of a cycle and updates the connection status of the cameras.
+
+        The connection states, ``polling`` and ``connectivity`` only take the cycle into
+        account once its photos are inserted, so a failed insert leaves them as they were.
+        """
+        dedup = self.capturer.dedup
+        connection_states = {}
+        changed = []
+        for frame in frames:
+            connected = not frame.error
+            previous = self.connection_states.get(frame.camera.id)
+            if previous is None or previous[0] != connected:
+                connection_states[frame.camera.id] = (connected, frame.captured_at)
+            frame.photo.connection_start_date = connection_states.get(frame.camera.id, previous)[1]
+            if frame.stale:
+                frame.photo.is_stale = True
+                # Nothing new to detect in a frozen frame.
+                frame.photo.detected_at = frame.captured_at
+            frozen = dedup.is_frozen(frame.camera.id) if dedup is not None and connected else frame.camera.is_frozen
+            if frame.camera.last_connection_status != connected or frame.camera.is_frozen != frozen:
+                frame.camera.last_connection_status = connected
+                frame.camera.is_frozen = frozen
+                changed.append(frame.camera)
+
+        try:
+            # Atomic, whatever the number of batches.
+            Photo.objects.bulk_create([frame.photo for frame in frames], batch_size=self.batch_size)
+        except DatabaseError:
+            # No row will ever point to the files of the cycle.
+            for frame in frames:
+                self.capturer.discard(frame)
+            # The detections not fed to ``polling`` are loaded again by the next cycle.
+            for camera_id in self.detections:
+                self.observed_photos.pop(camera_id, None)
+            self.detections = {}
+            raise
+
+        self.connection_states.update(connection_states)
+        for frame in frames:
+            connected = not frame.error
+            if self.polling is not None:
+                detections = self.detections.pop(frame.camera.id, None)
+                self.polling.observe(frame.camera.id, connected, detections=detections, now=frame.captured_at)
+            if self.connectivity is not None:
+                self.connectivity.observe(frame.camera.id, connected, frame.captured_at)
+        Camera.objects.bulk_update(changed, ["last_connection_status", "is_frozen"], batch_size=self.batch_size)
+        if self.connectivity is not None:
+            self.connectivity.save()
+
+    async def run_cycle(self):
+        cameras = await sync_to_async(self.load_cameras)()
+        frames = await self.capturer.run(cameras)
+        await sync_to_async(self.save)(frames)
+        return frames
+
+    async def serve(self, cycles=None, on_cycle=None):
+        """
+        Runs capture cycles until ``cycles`` have completed, forever when None.
+
+        :param on_cycle: Called after every cycle with the frames, the lag and the duration.
+        """
+        scheduled = time.monotonic()
+        completed = 0
+        async with self.capturer:
+            while cycles is None or completed < cycles:
+                started = time.monotonic()
+                lag = max(started - scheduled, 0.0)
+                try:
+                    frames = await self.run_cycle()
+                except DatabaseError:
+                    # A cycle lost to the database, e.g. a failover: the next one runs as planned.
+                    logger.exception("Capture cycle failed")
+                    CYCLE_FAILURES.inc()
+                    frames = []
+                duration = time.monotonic() - started
+                CYCLE_LAG.set(lag)
+                CYCLE_DURATION.set(duration)
+                completed += 1
+                if on_cycle is not None:
+                    on_cycle(frames, lag, duration)
+
+                scheduled += self.interval
+                if scheduled < time.monotonic():
+                    # Skip the cycles we missed instead of running them back to back.
+                    scheduled += (time.monotonic() - scheduled) // self.interval * self.interval
+                await asyncio.sleep(max(scheduled - time.monotonic(), 0))
@@ -0,0 +1,201 @@
+"""
+Streaming connectivity statistics and outage detection.
+
+Every new photo of a camera updates its ``CameraConnectivity`` row in constant time, without
+reading any history:
+
+* the uptimes are exponentially time-decayed averages of the connection status. Between two
+  photos the camera is assumed to keep the status of the first one, so with ``dt`` seconds
+  elapsed an uptime with time constant ``tau`` becomes ``u * f + status * (1 - f)`` with
+  ``f = exp(-dt / tau)``, whatever the polling interval;
+* ``up_seconds`` and ``failures`` are decayed the same way over 7 days, and their ratio is the
+  mean time between failures.
+
+A camera going down opens an ``OutageEvent``, closed when it is reachable again. The tracker
+also counts the cameras down per city and opens a city outage when at least ``city_share`` of
+the cameras of a city are down.
+"""
+import logging
+import math
+
+from core import metrics
+from .models import CameraConnectivity, OutageEvent
+from .reference import references
+
+logger = logging.getLogger(__name__)
+
+OUTAGES = metrics.counter("connectivity_outages_total", "Camera and city outages started.")
+CAMERAS_DOWN = metrics.gauge("connectivity_cameras_down", "Cameras disconnected at their last photo.")
+
+# Uptime field -> time constant in seconds.
+UPTIME_WINDOWS = {
+    "uptime_1h": 3600.0,
+    "uptime_24h": 24 * 3600.0,
+    "uptime_7d": 7 * 24 * 3600.0,
+}
+MTBF_WINDOW = 7 * 24 * 3600.0
+
+UPDATE_FIELDS = ["connected", "observed_at", "changed_at", *UPTIME_WINDOWS, "up_seconds", "failures"]
+
+
+def advance(stats, seconds):
+    """
+    Decays the statistics of a camera by ``seconds`` spent in its current status.
+    """
+    if seconds <= 0:
+        return
+    status = 1.0 if stats.connected else 0.0
+    for field, tau in UPTIME_WINDOWS.items():
+        factor = math.exp(-seconds / tau)
+        setattr(stats, field, getattr(stats, field) * factor + status * (1.0 - factor))
+    factor = math.exp(-seconds / MTBF_WINDOW)
+    stats.up_seconds = stats.up_seconds * factor + status * MTBF_WINDOW * (1.0 - factor)
+    stats.failures *= factor
+
+
+def current(stats, now):
+    """
+    Returns the uptimes of a camera as of ``now``, assuming it kept its last status since.
+
+    :return: A dict with the uptime fields, ``mtbf`` and ``outage_started_at``.
+    """
+    snapshot = CameraConnectivity(**{field: getattr(stats, field) for field in ["camera_id", *UPDATE_FIELDS]})
+    advance(snapshot, (now - stats.observed_at).total_seconds())
+    return {
+        **{field: getattr(snapshot, field) for field in UPTIME_WINDOWS},
+        "mtbf": snapshot.mtbf,
+        "outage_started_at": snapshot.outage_started_at,
+    }
+
+
+class ConnectivityTracker:
+    """
+    Keeps the connectivity statistics of the cameras in memory and persists the changed ones.
+
+    :param city_share: Share of the cameras of a city down at which the city is in outage.
+    :param city_min_cameras: Cities with fewer tracked cameras never get city outages.
+    :param events: Whether to record ``OutageEvent`` rows, e.g. not when replaying history.
+    """
+
+    def __init__(self, city_share=0.8, city_min_cameras=2, events=True):
+        self.city_share = city_share
+        self.city_min_cameras = city_min_cameras
+        self.events = events
+        self.stats = {}
+        # city id -> [tracked cameras, cameras down]
+        self.cities = {}
+        # ("camera", camera id) or ("city", city id) -> open OutageEvent
+        self.open = {}
+        self.dirty = set()
+        self.started = []
+        self.ended = []
+
+    def load(self):
+        """
+        Loads the persisted statistics and the open outages.
+
+        :return: The tracker.
+        """
+        for stats in CameraConnectivity.objects.all():
+            self._track(stats)
+        for event in OutageEvent.objects.filter(ended_at__isnull=True):
+            subject = event.camera_id if event.scope == OutageEvent.Scope.CAMERA else event.city_id
+            self.open[(event.scope, subject)] = event
+        CAMERAS_DOWN.set(sum(down for _, down in self.cities.values()))
+        return self
+
+    def _track(self, stats):
+        self.stats[stats.camera_id] = stats
+        counts = self.cities.setdefault(references.get(stats.camera_id).city_id, [0, 0])
+        counts[0] += 1
+        counts[1] += not stats.connected
+
+    def observe(self, camera_id, connected, at):
+        """
+        Folds a new photo of a camera into its statistics.
+
+        :param connected: Whether the photo has a file or is a stale duplicate.
+        :param at: When the photo was captured; photos older than the last one are ignored.
+        """
+        stats = self.stats.get(camera_id)
+        city_id = references.get(camera_id).city_id
+        if stats is None:
+            status = 1.0 if connected else 0.0
+            stats = CameraConnectivity(
+                camera_id=camera_id,
+                connected=connected,
+                observed_at=at,
+                changed_at=at,
+                **{field: status for field in UPTIME_WINDOWS},
+            )
+            self._track(stats)
+            if not connected:
+                self._start(OutageEvent.Scope.CAMERA, camera_id, city_id, at)
+        elif at < stats.observed_at:
+            return
+        else:
+            advance(stats, (at - stats.observed_at).total_seconds())
+            if connected != stats.connected:
+                stats.changed_at = at
+                self.cities[city_id][1] += -1 if connected else 1
+                if connected:
+                    self._end(OutageEvent.Scope.CAMERA, camera_id, at)
+                else:
+                    stats.failures += 1.0
+                    self._start(OutageEvent.Scope.CAMERA, camera_id, city_id, at)
+            stats.connected = connected
+            stats.observed_at = at
+        self.dirty.add(camera_id)
+        self._check_city(city_id, at)
+
+    def _check_city(self, city_id, at):
+        tracked, down = self.cities[city_id]
+        in_outage = tracked >= self.city_min_cameras and down >= self.city_share * tracked
+        if in_outage and (OutageEvent.Scope.CITY, city_id) not in self.open:
+            self._start(OutageEvent.Scope.CITY, city_id, city_id, at, cameras_down=down)
+        elif not in_outage:
+            self._end(OutageEvent.Scope.CITY, city_id, at)
+
+    def _start(self, scope, subject, city_id, at, cameras_down=1):
+        if not self.events or (scope, subject) in self.open:
+            return
+        event = OutageEvent(
+            scope=scope,
+            camera_id=subject if scope == OutageEvent.Scope.CAMERA else None,
+            city_id=city_id,
+            cameras_down=cameras_down,
+            started_at=at,
+        )
+        self.open[(scope, subject)] = event
+        self.started.append(event)
+        OUTAGES.inc()
+        logger.warning("Outage of %s %s started at %s", scope, subject, at.isoformat())
+
+    def _end(self, scope, subject, at):
+        event = self.open.pop((scope, subject), None)
+        if event is None:
+            return
+        event.ended_at = at
+        if event.pk is not None:
+            self.ended.append(event)
+        logger.info("Outage of %s %s ended at %s", scope, subject, at.isoformat())
+
+    def save(self):
+        """
+        Persists the statistics changed and the outages started or ended since the last save.
+        """
+        changed = [self.stats[camera_id] for camera_id in self.dirty]
+        CameraConnectivity.objects.bulk_create(
+            changed,
+            batch_size=1000,
+            update_conflicts=True,
+            unique_fields=["camera"],
+            update_fields=UPDATE_FIELDS,
+        )
+        # Outages both started and ended since the last save are created closed.
+        OutageEvent.objects.bulk_create(self.started)
+        OutageEvent.objects.bulk_update(self.ended, ["ended_at"])
+        self.dirty.clear()
+        self.started = []
+        self.ended = []
+        CAMERAS_DOWN.set(sum(down for _, down in self.cities.values()))
@@ -0,0 +1,84 @@
+"""
+Detection of frozen camera frames.
+
+Many cameras keep serving the same frame for hours. Every captured frame gets a
+perceptual hash (a 256-bit difference hash), compared with the last hashes of the same
+camera kept in a ring buffer. A frame within ``threshold`` bits of one of them is a
+near-duplicate: it is recorded as a stale ``Photo`` without a stored file and skips the
+inference, and a camera serving ``frozen_after`` of them in a row is flagged as frozen.
+"""
+import io
+from collections import defaultdict, deque
+from functools import partial
+
+import numpy as np
+from PIL import Image
+
+from core import metrics
+
+STALE_FRAMES = metrics.counter("capture_stale_frames_total", "Frames recorded as stale duplicates.")
+BYTES_SAVED = metrics.counter("capture_bytes_saved_total", "Bytes of stale frames not written to the storage.")
+INFERENCE_SAVED = metrics.counter(
+    "capture_inference_seconds_saved_total", "Estimated inference time saved on stale frames."
+)
+
+HASH_SIZE = 16
+
+
+def perceptual_hash(data, size=HASH_SIZE):
+    """
+    Returns the difference hash of an image: one bit per horizontally adjacent pixel pair
+    of its ``(size + 1) x size`` grayscale thumbnail.
+
+    :param data: The JPEG bytes.
+    :param size: The hash has ``size * size`` bits.
+    :return: The hash as an int.
+    """
+    with Image.open(io.BytesIO(data)) as image:
+        # Let the JPEG decoder downscale, the full-size frame is never needed.
+        image.draft("L", (size * 8, size * 8))
+        thumbnail = image.convert("L").resize((size + 1, size), Image.Resampling.BILINEAR)
+    pixels = np.asarray(thumbnail, dtype=np.int16)
+    return int.from_bytes(np.packbits(pixels[:, 1:] > pixels[:, :-1]).tobytes(), "big")
+
+
+class FrameDeduplicator:
+    """
+    Tells the near-duplicate frames of each camera apart.
+
+    :param history: Number of recent hashes kept per camera.
+    :param threshold: Maximum number of differing bits of a near-duplicate.
+    :param frozen_after: Consecutive near-duplicates after which a camera is frozen.
+    :param inference_cost: Estimated inference seconds per photo, for the savings report.
+    """
+
+    def __init__(self, history=8, threshold=3, frozen_after=3, inference_cost=0.05):
+        self.threshold = threshold
+        self.frozen_after = frozen_after
+        self.inference_cost = inference_cost
+        self.hashes = defaultdict(partial(deque, maxlen=history))
+        self.repeats = defaultdict(int)
+
+    def check(self, camera_id, data):
+        """
+        Records a frame of a camera.
+
+        :param data: The JPEG bytes of the frame.
+        :return: Whether the frame is a near-duplicate of a recent one.
+        """
+        value = perceptual_hash(data)
+        recent = self.hashes[camera_id]
+        duplicate = any((value ^ previous).bit_count() <= self.threshold for previous in recent)
+        recent.append(value)
+
+        if not duplicate:
+            self.repeats[camera_id] = 0
+            return False
+        self.repeats[camera_id] += 1
+        STALE_FRAMES.inc()
+        BYTES_SAVED.inc(len(data))
+        INFERENCE_SAVED.inc(self.inference_cost)
+        return True
+
+    def is_frozen(self, camera_id):
+        return self.repeats[camera_id] >= self.frozen_after
@@ -0,0 +1,134 @@
+"""
+Object detectors used by the inference workers.
+
+A detector is loaded once per worker process and then called with micro-batches of
+images. The class used is ``settings.DETECTOR``, a dotted path to a ``Detector`` subclass.
+"""
+import zlib
+from dataclasses import dataclass
+
+from django.conf import settings
+
+
+@dataclass(frozen=True)
+class Detection:
+    """
+    A bounding box in pixels, from the upper left corner of the photo.
+    """
+
+    name: str
+    conf: float
+    x: float
+    y: float
+    width: float
+    height: float
+
+
+class Detector:
+    """
+    Base class of the detectors.
+
+    :param classes: The class names to detect, ``settings.YOLO_WORLD_MODEL_CLASSES`` by default.
+    """
+
+    #: Longest side the images are decoded to before being passed to ``detect``.
+    input_size = 640
+
+    def __init__(self, classes=None):
+        self.classes = list(classes or settings.YOLO_WORLD_MODEL_CLASSES)
+
+    @property
+    def min_confidence(self):
+        thresholds = [
+            value.get("MINIMUM_CONFIDENCE_THRESHOLD")
+            for name, value in settings.YOLO_WORLD_MODEL_CLASSES.items()
+            if name in self.classes
+        ]
+        return min((threshold for threshold in thresholds if threshold is not None), default=0.0)
+
+    def load(self):
+        """
+        Loads the model. Called once in every worker process before the first batch.
+        """
+
+    def detect(self, images):
+        """
+        Detects objects in a batch of RGB ``PIL.Image``.
+
+        :return: One list of ``Detection`` per image, in the coordinates of that image.
+        """
+        raise NotImplementedError
+
+
+class FakeDetector(Detector):
+    """
+    Deterministic detector for tests and benchmarks: the detections only depend on the
+    image content, so the same photo always yields the same objects.
+    """
+
+    max_objects = 3
+
+    def detect(self, images):
+        results = []
+        for image in images:
+            seed = zlib.crc32(image.resize((8, 8)).tobytes())
+            width, height = image.size
+            detections = []
+            for i in range(seed % (self.max_objects + 1)):
+                value = zlib.crc32(i.to_bytes(1, "big"), seed)
+                box_width = width * (0.05 + (value & 0xFF) / 255 * 0.2)
+                box_height = height * (0.05 + (value >> 8 & 0xFF) / 255 * 0.2)
+                detections.append(Detection(
+                    name=self.classes[(value >> 16) % len(self.classes)],
+                    conf=round(0.3 + (value >> 24) / 255 * 0.7, 4),
+                    x=(width - box_width) * ((value >> 4) & 0xFF) / 255,
+                    y=(height - box_height) * ((value >> 12) & 0xFF) / 255,
+                    width=box_width,
+                    height=box_height,
+                ))
+            results.append(detections)
+        return results
+
+
+class YoloWorldDetector(Detector):
+    """
+    YOLO-World open-vocabulary detector from ``ultralytics``, running on the CPU.
+    """
+
+    def __init__(self, classes=None, model=None):
+        super().__init__(classes)
+        self.model_path = model or settings.YOLO_WORLD_MODEL
+        self.model = None
+
+    def load(self):
+        try:
+            from ultralytics import YOLOWorld
+        except ImportError as exc:
+            raise ImportError("YoloWorldDetector requires the ultralytics package.") from exc
+        self.model = YOLOWorld(self.model_path)
+        self.model.set_classes(self.classes)
+
+    def detect(self, images):
+        results = self.model.predict(
+            images,
+            conf=self.min_confidence,
+            imgsz=self.input_size,
+            device="cpu",
+            verbose=False,
+        )
+        batch = []
+        for result in results:
+            detections = []
+            for (x1, y1, x2, y2), conf, cls in zip(
+                result.boxes.xyxy.tolist(), result.boxes.conf.tolist(), result.boxes.cls.tolist()
+            ):
+                detections.append(Detection(
+                    name=self.classes[int(cls)],
+                    conf=conf,
+                    x=x1,
+                    y=y1,
+                    width=x2 - x1,
+                    height=y2 - y1,
+                ))
+            batch.append(detections)
+        return batch
@@ -0,0 +1,208 @@
+"""
+Bulk loading of detector output into ``Photo`` and ``DetectedObject``.
+
+A batch of parsed photos is written with ``COPY`` into a temporary table and moved into
+``Photo`` with a single ``INSERT ... SELECT ... ON CONFLICT DO NOTHING`` on the unique
+camera and capture time, so importing a photo twice is a no-op. Photos with a detection of
+an unknown class are skipped before the ``COPY``. The detections of the
+inserted photos are tracked like the ones of the inference and written with ``COPY``
+straight into ``DetectedObject``, with ids reserved beforehand.
+"""
+import io
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .inference import COUNT_FIELDS
+from .models import DetectedObject, Photo, get_default_system_confidence_value
+from .tracking import Tracker, reserve_ids
+
+PHOTO_FIELDS = [
+    "id",
+    "camera",
+    "file",
+    "state",
+    "city",
+    "road",
+    "timezone",
+    "system_confidence",
+    "connection_start_date",
+    "captured_at",
+    "detected_at",
+    "created_at",
+    "has_detected_objects",
+    "is_stale",
+    *COUNT_FIELDS,
+]
+NAMES = frozenset(DetectedObject.Name.values)
+OBJECT_FIELDS = [
+    "id",
+    "photo",
+    "name",
+    "image",
+    "conf",
+    "x",
+    "y",
+    "width",
+    "height",
+    "timezone",
+    "captured_at",
+    "created_at",
+    "track_id",
+]
+
+
+def columns(model, fields):
+    return [model._meta.get_field(field).column for field in fields]
+
+
+def copy_value(value):
+    """
+    Formats a value for the text format of ``COPY``.
+    """
+    if value is None:
+        return "\\N"
+    if value is True:
+        return "t"
+    if value is False:
+        return "f"
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return str(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+def copy_rows(cursor, table, column_names, rows):
+    """
+    Writes rows into a table with ``COPY ... FROM STDIN``.
+
+    :param cursor: A raw psycopg 3 or psycopg2 cursor.
+    """
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write("\t".join(map(copy_value, row)))
+        buffer.write("\n")
+    sql = f"COPY {table} ({', '.join(column_names)}) FROM STDIN"
+    if hasattr(cursor, "copy"):
+        with cursor.copy(sql) as copy:
+            copy.write(buffer.getvalue())
+    else:
+        buffer.seek(0)
+        cursor.copy_expert(sql, buffer)
+
+
+class DetectionLoader:
+    """
+    Loads parsed photos and their detections.
+
+    :param references: Camera slug to ``CameraReference``.
+    :param system_confidence: The confidence splitting the per-class counters.
+    :param tracker: The ``Tracker`` assigning the track ids.
+    """
+
+    def __init__(self, references, system_confidence=None, tracker=None):
+        self.references = references
+        self.system_confidence = system_confidence or get_default_system_confidence_value()
+        self.tracker = tracker or Tracker()
+
+    def photo_row(self, photo_id, reference, captured_at, name, detections, now):
+        counts = dict.fromkeys(COUNT_FIELDS, 0)
+        for detection_name, conf, *_ in detections:
+            side = "above" if conf >= self.system_confidence else "below"
+            field = f"{detection_name}_count_{side}_system_confidence"
+            if field in counts:
+                counts[field] += 1
+        return [
+            photo_id,
+            reference.id,
+            name,
+            reference.state_id,
+            reference.city_id,
+            reference.road_id,
+            reference.timezone,
+            self.system_confidence,
+            captured_at,
+            captured_at,
+            now,
+            now,
+            bool(detections),
+            False,
+            *counts.values(),
+        ]
+
+    def load(self, records):
+        """
+        Writes a batch of photos, skipping the ones already stored and the invalid ones.
+
+        :param records: ``(camera_slug, captured_at, file_name, detections)`` tuples.
+        :return: A ``(photos, objects, skipped)`` tuple of counts.
+        """
+        photos = {}
+        invalid = 0
+        for slug, captured_at, name, detections in records:
+            if any(detection[0] not in NAMES for detection in detections):
+                # An unknown class, possibly longer than the column, would fail the whole COPY.
+                invalid += 1
+                continue
+            reference = self.references[slug]
+            photos.setdefault((reference.id, captured_at), (reference, captured_at, name, detections))
+        # The tracker needs the photos of a camera in capture order.
+        photos = [photos[key] for key in sorted(photos)]
+
+        # The tracks are only kept with the rows of the detections they point to.
+        tracks = self.tracker.snapshot({reference.id for reference, *_ in photos})
+        try:
+            return self.write(photos, invalid)
+        except Exception:
+            self.tracker.restore(tracks)
+            raise
+
+    def write(self, photos, invalid):
+        """
+        Writes the valid photos of a batch, in capture order, and their detections in a transaction.
+        """
+        now = timezone.now()
+        photo_table = Photo._meta.db_table
+        photo_columns = columns(Photo, PHOTO_FIELDS)
+        with transaction.atomic(), connection.cursor() as cursor:
+            photo_ids = reserve_ids(Photo, len(photos))
+            cursor.execute(
+                f"CREATE TEMP TABLE import_photo ON COMMIT DROP AS "
+                f"SELECT {', '.join(photo_columns)} FROM {photo_table} WITH NO DATA"
+            )
+            copy_rows(
+                cursor.cursor,
+                "import_photo",
+                photo_columns,
+                (self.photo_row(photo_id, *photo, now) for photo_id, photo in zip(photo_ids, photos)),
+            )
+            cursor.execute(
+                f"INSERT INTO {photo_table} ({', '.join(photo_columns)}) "
+                f"SELECT {', '.join(photo_columns)} FROM import_photo "
+                f"ON CONFLICT (camera_id, captured_at) DO NOTHING RETURNING id"
+            )
+            inserted = {row[0] for row in cursor.fetchall()}
+
+            object_ids = iter(reserve_ids(
+                DetectedObject,
+                sum(len(photo[3]) for photo_id, photo in zip(photo_ids, photos) if photo_id in inserted),
+            ))
+            objects = []
+            for photo_id, (reference, captured_at, _, detections) in zip(photo_ids, photos):
+                if photo_id not in inserted or not detections:
+                    continue
+                ids = [next(object_ids) for _ in detections]
+                track_ids = self.tracker.update(
+                    reference.id,
+                    captured_at,
+                    [detection[0] for detection in detections],
+                    [detection[2:] for detection in detections],
+                    ids,
+                )
+                for object_id, track_id, (name, conf, x, y, width, height) in zip(ids, track_ids.tolist(), detections):
+                    objects.append([
+                        object_id, photo_id, name, "", conf, x, y, width, height,
+                        reference.timezone, captured_at, now, track_id,
+                    ])
+            copy_rows(cursor.cursor, DetectedObject._meta.db_table, columns(DetectedObject, OBJECT_FIELDS), objects)
+
+        return len(inserted), len(objects), len(photos) - len(inserted) + invalid
@@ -0,0 +1,220 @@
+"""
+Batched inference over the photos waiting for detection.
+
+The dispatcher reads the pending photos (``detected_at IS NULL``) in pages, splits them
+into micro-batches and feeds them to a pool of worker processes. Each worker loads the
+detector once, decodes its images at the detector input size and returns the detections
+in photo coordinates. The dispatcher writes the detections, the per-class counters and
+``detected_at`` back in bulk, one transaction per flush.
+
+Before they are written, the detections are linked to the ones of the previous photos of
+their camera by a ``Tracker`` kept by the dispatcher, which fills their ``track_id``.
+"""
+import multiprocessing
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from core import metrics
+from jobs import queue as jobs
+from .models import DetectedObject, Photo
+from .tracking import Tracker, reserve_ids
+from .workers import detect_batch, init_detector_worker
+
+PHOTOS = metrics.counter("inference_photos_total", "Photos processed by the inference workers.")
+DETECTIONS = metrics.counter("inference_detections_total", "Objects detected by the inference workers.")
+FAILURES = metrics.counter("inference_failures_total", "Photos whose file could not be read.")
+FETCH_SECONDS = metrics.histogram("inference_fetch_seconds", "Time to read a page of pending photos.")
+LOAD_SECONDS = metrics.histogram("inference_load_seconds", "Time to read and decode the images of a batch.")
+DETECT_SECONDS = metrics.histogram("inference_detect_seconds", "Time to run the detector on a batch.")
+WRITE_SECONDS = metrics.histogram("inference_write_seconds", "Time to write a flush of results.")
+BATCH_LATENCY = metrics.histogram("inference_batch_latency_seconds", "Time from submitting a batch to its result.")
+
+COUNT_FIELDS = [
+    f"{name}_count_{side}_system_confidence"
+    for name in DetectedObject.Name.values
+    for side in ("above", "below")
+]
+
+class InferencePool:
+    """
+    Feeds the pending photos to a pool of detector processes.
+
+    :param workers: Number of worker processes.
+    :param batch_size: Number of photos per micro-batch.
+    :param detector: Dotted path of the ``Detector`` class, ``settings.DETECTOR`` by default.
+    :param flush_size: Number of photos written per transaction.
+    :param tracker: The ``Tracker`` linking the detections across photos.
+    :param crop_queue: When given, a ``cameras.tasks.crop_objects`` job is queued there for
+        the photos with detections of every flush.
+    """
+
+    crop_chunk = 50
+
+    def __init__(self, workers=4, batch_size=8, detector=None, flush_size=500, tracker=None, crop_queue=None):
+        self.workers = workers
+        self.batch_size = batch_size
+        self.detector = detector or settings.DETECTOR
+        self.flush_size = flush_size
+        self.tracker = tracker or Tracker()
+        self.crop_queue = crop_queue
+        self.max_in_flight = 2 * workers
+        self.executor = None
+
+    def __enter__(self):
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_detector_worker,
+            initargs=(self.detector,),
+        )
+        return self
+
+    def __exit__(self, *exc_info):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+    def fetch(self, after, limit):
+        started = time.perf_counter()
+        photos = list(
+            Photo.objects
+            .filter(detected_at__isnull=True, deleted_at__isnull=True, id__gt=after)
+            .order_by("id")
+            .only("id", "camera_id", "file", "system_confidence", "timezone", "captured_at")[:limit]
+        )
+        FETCH_SECONDS.observe(time.perf_counter() - started)
+        return photos
+
+    def run(self, once=False, idle=5.0):
+        """
+        Processes pending photos until none are left when ``once``, forever otherwise.
+
+        :param idle: Seconds to wait before looking again when nothing is pending.
+        :return: The number of processed photos.
+        """
+        queue = deque()
+        photos = {}
+        in_flight = {}
+        done = []
+        last_id = 0
+        exhausted = False
+        processed = 0
+        page_size = self.batch_size * self.max_in_flight * 2
+
+        while True:
+            if not exhausted and len(queue) < self.batch_size * self.max_in_flight:
+                page = self.fetch(last_id, page_size)
+                exhausted = len(page) < page_size
+                if page:
+                    last_id = page[-1].id
+                for photo in page:
+                    if photo.file:
+                        photos[photo.id] = photo
+                        queue.append(photo)
+                    else:
+                        # Disconnected camera: nothing to detect.
+                        done.append((photo, []))
+
+            while queue and len(in_flight) < self.max_in_flight:
+                batch = [queue.popleft() for _ in range(min(self.batch_size, len(queue)))]
+                future = self.executor.submit(detect_batch, [(photo.id, photo.file.name) for photo in batch])
+                in_flight[future] = time.perf_counter()
+
+            if in_flight:
+                finished, _ = wait(in_flight, timeout=idle, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    BATCH_LATENCY.observe(time.perf_counter() - in_flight.pop(future))
+                    results, load_seconds, detect_seconds = future.result()
+                    LOAD_SECONDS.observe(load_seconds)
+                    DETECT_SECONDS.observe(detect_seconds)
+                    done.extend((photos.pop(photo_id), detections) for photo_id, detections in results)
+
+            idle_now = exhausted and not queue and not in_flight
+            if len(done) >= self.flush_size or (done and idle_now):
+                processed += self.save(done)
+                done = []
+
+            if idle_now:
+                if once:
+                    return processed
+                time.sleep(idle)
+                # Start over so photos inserted with a lower id in the meantime aren't skipped.
+                last_id = 0
+                exhausted = False
+
+    def save(self, results):
+        """
+        Writes the detections of the photos and marks them as detected.
+
+        :param results: A list of ``(photo, detections)``.
+        :return: The number of photos written.
+        """
+        started = time.perf_counter()
+        now = timezone.now()
+        # The tracker needs the photos of a camera in capture order.
+        results = sorted(results, key=lambda result: (result[0].camera_id, result[0].captured_at))
+        ids = iter(reserve_ids(DetectedObject, sum(len(detections or ()) for _, detections in results)))
+        objects = []
+        for photo, detections in results:
+            counts = dict.fromkeys(COUNT_FIELDS, 0)
+            if detections is None:
+                FAILURES.inc()
+                detections = []
+            object_ids = [next(ids) for _ in detections]
+            track_ids = self.tracker.update(
+                photo.camera_id,
+                photo.captured_at,
+                [detection.name for detection in detections],
+                [(detection.x, detection.y, detection.width, detection.height) for detection in detections],
+                object_ids,
+            )
+            for detection, object_id, track_id in zip(detections, object_ids, track_ids.tolist()):
+                side = "above" if detection.conf >= photo.system_confidence else "below"
+                field = f"{detection.name}_count_{side}_system_confidence"
+                if field in counts:
+                    counts[field] += 1
+                objects.append(DetectedObject(
+                    id=object_id,
+                    track_id=track_id,
+                    photo_id=photo.id,
+                    name=detection.name,
+                    conf=detection.conf,
+                    x=detection.x,
+                    y=detection.y,
+                    width=detection.width,
+                    height=detection.height,
+                    timezone=photo.timezone,
+                    captured_at=photo.captured_at,
+                ))
+            for field, count in counts.items():
+                setattr(photo, field, count)
+            photo.has_detected_objects = bool(detections)
+            photo.detected_at = now
+
+        with transaction.atomic():
+            DetectedObject.objects.bulk_create(objects, batch_size=1000)
+            Photo.objects.bulk_update(
+                [photo for photo, _ in results],
+                COUNT_FIELDS + ["has_detected_objects", "detected_at"],
+                batch_size=1000,
+            )
+            if self.crop_queue:
+                photo_ids = [photo.id for photo, _ in results if photo.has_detected_objects]
+                jobs.enqueue_many(
+                    "cameras.tasks.crop_objects",
+                    [
+                        {"photo_ids": photo_ids[i:i + self.crop_chunk]}
+                        for i in range(0, len(photo_ids), self.crop_chunk)
+                    ],
+                    queue=self.crop_queue,
+                )
+
+        if results:
+            self.tracker.expire(max(photo.captured_at for photo, _ in results))
+        PHOTOS.inc(len(results))
+        DETECTIONS.inc(len(objects))
+        WRITE_SECONDS.observe(time.perf_counter() - started)
+        return len(results)
@@ -0,0 +1,74 @@
+import asyncio
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from cameras.capture import FRAME_LATENCY, FrameCapturer
+from cameras.models import Camera
+from cameras.reference import references
+from cameras.stub_server import StubCameraServer
+
+
+class Command(BaseCommand):
+    help = (
+        'Capture frames of the cameras from a local stub camera host and report whether a cycle '
+        'keeps up with the target rate; the frames are stored like in production, then deleted'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--cameras',
+            type=int,
+            default=15_000,
+            help='Frames captured, the cameras being reused in turn when there are fewer (default: 15000)'
+        )
+        parser.add_argument('--target', type=float, default=15_000, help='Target cameras per minute (default: 15000)')
+        parser.add_argument('--concurrency', type=int, default=500, help='Requests in flight (default: 500)')
+        # All the cameras are on the one stub host, unlike the many DOT hosts in production.
+        parser.add_argument('--per-host', type=int, default=500, help='Requests in flight per host (default: 500)')
+        parser.add_argument('--timeout', type=float, default=10.0, help='Timeout per request in seconds (default: 10)')
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=2 * (os.cpu_count() or 4),
+            help='Threads encoding and storing frames (default: 2 x CPU count)'
+        )
+
+    def handle(self, *args, **options):
+        cameras = list(Camera.objects.only('id', 'preview_url')[:options['cameras']])
+        if not cameras:
+            raise CommandError('No cameras to capture')
+        photo_fields = {camera.id: references.photo_fields(camera.id) for camera in cameras}
+        capturer = FrameCapturer(
+            concurrency=options['concurrency'],
+            per_host=options['per_host'],
+            timeout=options['timeout'],
+            workers=options['workers'],
+        )
+
+        latencies = FRAME_LATENCY.snapshot()
+        with StubCameraServer() as server:
+            for camera in cameras:
+                camera.preview_url = server.preview_url('ok', camera.id)
+            frames, elapsed = asyncio.run(self.capture(capturer, [
+                (camera, photo_fields[camera.id])
+                for camera in (cameras[i % len(cameras)] for i in range(options['cameras']))
+            ]))
+        for frame in frames:
+            capturer.discard(frame)
+
+        failed = sum(1 for frame in frames if frame.error)
+        rate = len(frames) * 60 / elapsed
+        style = self.style.SUCCESS if rate >= options['target'] and not failed else self.style.WARNING
+        self.stdout.write(style(
+            f'Captured {len(frames) - failed}/{len(frames)} frames in {elapsed:.1f}s: {rate:.0f} cameras/min '
+            f'(target {options["target"]:.0f}), frame p95 <= {FRAME_LATENCY.quantile(0.95, since=latencies)}s'
+        ))
+
+    @staticmethod
+    async def capture(capturer, cameras):
+        async with capturer:
+            started = time.monotonic()
+            frames = await capturer.run(cameras)
+            return frames, time.monotonic() - started
@@ -0,0 +1,118 @@
+import asyncio
+import os
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from cameras.capture import FRAME_LATENCY, CaptureScheduler, FrameCapturer
+from cameras.connectivity import ConnectivityTracker
+from cameras.dedup import BYTES_SAVED, INFERENCE_SAVED, FrameDeduplicator
+from cameras.models import Camera
+from cameras.scheduling import PollingScheduler, hottest, load_history
+
+
+class Command(BaseCommand):
+    help = 'Capture one frame per camera per interval and store them as Photo rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--state', type=str, help='Only capture cameras of this state abbreviation')
+        parser.add_argument('--interval', type=float, default=60, help='Seconds between cycles (default: 60)')
+        parser.add_argument('--cycles', type=int, help='Stop after this many cycles (default: run forever)')
+        parser.add_argument('--concurrency', type=int, default=500, help='Requests in flight (default: 500)')
+        parser.add_argument('--per-host', type=int, default=8, help='Requests in flight per host (default: 8)')
+        parser.add_argument('--timeout', type=float, default=10.0, help='Timeout per request in seconds (default: 10)')
+        parser.add_argument(
+            '--budget',
+            type=float,
+            help='Polls per minute shared between the cameras by activity; '
+                 'every camera is captured every cycle when omitted'
+        )
+        parser.add_argument(
+            '--history-days',
+            type=int,
+            default=14,
+            help='Days of photos used to rank the cameras with --budget and --pregenerate-top (default: 14)'
+        )
+        parser.add_argument(
+            '--pregenerate-top',
+            type=int,
+            default=0,
+            help='Generate the thumbnails of the frames of this many most active cameras at capture time'
+        )
+        parser.add_argument('--no-dedup', action='store_true', help='Store every frame, even the frozen ones')
+        parser.add_argument(
+            '--dedup-threshold',
+            type=int,
+            default=3,
+            help='Differing bits of the 256-bit frame hash below which a frame is stale (default: 3)'
+        )
+        parser.add_argument(
+            '--frozen-after',
+            type=int,
+            default=3,
+            help='Consecutive stale frames after which a camera is flagged as frozen (default: 3)'
+        )
+        parser.add_argument(
+            '--inference-cost',
+            type=float,
+            default=0.05,
+            help='Estimated inference seconds per photo, to report the time saved on stale frames (default: 0.05)'
+        )
+        parser.add_argument(
+            '--city-outage-share',
+            type=float,
+            default=0.8,
+            help='Share of the cameras of a city down that raises a city outage (default: 0.8)'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=2 * (os.cpu_count() or 4),
+            help='Threads encoding and storing frames (default: 2 x CPU count)'
+        )
+
+    def handle(self, *args, **options):
+        self.interval = options['interval']
+        queryset = Camera.objects.all()
+        if options['state']:
+            queryset = queryset.filter(city__state__abbreviation=options['state'])
+
+        history = None
+        if options['budget'] or options['pregenerate_top']:
+            since = timezone.now() - timedelta(days=options['history_days'])
+            history = load_history(since, queryset=queryset)
+        polling = PollingScheduler(history, options['budget']) if options['budget'] else None
+        pregenerate = hottest(history, options['pregenerate_top']) if options['pregenerate_top'] else ()
+
+        scheduler = CaptureScheduler(
+            FrameCapturer(
+                concurrency=options['concurrency'],
+                per_host=options['per_host'],
+                timeout=options['timeout'],
+                workers=options['workers'],
+                dedup=None if options['no_dedup'] else FrameDeduplicator(
+                    threshold=options['dedup_threshold'],
+                    frozen_after=options['frozen_after'],
+                    inference_cost=options['inference_cost'],
+                ),
+                pregenerate=pregenerate,
+            ),
+            queryset,
+            interval=options['interval'],
+            polling=polling,
+            connectivity=ConnectivityTracker(city_share=options['city_outage_share']).load(),
+        )
+        asyncio.run(scheduler.serve(cycles=options['cycles'], on_cycle=self.report))
+
+    def report(self, frames, lag, duration):
+        failed = sum(1 for frame in frames if frame.error)
+        stale = sum(1 for frame in frames if frame.stale)
+        frozen = sum(1 for frame in frames if frame.camera.is_frozen)
+        style = self.style.SUCCESS if duration <= self.interval else self.style.WARNING
+        self.stdout.write(style(
+            f'Captured {len(frames) - failed}/{len(frames)} cameras in {duration:.1f}s '
+            f'(lag {lag:.1f}s, frame p95 <= {FRAME_LATENCY.quantile(0.95)}s), '
+            f'{stale} stale, {frozen} frozen; saved {BYTES_SAVED.value / 2 ** 20:.1f} MiB '
+            f'and ~{INFERENCE_SAVED.value:.0f}s of inference so far'
+        ))
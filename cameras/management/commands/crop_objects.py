@@ -0,0 +1,48 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from cameras import cropping
+
+
+class Command(BaseCommand):
+    help = 'Crop the detected objects that have no image yet out of their photos'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 4,
+            help='Cropping processes (default: CPU count)'
+        )
+        parser.add_argument('--page-size', type=int, default=2000, help='Objects read per query (default: 2000)')
+        parser.add_argument('--quality', type=int, default=90, help='JPEG quality of the crops (default: 90)')
+        parser.add_argument(
+            '--benchmark',
+            action='store_true',
+            help='Compare per-object and single-decode cropping on photos with 1 to 50 detections, then exit'
+        )
+
+    def handle(self, *args, **options):
+        if options['benchmark']:
+            self.stdout.write(f'{"detections":>10}  {"per object":>14}  {"single decode":>14}  speedup')
+            for count, per_object, single_decode in cropping.benchmark(quality=options['quality']):
+                self.stdout.write(
+                    f'{count:>10}  {per_object:>9.0f} /s  {single_decode:>9.0f} /s  {single_decode / per_object:5.1f}x'
+                )
+            return
+
+        started = time.monotonic()
+        with cropping.CropPool(
+            workers=options['workers'],
+            page_size=options['page_size'],
+            quality=options['quality'],
+        ) as pool:
+            cropped = pool.run()
+        elapsed = time.monotonic() - started
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Cropped {cropped} objects in {elapsed:.1f}s ({cropped / elapsed if elapsed else 0:.0f}/s), '
+            f'{cropping.CROP_FAILURES.value} failed'
+        ))
@@ -1,12 +1,24 @@
+import csv
 import json
+import math
 import os
 from pathlib import Path
 from django.core.management.base import BaseCommand
 from django.utils.text import slugify
+from states.locating import CityIndex
 from states.models import State, City, Road
 from cameras.models import Camera
+from cameras.reference import bump_version
+from core.timezones import US_TIMEZONES
 import re
 
+# Roads recognized in the camera names, tried in order: (pattern, prefix, is_interstate).
+ROAD_PATTERNS = [
+    (r'I-(\d+)', 'I-', True),
+    (r'US (\d+)', 'US ', False),
+    (r'MD (\d+)', 'MD ', False),
+]
+
 
 class Command(BaseCommand):
     help = 'Import cameras from JSON files in data/Cameras directory'
@@ -18,6 +30,17 @@ class Command(BaseCommand):
             default='data/Cameras',
             help='Path to Cameras directory (default: data/Cameras)'
         )
+        parser.add_argument(
+            '--cities-dir',
+            type=str,
+            default='data/Cities',
+            help='Cities whose centroids and boxes locate the cameras (default: data/Cities)'
+        )
+        parser.add_argument(
+            '--report',
+            type=str,
+            help='CSV file listing the cameras outside every known city box'
+        )
 
     def handle(self, *args, **options):
         Camera.objects.all().delete()
@@ -54,6 +77,15 @@ class Command(BaseCommand):
         if created:
             self.stdout.write(f'Created default road: {default_road.name}\n')
 
+        # The reference rows are looked up in memory; the missing cities and roads and then
+        # the cameras are written in bulk, so the import runs the same queries for any size.
+        states = {state.abbreviation: state for state in State.objects.all()}
+        cities = {(city.state_id, city.abbreviation): city for city in City.objects.all()}
+        road_ids = dict(Road.objects.values_list('slug', 'id'))
+        new_cities = {}
+        new_roads = {}
+        rows = []
+
         for json_file in json_files:
             self.stdout.write(f'\nProcessing: {json_file.name}')
 
@@ -75,114 +107,18 @@ class Command(BaseCommand):
                         state_abbr, city_abbr = location_id.split('_', 1)
 
                         # پیدا کردن State
-                        try:
-                            state = State.objects.get(abbreviation=state_abbr)
-                        except State.DoesNotExist:
+                        state = states.get(state_abbr)
+                        if state is None:
                             self.stdout.write(self.style.ERROR(
                                 f'  ✗ {camera_data.get("name")}: State "{state_abbr}" not found'
                             ))
                             error_count += 1
                             continue
 
-                        # پیدا کردن یا ایجاد City
-                        try:
-                            city = City.objects.get(state=state, abbreviation=city_abbr)
-                        except City.DoesNotExist:
-                            # ایجاد City جدید
-                            city_name = f"{state.name} {city_abbr}"
-                            city = City.objects.create(
-                                state=state,
-                                name=city_name,
-                                slug=slugify(city_name),
-                                abbreviation=city_abbr,
-                                timezone='US/Eastern',  # می‌توانید بر اساس state تغییر دهید
-                                latitude=camera_data.get('latitude', 0.0),
-                                longitude=camera_data.get('longitude', 0.0),
-                                zoom=12
-                            )
-                            city_created_count += 1
-                            self.stdout.write(self.style.WARNING(
-                                f'  ⊕ Auto-created city: {city.name} ({state.abbreviation})'
-                            ))
-
                         # استخراج road از نام
                         name = camera_data.get('name', '')
-                        road = None
-
-                        # سعی در استخراج نام road از نام camera
-                        if 'I-' in name or '(I-' in name:
-                            match = re.search(r'I-(\d+)', name)
-                            if match:
-                                road_name = f'I-{match.group(1)}'
-                                road, created = Road.objects.get_or_create(
-                                    slug=slugify(road_name),
-                                    defaults={
-                                        'name': road_name,
-                                        'is_interstate': True
-                                    }
-                                )
-                                if created:
-                                    road_created_count += 1
-                        elif 'US ' in name or '(US ' in name:
-                            match = re.search(r'US (\d+)', name)
-                            if match:
-                                road_name = f'US {match.group(1)}'
-                                road, created = Road.objects.get_or_create(
-                                    slug=slugify(road_name),
-                                    defaults={
-                                        'name': road_name,
-                                        'is_interstate': False
-                                    }
-                                )
-                                if created:
-                                    road_created_count += 1
-                        elif 'MD ' in name or '(MD ' in name:
-                            match = re.search(r'MD (\d+)', name)
-                            if match:
-                                road_name = f'MD {match.group(1)}'
-                                road, created = Road.objects.get_or_create(
-                                    slug=slugify(road_name),
-                                    defaults={
-                                        'name': road_name,
-                                        'is_interstate': False
-                                    }
-                                )
-                                if created:
-                                    road_created_count += 1
-
-                        # اگر road پیدا نشد، از default استفاده کن
-                        if not road:
-                            road = default_road
-
-                        # ایجاد slug یکتا
-                        slug = slugify(name)
-
-                        # اگر slug تکراری بود، id را به آن اضافه کن
-                        if Camera.objects.filter(slug=slug).exclude(name=name).exists():
-                            slug = f"{slug}-{camera_data.get('id', '')}"
-
-                        # به‌روزرسانی یا ایجاد
-                        camera, created = Camera.objects.update_or_create(
-                            name=name,
-                            defaults={
-                                'slug': slug,
-                                'url': camera_data.get('videoStreamUrl', ''),
-                                'latitude': camera_data.get('latitude', 0.0),
-                                'longitude': camera_data.get('longitude', 0.0),
-                                'road': road,
-                                'city': city,
-                                'last_connection_status': False,
-                            }
-                        )
-
-                        if created:
-                            created_count += 1
-                            if created_count % 100 == 0:  # هر 100 تا یک پیام
-                                self.stdout.write(self.style.SUCCESS(
-                                    f'  Progress: {created_count} cameras created...'
-                                ))
-                        else:
-                            updated_count += 1
+                        road_slug = self.road_slug(name, new_roads)
+                        rows.append((camera_data, name, state, city_abbr, road_slug))
 
                     except Exception as e:
                         error_count += 1
@@ -197,8 +133,163 @@ class Command(BaseCommand):
                 self.stdout.write(self.style.ERROR(f'  ✗ Error reading {json_file.name}: {str(e)}'))
                 error_count += 1
 
+        # Every camera gets a real city of its state, located from its coordinates, and its time zone.
+        index = CityIndex.from_directory(options['cities_dir']) if os.path.isdir(options['cities_dir']) else CityIndex([])
+        located, inside, distances = index.locate(
+            [self.coordinate(camera_data, 'latitude') for camera_data, *_ in rows],
+            [self.coordinate(camera_data, 'longitude') for camera_data, *_ in rows],
+            [state.abbreviation for _, _, state, _, _ in rows],
+            # The city of the locationId is kept when its box contains the camera.
+            [index.positions.get((state.abbreviation, city_abbr), -1) for _, _, state, city_abbr, _ in rows],
+        )
+        outside = []
+        city_keys = []
+        for row, city_index, is_inside, distance in zip(rows, located, inside, distances):
+            camera_data, name, state, city_abbr, _ = row
+            if city_index >= 0:
+                record = index.records[city_index]
+                city_abbr = index.keys[city_index][1]
+                if not is_inside:
+                    outside.append((name, camera_data.get('locationId'), record['id'], distance))
+            else:
+                # No coordinates: the city of the locationId, when known.
+                record = index.get(state.abbreviation, city_abbr)
+            city_key = (state.id, city_abbr)
+            city_keys.append(city_key)
+            if city_key in cities or city_key in new_cities:
+                continue
+            if record is not None:
+                new_cities[city_key] = City(
+                    state=state,
+                    name=record['name'],
+                    slug=slugify(record['name']),
+                    abbreviation=city_abbr,
+                    timezone=self.timezone(index, state, record),
+                    latitude=record.get('latitude', 0.0),
+                    longitude=record.get('longitude', 0.0),
+                    zoom=record.get('zoom', 12),
+                )
+                continue
+            # No known city in the state: a placeholder city in the prevailing time zone of the state.
+            city_name = f"{state.name} {city_abbr}"
+            new_cities[city_key] = City(
+                state=state,
+                name=city_name,
+                slug=slugify(city_name),
+                abbreviation=city_abbr,
+                timezone=self.timezone(index, state),
+                latitude=camera_data.get('latitude', 0.0),
+                longitude=camera_data.get('longitude', 0.0),
+                zoom=12
+            )
+            self.stdout.write(self.style.WARNING(
+                f'  ⊕ Auto-created city: {city_name} ({state.abbreviation}), no known city to locate {name}'
+            ))
+
+        if new_cities:
+            cities.update(zip(new_cities, City.objects.bulk_create(new_cities.values())))
+            city_created_count = len(new_cities)
+        missing_roads = [road for slug, road in new_roads.items() if slug not in road_ids]
+        if missing_roads:
+            Road.objects.bulk_create(missing_roads, ignore_conflicts=True)
+            road_ids.update(Road.objects.filter(slug__in=[road.slug for road in missing_roads]).values_list('slug', 'id'))
+            road_created_count = len(missing_roads)
+
+        cameras = {}
+        slugs = {}
+        for (camera_data, name, _, _, road_slug), city_key in zip(rows, city_keys):
+            # ایجاد slug یکتا
+            slug = slugify(name)
+
+            # اگر slug تکراری بود، id را به آن اضافه کن
+            if slugs.get(slug, name) != name:
+                slug = f"{slug}-{camera_data.get('id', '')}"
+            slugs.setdefault(slug, name)
+
+            if name in cameras:
+                updated_count += 1
+            else:
+                created_count += 1
+                if created_count % 100 == 0:  # هر 100 تا یک پیام
+                    self.stdout.write(self.style.SUCCESS(
+                        f'  Progress: {created_count} cameras created...'
+                    ))
+            cameras[name] = Camera(
+                name=name,
+                slug=slug,
+                url=camera_data.get('videoStreamUrl', ''),
+                preview_url=camera_data.get('previewImageUrl') or '',
+                latitude=camera_data.get('latitude', 0.0),
+                longitude=camera_data.get('longitude', 0.0),
+                road_id=road_ids[road_slug] if road_slug else default_road.id,
+                city=cities[city_key],
+                last_connection_status=False,
+            )
+
+        Camera.objects.bulk_create(cameras.values(), batch_size=1000)
+
+        bump_version()
+
+        self.report_outside(outside, options['report'])
+
         self.stdout.write(self.style.SUCCESS(
             f'\n{"=" * 50}'
             f'\nTotal: {created_count} cameras created, {updated_count} updated, {error_count} errors'
             f'\nAuto-created: {city_created_count} cities, {road_created_count} roads'
-        ))
\ No newline at end of file
+            f'\nOutside every city box: {len(outside)} cameras'
+        ))
+
+    @staticmethod
+    def timezone(index, state, record=None):
+        """
+        Returns the time zone of a city record, else the prevailing one of its state, else US/Eastern.
+        """
+        timezone = (record or {}).get('timeZone')
+        if timezone in US_TIMEZONES:
+            return timezone
+        return index.state_timezone(state.abbreviation, choices=US_TIMEZONES) or 'US/Eastern'
+
+    @staticmethod
+    def coordinate(camera_data, field):
+        """
+        Returns a coordinate of a camera, NaN when it is missing (the feeds use 0 for unknown).
+        """
+        value = camera_data.get(field)
+        return float(value) if value else math.nan
+
+    def report_outside(self, outside, path):
+        """
+        Lists the cameras assigned to a city whose box doesn't contain them.
+
+        :param outside: ``(camera name, locationId, city id, distance in km)`` tuples.
+        :param path: The CSV file to write, or None to only print the farthest ones.
+        """
+        outside = sorted(outside, key=lambda row: -row[3])
+        if path:
+            with open(path, 'w', newline='', encoding='utf-8') as f:
+                writer = csv.writer(f)
+                writer.writerow(['camera', 'location_id', 'city_id', 'distance_km'])
+                writer.writerows((name, location, city, f'{distance:.1f}') for name, location, city, distance in outside)
+            self.stdout.write(f'\nCameras outside every city box written to {path}')
+        for name, location, city, distance in outside[:20]:
+            self.stdout.write(self.style.WARNING(
+                f'  ⚠ {name} ({location}): outside every city box, {distance:.1f} km from {city}'
+            ))
+
+    @staticmethod
+    def road_slug(name, new_roads):
+        """
+        Returns the slug of the road in the name of a camera, None when there is none.
+
+        :param new_roads: Slug to unsaved ``Road``, completed with the road found.
+        """
+        for pattern, prefix, is_interstate in ROAD_PATTERNS:
+            if prefix in name:
+                match = re.search(pattern, name)
+                if match:
+                    road_name = f'{prefix}{match.group(1)}'
+                    slug = slugify(road_name)
+                    new_roads.setdefault(slug, Road(name=road_name, slug=slug, is_interstate=is_interstate))
+                    return slug
+                return None
+        return None
@@ -0,0 +1,169 @@
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from cameras.importing import DetectionLoader
+from cameras.reference import references
+from cameras.workers import init_worker, parse_label_files
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg')
+LABEL_EXTENSIONS = ('.json', '.txt')
+
+
+def walk(root, after=None):
+    """
+    Yields the ``(image_path, label_path)`` pairs of a directory tree, sorted by path.
+
+    :param after: Only yield the images after this path relative to ``root``.
+    """
+    after = tuple(after.split('/')) if after else None
+
+    def visit(directory, prefix):
+        entries = sorted(os.scandir(directory), key=lambda entry: entry.name)
+        names = {entry.name for entry in entries}
+        for entry in entries:
+            key = prefix + (entry.name,)
+            if entry.is_dir():
+                if after is None or key >= after[:len(key)]:
+                    yield from visit(entry.path, key)
+                continue
+            stem, extension = os.path.splitext(entry.name)
+            if extension.lower() not in IMAGE_EXTENSIONS or (after is not None and key <= after):
+                continue
+            label = next((stem + ext for ext in LABEL_EXTENSIONS if stem + ext in names), None)
+            yield entry.path, os.path.join(directory, label) if label else None
+
+    yield from visit(root, ())
+
+
+def ordered_map(executor, function, iterable, window):
+    """
+    Like ``executor.map``, but submits at most ``window`` tasks ahead instead of all of them.
+    """
+    pending = deque()
+    for item in iterable:
+        pending.append(executor.submit(function, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def chunked(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class Command(BaseCommand):
+    help = 'Import a directory tree of detector output (JPEGs with JSON or YOLO txt labels) as photos and detections'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', type=str, required=True, help='Root of the detector output')
+        parser.add_argument(
+            '--copy-files',
+            action='store_true',
+            help='Copy the images outside MEDIA_ROOT into the storage (they are referenced in place otherwise)'
+        )
+        parser.add_argument(
+            '--classes',
+            type=str,
+            help='Comma-separated class names of the YOLO class ids (default: YOLO_WORLD_MODEL_CLASSES order)'
+        )
+        parser.add_argument(
+            '--checkpoint',
+            type=str,
+            help='File recording the last imported image, to resume an interrupted import'
+        )
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 4, help='Parsing processes (default: CPU count)')
+        parser.add_argument('--chunk-size', type=int, default=500, help='Images per parsing task (default: 500)')
+        parser.add_argument('--batch-size', type=int, default=20000, help='Photos per transaction (default: 20000)')
+
+    def handle(self, *args, **options):
+        root = options['dir']
+        if not os.path.isdir(root):
+            raise CommandError(f'Directory not found: {root}')
+        root = os.path.abspath(root)
+        class_names = (
+            options['classes'].split(',') if options['classes'] else list(settings.YOLO_WORLD_MODEL_CLASSES)
+        )
+        by_slug = {reference.slug: reference for reference in references.all()}
+        loader = DetectionLoader(by_slug)
+
+        checkpoint = options['checkpoint']
+        after = None
+        if checkpoint and os.path.exists(checkpoint):
+            with open(checkpoint) as f:
+                after = f.read().strip() or None
+            self.stdout.write(f'Resuming after {after}')
+
+        parse = partial(
+            parse_label_files,
+            class_names=class_names,
+            media_root=settings.MEDIA_ROOT,
+            copy_files=options['copy_files'],
+            camera_states={slug: reference.state_slug for slug, reference in by_slug.items()},
+        )
+        started = time.monotonic()
+        photos = objects = skipped = errors = 0
+
+        with ProcessPoolExecutor(
+            max_workers=options['workers'],
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=init_worker,
+        ) as executor:
+            batch, last_path = [], None
+            # The results come in the order of the tree, so the checkpoint never skips an unloaded image.
+            chunks = chunked(walk(root, after), options['chunk_size'])
+            for records in ordered_map(executor, parse, chunks, window=4 * options['workers']):
+                for image_path, slug, captured_at, name, detections in records:
+                    last_path = image_path
+                    if slug is None:
+                        errors += 1
+                        if errors <= 20:
+                            self.stdout.write(self.style.ERROR(f'  ✗ {image_path}: {detections}'))
+                        continue
+                    batch.append((slug, captured_at, name, detections))
+                if len(batch) >= options['batch_size']:
+                    counts = loader.load(batch)
+                    photos, objects, skipped = photos + counts[0], objects + counts[1], skipped + counts[2]
+                    batch = []
+                    self.save_checkpoint(checkpoint, root, last_path)
+                    self.progress(photos, objects, skipped, errors, started)
+
+            if batch:
+                counts = loader.load(batch)
+                photos, objects, skipped = photos + counts[0], objects + counts[1], skipped + counts[2]
+            self.save_checkpoint(checkpoint, root, last_path)
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'\n{"=" * 50}'
+            f'\nTotal: {photos} photos and {objects} detections imported, '
+            f'{skipped} photos skipped (already present or invalid), {errors} errors in {elapsed:.1f}s '
+            f'({objects / elapsed * 60 if elapsed else 0:,.0f} detections/min)'
+        ))
+
+    @staticmethod
+    def save_checkpoint(path, root, last_path):
+        if path and last_path:
+            with open(path, 'w') as f:
+                f.write(os.path.relpath(last_path, root).replace(os.sep, '/'))
+
+    def progress(self, photos, objects, skipped, errors, started):
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            f'  Progress: {photos} photos, {objects} detections, {skipped} skipped, {errors} errors '
+            f'({objects / elapsed * 60 if elapsed else 0:,.0f} detections/min)'
+        )
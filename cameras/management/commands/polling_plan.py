@@ -0,0 +1,62 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from cameras.models import Camera
+from cameras.scheduling import PollingScheduler, evaluate, load_history
+
+
+class Command(BaseCommand):
+    help = 'Show how a polling budget is split between the cameras, and compare it with fixed-interval polling'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--state', type=str, help='Only cameras of this state abbreviation')
+        parser.add_argument(
+            '--budget',
+            type=float,
+            help='Polls per minute (default: one poll per camera per minute)'
+        )
+        parser.add_argument('--days', type=int, default=14, help='Days of history to rank on (default: 14)')
+        parser.add_argument('--top', type=int, default=20, help='Number of cameras to list (default: 20)')
+        parser.add_argument(
+            '--evaluate',
+            action='store_true',
+            help='Replay the last 7 days against both policies, ranked on the --days before them'
+        )
+
+    def handle(self, *args, **options):
+        queryset = Camera.objects.all()
+        if options['state']:
+            queryset = queryset.filter(city__state__abbreviation=options['state'])
+
+        history = load_history(timezone.now() - timedelta(days=options['days']), queryset=queryset)
+        budget = options['budget'] or len(history['camera_ids'])
+        scheduler = PollingScheduler(history, budget)
+        scheduler.rebalance()
+        allocation = scheduler.allocation()
+
+        names = dict(queryset.filter(id__in=[row[0] for row in allocation[:options['top']]]).values_list('id', 'name'))
+        self.stdout.write(f'Budget: {budget:.0f} polls/min over {len(allocation)} cameras\n')
+        for camera_id, interval, polls, priority in allocation[:options['top']]:
+            self.stdout.write(f'  {names[camera_id]:<48} every {interval:6.0f}s  {polls:5.2f}/min  priority {priority:.3f}')
+        if allocation:
+            intervals = sorted(row[1] for row in allocation)
+            self.stdout.write(
+                f'\nInterval min {intervals[0]:.0f}s, median {intervals[len(intervals) // 2]:.0f}s, '
+                f'max {intervals[-1]:.0f}s'
+            )
+
+        if options['evaluate']:
+            result = evaluate(queryset=queryset, budget=budget, train_days=options['days'])
+            for policy in ('fixed', 'adaptive'):
+                polls, score = result[policy]['polls'], result[policy]['score']
+                self.stdout.write(
+                    f'{policy:>8}: {polls} polls, weighted detections {score:.0f} '
+                    f'({score / polls if polls else 0:.4f} per poll)'
+                )
+            fixed = result['fixed']['score']
+            if fixed:
+                gain = result['adaptive']['score'] / fixed - 1
+                style = self.style.SUCCESS if gain > 0 else self.style.WARNING
+                self.stdout.write(style(f'Adaptive polling: {gain:+.1%} weighted detections'))
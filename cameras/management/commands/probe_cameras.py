@@ -0,0 +1,57 @@
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+
+from cameras.models import Camera
+from cameras.probe import PROBE_LATENCY, CameraProber, probe_cameras
+
+
+class Command(BaseCommand):
+    help = 'Probe camera playlists and update Camera.last_connection_status'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--state', type=str, help='Only probe cameras of this state abbreviation')
+        parser.add_argument('--concurrency', type=int, default=500, help='Requests in flight (default: 500)')
+        parser.add_argument('--per-host', type=int, default=8, help='Requests in flight per host (default: 8)')
+        parser.add_argument('--timeout', type=float, default=5.0, help='Timeout per attempt in seconds (default: 5)')
+        parser.add_argument('--retries', type=int, default=2, help='Retries per camera (default: 2)')
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=0,
+            help='Seconds between the start of two cycles; probe once when 0 (default: 0)'
+        )
+
+    def handle(self, *args, **options):
+        prober = CameraProber(
+            concurrency=options['concurrency'],
+            per_host=options['per_host'],
+            timeout=options['timeout'],
+            retries=options['retries'],
+        )
+        queryset = Camera.objects.all()
+        if options['state']:
+            queryset = queryset.filter(city__state__abbreviation=options['state'])
+
+        while True:
+            started = time.monotonic()
+            latencies = PROBE_LATENCY.snapshot()
+            results, changed = probe_cameras(prober, queryset)
+            elapsed = time.monotonic() - started
+
+            connected = sum(result.connected for result in results)
+            errors = Counter(result.error for result in results if not result.connected)
+            self.stdout.write(self.style.SUCCESS(
+                f'Probed {len(results)} cameras in {elapsed:.1f}s: '
+                f'{connected} connected, {len(results) - connected} disconnected, {changed} changed'
+            ))
+            for error, count in errors.most_common(5):
+                self.stdout.write(f'  {error}: {count}')
+            # Quantiles of this cycle only.
+            p50, p95, p99 = (PROBE_LATENCY.quantile(q, since=latencies) for q in (0.5, 0.95, 0.99))
+            self.stdout.write(f'  Latency p50 <= {p50}s, p95 <= {p95}s, p99 <= {p99}s')
+
+            if not options['interval']:
+                break
+            time.sleep(max(options['interval'] - elapsed, 0))
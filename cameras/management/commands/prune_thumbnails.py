@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from cameras import thumbnails
+
+
+class Command(BaseCommand):
+    help = 'Delete the least recently served thumbnails until the cache fits in its disk budget'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--budget',
+            type=int,
+            default=settings.THUMBNAIL_CACHE_BYTES,
+            help='Disk budget in bytes (default: THUMBNAIL_CACHE_BYTES)'
+        )
+
+    def handle(self, *args, **options):
+        result = thumbnails.prune(options['budget'])
+        if result is None:
+            self.stdout.write(self.style.WARNING('Nothing to prune: remote storage, or a prune is already running'))
+            return
+        kept, deleted, deleted_bytes = result
+        self.stdout.write(self.style.SUCCESS(
+            f'Deleted {deleted} thumbnails ({deleted_bytes / 2 ** 20:.1f} MiB), '
+            f'{kept / 2 ** 20:.1f} MiB kept'
+        ))
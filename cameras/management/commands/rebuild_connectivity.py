@@ -0,0 +1,44 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import BooleanField, ExpressionWrapper
+from django.utils import timezone
+
+from cameras.connectivity import ConnectivityTracker
+from cameras.managers import CONNECTED_PHOTO
+from cameras.models import CameraConnectivity, Photo
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute the streaming connectivity statistics of the cameras by replaying their recent '
+        'photos, e.g. to initialize them; the capture keeps them up to date afterwards'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=14, help='Days of photos replayed (default: 14)')
+        parser.add_argument('--chunk-size', type=int, default=10_000, help='Photos read at a time (default: 10000)')
+
+    def handle(self, *args, **options):
+        since = timezone.now() - timedelta(days=options['days'])
+        photos = (
+            Photo.objects
+            .filter(captured_at__gte=since)
+            .order_by('captured_at')
+            .values_list('camera_id', ExpressionWrapper(CONNECTED_PHOTO, output_field=BooleanField()), 'captured_at')
+        )
+        # Past outages are not recorded as events.
+        tracker = ConnectivityTracker(events=False)
+        count = 0
+        for camera_id, connected, captured_at in photos.iterator(chunk_size=options['chunk_size']):
+            tracker.observe(camera_id, connected, captured_at)
+            count += 1
+
+        with transaction.atomic():
+            CameraConnectivity.objects.all().delete()
+            tracker.save()
+        down = sum(not stats.connected for stats in tracker.stats.values())
+        self.stdout.write(self.style.SUCCESS(
+            f'Replayed {count} photos since {since:%Y-%m-%d}: {len(tracker.stats)} cameras, {down} down'
+        ))
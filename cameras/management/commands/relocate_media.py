@@ -0,0 +1,87 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from cameras import storage
+from cameras.models import DetectedObject, Photo
+from cameras.reference import references
+
+
+class Command(BaseCommand):
+    help = 'Move existing photos and object crops to the sharded storage layout and rewrite their paths'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--model',
+            choices=['photos', 'objects', 'all'],
+            default='all',
+            help='Which files to relocate (default: all)'
+        )
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows per batch (default: 1000)')
+        parser.add_argument('--workers', type=int, default=16, help='Parallel file moves (default: 16)')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the files to relocate')
+
+    def handle(self, *args, **options):
+        self.batch_size = options['batch_size']
+        self.dry_run = options['dry_run']
+
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            self.executor = executor
+            if options['model'] in ('photos', 'all'):
+                self.relocate(
+                    'photos',
+                    Photo.objects.exclude(file='').only('id', 'file', 'captured_at', 'camera_id'),
+                    'file',
+                    self.photo_name,
+                )
+            if options['model'] in ('objects', 'all'):
+                self.relocate(
+                    'objects',
+                    DetectedObject.objects.exclude(image='').only('id', 'name', 'image', 'photo_id'),
+                    'image',
+                    lambda obj: storage.object_name(obj.name, obj.photo_id, obj.pk),
+                )
+
+    def photo_name(self, photo):
+        reference = references.get(photo.camera_id)
+        return storage.photo_name(reference.state_slug, reference.slug, photo.captured_at, photo.pk)
+
+    def relocate(self, label, queryset, field, new_name):
+        self.stdout.write(f'\nRelocating {label}...')
+        moved = skipped = missing = 0
+        last_id = 0
+
+        while True:
+            rows = list(queryset.filter(id__gt=last_id).order_by('id')[:self.batch_size])
+            if not rows:
+                break
+            last_id = rows[-1].id
+
+            pending = []
+            for row in rows:
+                name = getattr(row, field).name
+                if storage.is_sharded(name):
+                    skipped += 1
+                else:
+                    pending.append((row, name, new_name(row)))
+            if self.dry_run:
+                moved += len(pending)
+                continue
+
+            results = self.executor.map(lambda item: storage.move(item[1], item[2]), pending)
+            updated = []
+            for (row, _, _), name in zip(pending, results):
+                if name is None:
+                    missing += 1
+                    continue
+                # Set the name directly so the ImageField doesn't open the file.
+                row.__dict__[field] = name
+                updated.append(row)
+            queryset.model.objects.bulk_update(updated, [field], batch_size=self.batch_size)
+            moved += len(updated)
+            self.stdout.write(f'  Progress: {moved} moved, {skipped} already sharded, {missing} missing')
+
+        verb = 'to move' if self.dry_run else 'moved'
+        self.stdout.write(self.style.SUCCESS(
+            f'{label.title()}: {moved} {verb}, {skipped} already sharded, {missing} missing'
+        ))
@@ -0,0 +1,60 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from cameras import inference
+
+
+class Command(BaseCommand):
+    help = 'Run the detector workers on the photos waiting for detection'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 4,
+            help='Detector processes (default: CPU count)'
+        )
+        parser.add_argument('--batch-size', type=int, default=8, help='Photos per micro-batch (default: 8)')
+        parser.add_argument('--flush-size', type=int, default=500, help='Photos written per transaction (default: 500)')
+        parser.add_argument('--detector', type=str, help='Dotted path of the detector (default: settings.DETECTOR)')
+        parser.add_argument('--once', action='store_true', help='Exit when no photo is pending')
+        parser.add_argument(
+            '--crop-queue',
+            type=str,
+            help='Queue a crop job for the photos with detections in this job queue (see run_jobs)'
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        pool = inference.InferencePool(
+            workers=options['workers'],
+            batch_size=options['batch_size'],
+            detector=options['detector'],
+            flush_size=options['flush_size'],
+            crop_queue=options['crop_queue'],
+        )
+        try:
+            with pool:
+                processed = pool.run(once=options['once'])
+        except KeyboardInterrupt:
+            processed = inference.PHOTOS.value
+        elapsed = time.monotonic() - started
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Processed {processed} photos, {inference.DETECTIONS.value} detections '
+            f'in {elapsed:.1f}s ({processed / elapsed if elapsed else 0:.1f} photos/s)'
+        ))
+        for name, histogram in (
+            ('fetch', inference.FETCH_SECONDS),
+            ('load', inference.LOAD_SECONDS),
+            ('detect', inference.DETECT_SECONDS),
+            ('write', inference.WRITE_SECONDS),
+            ('batch latency', inference.BATCH_LATENCY),
+        ):
+            if histogram.count:
+                self.stdout.write(
+                    f'  {name:<14} {histogram.count:>6} x  mean {histogram.sum / histogram.count:.3f}s  '
+                    f'p95 <= {histogram.quantile(0.95)}s'
+                )
@@ -0,0 +1,56 @@
+from itertools import groupby
+
+from django.core.management.base import BaseCommand
+
+from cameras.models import Camera, DetectedObject
+from cameras.tracking import Tracker
+
+
+class Command(BaseCommand):
+    help = 'Assign track ids to the detected objects that have none, camera by camera in capture order'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threshold', type=float, default=0.3, help='Minimum IoU to continue a track (default: 0.3)')
+        parser.add_argument(
+            '--max-gap',
+            type=float,
+            default=300,
+            help='Seconds after which an unseen track is closed (default: 300)'
+        )
+        parser.add_argument('--batch-size', type=int, default=5000, help='Objects per update (default: 5000)')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        total = tracks = 0
+
+        for camera_id in Camera.objects.order_by('id').values_list('id', flat=True):
+            tracker = Tracker(threshold=options['threshold'], max_gap=options['max_gap'])
+            rows = (
+                DetectedObject.objects
+                .filter(photo__camera_id=camera_id, track_id__isnull=True)
+                .order_by('captured_at', 'photo_id', 'id')
+                .values_list('id', 'photo_id', 'captured_at', 'name', 'x', 'y', 'width', 'height')
+                .iterator(chunk_size=batch_size)
+            )
+            pending = []
+            for _, photo_rows in groupby(rows, key=lambda row: row[1]):
+                photo_rows = list(photo_rows)
+                ids = [row[0] for row in photo_rows]
+                track_ids = tracker.update(
+                    camera_id,
+                    photo_rows[0][2],
+                    [row[3] for row in photo_rows],
+                    [row[4:] for row in photo_rows],
+                    ids,
+                )
+                for object_id, track_id in zip(ids, track_ids.tolist()):
+                    pending.append(DetectedObject(id=object_id, track_id=track_id))
+                    tracks += object_id == track_id
+                if len(pending) >= batch_size:
+                    DetectedObject.objects.bulk_update(pending, ['track_id'], batch_size=batch_size)
+                    total += len(pending)
+                    pending = []
+            DetectedObject.objects.bulk_update(pending, ['track_id'], batch_size=batch_size)
+            total += len(pending)
+
+        self.stdout.write(self.style.SUCCESS(f'Tracked {total} objects into {tracks} tracks'))
@@ -2,6 +2,9 @@ from django.conf import settings
 from django.db.models import Q
 from django.db.models.manager import Manager
 
+# Photos taken while their camera was reachable: a stored frame, or a stale duplicate.
+CONNECTED_PHOTO = ~Q(file="") | Q(is_stale=True)
+
 
 class DetectedObjectManager(Manager):
     def above_confidence_level(self):
@@ -1,13 +1,16 @@
+from datetime import timedelta
+
 from django.db import models
-from django.contrib.postgres.indexes import BrinIndex
+from django.contrib.postgres.indexes import BrinIndex, GinIndex, OpClass
+from django.db.models.functions import Upper
 from django.utils.timezone import now
 from django.utils import timezone
 
+from core.timezones import US_TIMEZONE_CHOICES
+from . import storage
 from .expressions import ConvertToTimezone
 from .managers import DetectedObjectManager
 
-import pytz
-
 
 class Camera(models.Model):
     """
@@ -17,9 +20,11 @@ class Camera(models.Model):
     name = models.CharField(max_length=128, unique=True)
     slug = models.SlugField(max_length=128, unique=True)
     url = models.URLField()
+    preview_url = models.URLField(blank=True, default="")
     latitude = models.FloatField(blank=True, default=0.0)
     longitude = models.FloatField(blank=True, default=0.0)
     last_connection_status = models.BooleanField(default=False, blank=True, editable=False)
+    is_frozen = models.BooleanField(default=False, blank=True, editable=False)
     road = models.ForeignKey(
         to="states.Road",
         on_delete=models.CASCADE,
@@ -31,10 +36,29 @@ class Camera(models.Model):
         related_name="cameras",
     )
 
+    class Meta:
+        indexes = [
+            # Case-insensitive substring and similarity search (see cameras.search).
+            GinIndex(OpClass(Upper("name"), name="gin_trgm_ops"), name="camera_name_trgm_idx"),
+        ]
+
     def __str__(self) -> str:
         return self.name
 
 
+class ReferenceVersion(models.Model):
+    """
+    Single row counting the changes to the reference data (states, cities, roads and cameras).
+
+    Bumped by ``cameras.reference.bump_version`` to invalidate the reference caches.
+    """
+
+    version = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self) -> str:
+        return str(self.version)
+
+
 def get_video_upload_path(instance, filename):
     """
     Returns the upload path for a video file.
@@ -76,8 +100,15 @@ def get_photo_upload_path(instance, filename):
     :param filename: The original filename.
     :return: The upload path as a string.
     """
-    now = timezone.now().strftime("%Y%m%d-%H%M%S.jpg")
-    return f"photos/{instance.camera.city.state.slug}/{instance.camera.city.slug}/{instance.camera.slug}/{now}"
+    from .reference import references
+
+    reference = references.get(instance.camera_id)
+    return storage.photo_name(
+        reference.state_slug,
+        reference.slug,
+        instance.captured_at or timezone.now(),
+        instance.pk,
+    )
 
 
 def get_default_system_confidence_value():
@@ -110,7 +141,7 @@ class Photo(models.Model):
     )
     timezone = models.CharField(
         max_length=17,
-        choices=[(tz, tz) for tz in filter(lambda t: t.startswith("US/"), pytz.all_timezones)],
+        choices=US_TIMEZONE_CHOICES,
     )
     timezone.empty_strings_allowed = False
     road = models.ForeignKey(
@@ -143,10 +174,20 @@ class Photo(models.Model):
     deer_count_above_system_confidence = models.PositiveSmallIntegerField(blank=True, default=0, editable=False)
     deer_count_below_system_confidence = models.PositiveSmallIntegerField(blank=True, default=0, editable=False)
     has_detected_objects = models.BooleanField(blank=True, default=False, editable=False)
+    is_stale = models.BooleanField(blank=True, default=False, editable=False)
 
     class Meta:
         indexes = [
             BrinIndex(fields=["local_created_at"]),
+            models.Index(
+                fields=["id"],
+                condition=models.Q(detected_at__isnull=True),
+                name="photo_pending_detection_idx",
+            ),
+        ]
+        constraints = [
+            # Also the index of the photos of a camera by time.
+            models.UniqueConstraint(fields=["camera", "captured_at"], name="photo_camera_captured_uniq"),
         ]
 
     def __str__(self) -> str:
@@ -162,9 +203,11 @@ class Photo(models.Model):
         """
         Checks if the camera is connected at that moment.
 
+        A stale photo has no file but its camera was reachable, serving a frozen frame.
+
         :return: Boolean indicating whether the camera was connected or not.
         """
-        return bool(self.file)
+        return bool(self.file) or self.is_stale
 
 
 def get_detected_object_upload_path(instance, filename):
@@ -175,7 +218,7 @@ def get_detected_object_upload_path(instance, filename):
     :param filename: The original filename.
     :return: The upload path as a string.
     """
-    return f"objects/{instance.name}/{instance.photo.id}.jpg"
+    return storage.object_name(instance.name, instance.photo_id, instance.pk)
 
 
 class DetectedObject(models.Model):
@@ -212,6 +255,9 @@ class DetectedObject(models.Model):
         The timestamp when the detection was created. Automatically set to the current date and time on creation.
     deleted_at : DateTimeField
         The timestamp when the detected object image was deleted.
+    track_id : BigIntegerField
+        The id of the first detection of the same object in the consecutive photos of the camera.
+        Detections sharing a track id are one unique object.
 
     Methods
     -------
@@ -245,7 +291,7 @@ class DetectedObject(models.Model):
     height = models.FloatField()
     timezone = models.CharField(
         max_length=17,
-        choices=[(tz, tz) for tz in filter(lambda t: t.startswith("US/"), pytz.all_timezones)],
+        choices=US_TIMEZONE_CHOICES,
     )
     timezone.empty_strings_allowed = False
     captured_at = models.DateTimeField(default=now)
@@ -261,6 +307,7 @@ class DetectedObject(models.Model):
         db_persist=True,
     )
     deleted_at = models.DateTimeField(null=True, blank=True, default=None)
+    track_id = models.BigIntegerField(null=True, blank=True, default=None, editable=False)
 
     objects = DetectedObjectManager()
 
@@ -269,6 +316,8 @@ class DetectedObject(models.Model):
         verbose_name_plural = "objects"
         indexes = [
             BrinIndex(fields=["local_created_at"]),
+            # Range scans of the incremental aggregations (see analytics.heatmap).
+            BrinIndex(fields=["created_at"], name="detectedobject_created_brin"),
             models.Index(fields=["name", "conf"], name="detectedobject_name_conf_idx"),
         ]
 
@@ -282,3 +331,88 @@ class DetectedObject(models.Model):
             The name of the detected object with its ID.
         """
         return f"{self.name.title()} {self.id}"
+
+
+class CameraConnectivity(models.Model):
+    """
+    Streaming connectivity statistics of a camera, updated in constant time per photo by
+    ``cameras.connectivity.ConnectivityTracker``.
+
+    The uptimes are exponentially time-decayed shares of the time the camera was connected,
+    with time constants of 1 hour, 24 hours and 7 days, as of ``observed_at``. ``up_seconds``
+    and ``failures`` are decayed over 7 days; their ratio is the mean time between failures.
+    """
+
+    camera = models.OneToOneField(
+        to=Camera,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="connectivity",
+    )
+    connected = models.BooleanField(default=False)
+    observed_at = models.DateTimeField()
+    changed_at = models.DateTimeField()
+    uptime_1h = models.FloatField(default=0.0)
+    uptime_24h = models.FloatField(default=0.0)
+    uptime_7d = models.FloatField(default=0.0)
+    up_seconds = models.FloatField(default=0.0)
+    failures = models.FloatField(default=0.0)
+
+    class Meta:
+        verbose_name_plural = "camera connectivity"
+
+    def __str__(self) -> str:
+        return f"{self.camera_id} - {'connected' if self.connected else 'disconnected'}"
+
+    @property
+    def outage_started_at(self):
+        """
+        Returns the start of the current outage, or None when the camera is connected.
+        """
+        return None if self.connected else self.changed_at
+
+    @property
+    def mtbf(self):
+        """
+        Returns the mean time between failures over the last week or so, or None without failures.
+        """
+        if self.failures < 1e-3:
+            return None
+        return timedelta(seconds=self.up_seconds / self.failures)
+
+
+class OutageEvent(models.Model):
+    """
+    An outage of a camera, or of most cameras of a city, raised by the ``ConnectivityTracker``.
+    """
+
+    class Scope(models.TextChoices):
+        CAMERA = "camera", "Camera"
+        CITY = "city", "City"
+
+    scope = models.CharField(max_length=6, choices=Scope.choices)
+    camera = models.ForeignKey(
+        to=Camera,
+        on_delete=models.CASCADE,
+        related_name="outages",
+        null=True,
+        blank=True,
+    )
+    city = models.ForeignKey(
+        to="states.City",
+        on_delete=models.CASCADE,
+        related_name="outages",
+    )
+    cameras_down = models.PositiveIntegerField(default=1)
+    started_at = models.DateTimeField()
+    ended_at = models.DateTimeField(null=True, blank=True, default=None)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["-started_at"], name="outageevent_started_idx"),
+            models.Index(fields=["scope"], condition=models.Q(ended_at__isnull=True), name="outageevent_open_idx"),
+        ]
+
+    def __str__(self) -> str:
+        subject = self.camera_id if self.scope == self.Scope.CAMERA else self.city_id
+        return f"{self.scope} {subject} - {self.started_at}"
@@ -0,0 +1,138 @@
+"""
+Asynchronous health prober for camera HLS playlists.
+
+Every camera ``url`` is requested once per cycle over a shared ``aiohttp`` session, so
+connections to the same DOT host are reused. Requests are limited globally and per host,
+failed attempts are retried with jittered exponential backoff, and the results of a whole
+cycle are written back with a single ``bulk_update``.
+"""
+import asyncio
+import random
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from core import metrics
+from .models import Camera
+
+PROBE_LATENCY = metrics.histogram(
+    "camera_probe_latency_seconds",
+    "Time of a single attempt to fetch a camera playlist.",
+)
+PROBES = metrics.counter("camera_probes_total", "Camera playlists probed.")
+PROBE_FAILURES = metrics.counter("camera_probe_failures_total", "Camera playlists that could not be fetched.")
+
+
+@dataclass(frozen=True)
+class ProbeResult:
+    camera_id: int
+    connected: bool
+    latency: float
+    attempts: int
+    error: str = ""
+
+
+class CameraProber:
+    """
+    Probes camera playlists concurrently.
+
+    :param concurrency: Maximum number of requests in flight.
+    :param per_host: Maximum number of requests in flight to a single host.
+    :param timeout: Timeout of a single attempt in seconds.
+    :param retries: Number of retries after a failed attempt.
+    :param backoff: Base delay of the exponential backoff in seconds.
+    """
+
+    def __init__(self, concurrency=500, per_host=8, timeout=5.0, retries=2, backoff=0.5):
+        self.concurrency = concurrency
+        self.per_host = per_host
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+
+    def session(self):
+        connector = aiohttp.TCPConnector(
+            limit=self.concurrency,
+            limit_per_host=self.per_host,
+            ttl_dns_cache=300,
+        )
+        return aiohttp.ClientSession(connector=connector)
+
+    async def probe(self, session, limits, camera_id, url):
+        """
+        Fetches a single playlist, retrying on failure.
+
+        :return: A ``ProbeResult``.
+        """
+        host_limit, global_limit = limits
+        started = time.monotonic()
+        error = ""
+        for attempt in range(self.retries + 1):
+            if attempt:
+                # Full jitter keeps retries to a flapping host from arriving in waves.
+                await asyncio.sleep(random.uniform(0, self.backoff * 2 ** (attempt - 1)))
+            async with host_limit, global_limit:
+                attempt_started = time.monotonic()
+                try:
+                    async with asyncio.timeout(self.timeout):
+                        async with session.get(url) as response:
+                            if response.status == 200:
+                                body = await response.content.read(7)
+                                error = "" if body == b"#EXTM3U" else "not a playlist"
+                            else:
+                                error = f"HTTP {response.status}"
+                except (aiohttp.ClientError, TimeoutError) as e:
+                    error = type(e).__name__
+                    status = None
+                else:
+                    status = response.status
+                PROBE_LATENCY.observe(time.monotonic() - attempt_started)
+            if not error or (status is not None and status < 500):
+                break
+
+        PROBES.inc()
+        if error:
+            PROBE_FAILURES.inc()
+        return ProbeResult(camera_id, not error, time.monotonic() - started, attempt + 1, error)
+
+    async def run(self, cameras):
+        """
+        Probes every camera once.
+
+        :param cameras: An iterable of ``(camera_id, url)`` pairs.
+        :return: A list of ``ProbeResult``.
+        """
+        global_limit = asyncio.Semaphore(self.concurrency)
+        host_limits = defaultdict(lambda: asyncio.Semaphore(self.per_host))
+        async with self.session() as session:
+            return await asyncio.gather(*(
+                self.probe(session, (host_limits[urlsplit(url).netloc], global_limit), camera_id, url)
+                for camera_id, url in cameras
+            ))
+
+
+def probe_cameras(prober, queryset=None):
+    """
+    Runs one probe cycle and stores the results in ``Camera.last_connection_status``.
+
+    :param prober: A ``CameraProber``.
+    :param queryset: The cameras to probe, all of them by default.
+    :return: The list of ``ProbeResult`` and the number of cameras whose status changed.
+    """
+    if queryset is None:
+        queryset = Camera.objects.all()
+    cameras = {camera.id: camera for camera in queryset.only("id", "url", "last_connection_status")}
+
+    results = asyncio.run(prober.run((camera.id, camera.url) for camera in cameras.values()))
+
+    changed = []
+    for result in results:
+        camera = cameras[result.camera_id]
+        if camera.last_connection_status != result.connected:
+            camera.last_connection_status = result.connected
+            changed.append(camera)
+    Camera.objects.bulk_update(changed, ["last_connection_status"], batch_size=1000)
+    return results, len(changed)
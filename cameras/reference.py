@@ -0,0 +1,125 @@
+"""
+Process-local cache of the reference data of the cameras.
+
+The hot write paths (capture, inference, imports) need the state, city, road, timezone and
+slugs of a camera for every photo. ``references`` keeps them as one ``CameraReference``
+tuple per camera id, loaded for all cameras in a single query on the first miss.
+
+The cache is dropped when ``ReferenceVersion`` changes. The import commands and the admin
+bump it through ``bump_version``, and every process checks it at most once every
+``check_interval`` seconds, so a lookup normally runs no query at all.
+"""
+import threading
+import time
+from collections import namedtuple
+
+from django.db.models import F
+
+from .models import Camera, ReferenceVersion
+
+CameraReference = namedtuple(
+    "CameraReference",
+    ["id", "slug", "state_id", "state_slug", "city_id", "city_slug", "road_id", "timezone"],
+)
+
+FIELDS = ("id", "slug", "city__state_id", "city__state__slug", "city_id", "city__slug", "road_id", "city__timezone")
+
+
+def current_version():
+    return ReferenceVersion.objects.filter(pk=1).values_list("version", flat=True).first() or 0
+
+
+def bump_version():
+    """
+    Invalidates the reference caches of every process.
+    """
+    if not ReferenceVersion.objects.filter(pk=1).update(version=F("version") + 1):
+        ReferenceVersion.objects.get_or_create(pk=1, defaults={"version": 1})
+    references.expire()
+
+
+class ReferenceCache:
+    """
+    Read-through cache of ``CameraReference`` by camera id.
+
+    :param check_interval: Seconds between two checks of the reference version.
+    """
+
+    def __init__(self, check_interval=30.0):
+        self.check_interval = check_interval
+        self._cameras = {}
+        self._complete = False
+        self._version = None
+        self._checked_at = float("-inf")
+        self._lock = threading.Lock()
+
+    def expire(self):
+        """
+        Makes the next lookup check the reference version.
+        """
+        self._checked_at = float("-inf")
+
+    def _check_version(self):
+        if time.monotonic() - self._checked_at < self.check_interval:
+            return
+        version = current_version()
+        self._checked_at = time.monotonic()
+        if version != self._version:
+            self._cameras = {}
+            self._complete = False
+            self._version = version
+
+    def get(self, camera_id):
+        """
+        Returns the ``CameraReference`` of a camera.
+
+        :raises Camera.DoesNotExist: When there is no such camera.
+        """
+        with self._lock:
+            self._check_version()
+            reference = self._cameras.get(camera_id)
+            if reference is not None:
+                return reference
+
+            if not self._complete:
+                self._load_all()
+            else:
+                # A camera created since the cache was loaded, without a version bump.
+                self._cameras.update(
+                    (row[0], CameraReference(*row))
+                    for row in Camera.objects.filter(pk=camera_id).values_list(*FIELDS)
+                )
+
+            reference = self._cameras.get(camera_id)
+            if reference is None:
+                raise Camera.DoesNotExist(f"Camera {camera_id} does not exist.")
+            return reference
+
+    def _load_all(self):
+        self._cameras = {row[0]: CameraReference(*row) for row in Camera.objects.values_list(*FIELDS)}
+        self._complete = True
+
+    def all(self):
+        """
+        Returns the ``CameraReference`` of every camera.
+        """
+        with self._lock:
+            self._check_version()
+            if not self._complete:
+                self._load_all()
+            return list(self._cameras.values())
+
+    def photo_fields(self, camera_id):
+        """
+        Returns the fields a ``Photo`` of the camera copies from its reference data.
+        """
+        reference = self.get(camera_id)
+        return {
+            "state_id": reference.state_id,
+            "city_id": reference.city_id,
+            "road_id": reference.road_id,
+            "timezone": reference.timezone,
+        }
+
+
+references = ReferenceCache()
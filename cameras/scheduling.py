@@ -0,0 +1,372 @@
+"""
+Adaptive polling priorities.
+
+Each camera gets a priority from three signals measured over the recent photos:
+
+* its detection rate, with detections weighted per class by ``CLASS_WEIGHTS`` (deer first),
+* how that rate varies with the local hour of day, taken from ``local_captured_at``,
+* how often it was reachable.
+
+A fixed polling budget (polls per minute) is split between the cameras in proportion to
+their priority, within ``[min_interval, max_interval]``. The due times are kept in a heap;
+when the priority of a camera changes only its own entry is replaced, so re-ranking after
+a new observation is ``O(log n)``.
+"""
+import heapq
+import zoneinfo
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+
+import numpy as np
+from django.db.models import Count, Sum
+from django.db.models.functions import ExtractHour
+from django.utils import timezone
+
+from .managers import CONNECTED_PHOTO
+from .models import Camera, DetectedObject, Photo
+
+CLASS_WEIGHTS = {
+    DetectedObject.Name.DEER: 10.0,
+    DetectedObject.Name.PERSON: 1.0,
+    DetectedObject.Name.TRUCK: 0.2,
+    DetectedObject.Name.CAR: 0.1,
+}
+
+# Pseudo-counts smoothing the rates of cameras with little history towards the mean.
+PRIOR_PHOTOS = 50
+PRIOR_HOURLY = 1.0
+# Unreachable cameras keep this share of their priority so their recovery is noticed.
+MIN_UPTIME_WEIGHT = 0.1
+
+
+def load_history(since, until=None, queryset=None):
+    """
+    Aggregates the photos taken since ``since`` per camera and local hour of day.
+
+    :return: A dict with the camera ids and their timezones, and ``photos``, ``connected``
+        and ``weighted`` arrays of shape ``(cameras, 24)``.
+    """
+    if queryset is None:
+        queryset = Camera.objects.all()
+    cameras = list(queryset.order_by("id").values_list("id", "city__timezone"))
+    camera_ids = np.array([camera_id for camera_id, _ in cameras], dtype=np.int64)
+    shape = (len(cameras), 24)
+    history = {
+        "camera_ids": camera_ids,
+        "timezones": [tz for _, tz in cameras],
+        "photos": np.zeros(shape),
+        "connected": np.zeros(shape),
+        "weighted": np.zeros(shape),
+    }
+    if not cameras:
+        return history
+
+    photos = Photo.objects.filter(camera__in=queryset, captured_at__gte=since, deleted_at__isnull=True)
+    if until is not None:
+        photos = photos.filter(captured_at__lt=until)
+    rows = list(
+        photos
+        .values("camera_id", hour=ExtractHour("local_captured_at", tzinfo=dt_timezone.utc))
+        .annotate(
+            photo_count=Count("id"),
+            connected_count=Count("id", filter=CONNECTED_PHOTO),
+            **{name: Sum(f"{name}_count_above_system_confidence") for name in CLASS_WEIGHTS},
+        )
+        .order_by()
+    )
+    if not rows:
+        return history
+
+    index = np.searchsorted(camera_ids, [row["camera_id"] for row in rows])
+    hours = np.array([row["hour"] for row in rows])
+    np.add.at(history["photos"], (index, hours), [row["photo_count"] for row in rows])
+    np.add.at(history["connected"], (index, hours), [row["connected_count"] for row in rows])
+    weighted = [sum(row[name] * weight for name, weight in CLASS_WEIGHTS.items()) for row in rows]
+    np.add.at(history["weighted"], (index, hours), weighted)
+    return history
+
+
+def hottest(history, count):
+    """
+    Returns the ids of the ``count`` cameras with the most weighted detections in ``history``.
+    """
+    if count <= 0:
+        return []
+    totals = history["weighted"].sum(axis=1)
+    order = np.argsort(-totals, kind="stable")[:count]
+    return [int(camera_id) for camera_id in history["camera_ids"][order]]
+
+
+def local_hours(timezones, now):
+    """
+    Returns the current local hour of day for every timezone name.
+    """
+    hours = {}
+    for tz in set(timezones):
+        try:
+            hours[tz] = now.astimezone(zoneinfo.ZoneInfo(tz)).hour
+        except (zoneinfo.ZoneInfoNotFoundError, ValueError):
+            hours[tz] = now.astimezone(dt_timezone.utc).hour
+    return np.array([hours[tz] for tz in timezones], dtype=np.int64)
+
+
+class PollingScheduler:
+    """
+    Assigns polling intervals to cameras and hands out the cameras that are due.
+
+    :param history: The result of ``load_history``.
+    :param budget: Total number of polls per minute.
+    :param min_interval: Shortest polling interval in seconds.
+    :param max_interval: Longest polling interval in seconds.
+    :param decay: Weight of the history when a new observation of a camera comes in.
+    """
+
+    def __init__(self, history, budget, min_interval=30.0, max_interval=900.0, decay=0.98):
+        self.camera_ids = history["camera_ids"]
+        self.timezones = history["timezones"]
+        self.index = {int(camera_id): i for i, camera_id in enumerate(self.camera_ids)}
+        self.budget = budget
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.decay = decay
+
+        photos = history["photos"]
+        total_photos = photos.sum(axis=1)
+        total_weighted = history["weighted"].sum(axis=1)
+        mean_rate = total_weighted.sum() / max(total_photos.sum(), 1.0)
+        # Smoothed weighted detections per photo.
+        self.rate = (total_weighted + PRIOR_PHOTOS * mean_rate) / (total_photos + PRIOR_PHOTOS)
+        # Hour-of-day profile relative to the camera's own mean.
+        hourly = (history["weighted"] + PRIOR_HOURLY) / (photos + PRIOR_HOURLY / max(mean_rate, 1e-6))
+        self.hourly = hourly / hourly.mean(axis=1, keepdims=True)
+        self.uptime = (history["connected"].sum(axis=1) + 1.0) / (total_photos + 1.0)
+
+        count = len(self.camera_ids)
+        self.current_priorities = np.zeros(count)
+        self.intervals = np.full(count, self.max_interval)
+        # Polls per minute per unit of priority, as of the last rebalance.
+        self.scale = 0.0
+        self.last_polled = np.zeros(count)
+        self.versions = np.zeros(count, dtype=np.int64)
+        self.heap = []
+
+    def priorities(self, now=None):
+        now = now or timezone.now()
+        hours = local_hours(self.timezones, now)
+        factor = self.hourly[np.arange(len(self.camera_ids)), hours] if len(self.camera_ids) else 0.0
+        return self.rate * factor * np.maximum(self.uptime, MIN_UPTIME_WEIGHT)
+
+    def priority(self, i, now):
+        hour = local_hours([self.timezones[i]], now)[0]
+        return self.rate[i] * self.hourly[i, hour] * max(self.uptime[i], MIN_UPTIME_WEIGHT)
+
+    def allocate(self, priorities):
+        """
+        Splits the budget in proportion to the priorities, clamped to the interval bounds.
+
+        :return: The polling interval of every camera in seconds.
+        """
+        return self.intervals_at(priorities, self.scale_for(priorities))
+
+    def scale_for(self, priorities):
+        """
+        Returns the scale at which the polls of ``intervals_at`` spend exactly the budget, or
+        as much of it as the interval bounds allow.
+        """
+        count = len(priorities)
+        if not count:
+            return 0.0
+        low, high = 60.0 / self.max_interval, 60.0 / self.min_interval
+        budget = min(max(self.budget, count * low), count * high)
+        weights = np.maximum(priorities, 1e-12)
+        # The rates are clip(scale * priority, low, high); their sum grows with the scale,
+        # so the scale spending exactly the budget is found by bisection.
+        lower, upper = 0.0, high / weights.min()
+        for _ in range(100):
+            scale = (lower + upper) / 2
+            if np.clip(scale * weights, low, high).sum() < budget:
+                lower = scale
+            else:
+                upper = scale
+        return upper
+
+    def intervals_at(self, priorities, scale):
+        """
+        Returns the polling intervals in seconds of cameras of the given priorities: ``scale``
+        polls per minute per unit of priority, within ``[min_interval, max_interval]``.
+        """
+        low, high = 60.0 / self.max_interval, 60.0 / self.min_interval
+        return 60.0 / np.clip(scale * np.maximum(priorities, 1e-12), low, high)
+
+    def rebalance(self, now=None):
+        """
+        Recomputes every interval and re-queues the cameras that are not queued yet or whose
+        interval changed by more than 10%.
+
+        :return: The number of re-queued cameras.
+        """
+        now = now or timezone.now()
+        self.current_priorities = self.priorities(now)
+        self.scale = self.scale_for(self.current_priorities)
+        intervals = self.intervals_at(self.current_priorities, self.scale)
+        changed = np.flatnonzero((np.abs(intervals - self.intervals) > 0.1 * self.intervals) | (self.versions == 0))
+        self.intervals = intervals
+        for i in changed:
+            self._push(i, now.timestamp())
+        if len(self.heap) > 4 * len(self.camera_ids):
+            self._compact()
+        return len(changed)
+
+    def _push(self, i, now):
+        self.versions[i] += 1
+        due = self.last_polled[i] + self.intervals[i] if self.last_polled[i] else now
+        heapq.heappush(self.heap, (due, int(self.versions[i]), int(i)))
+
+    def _compact(self):
+        self.heap = [entry for entry in self.heap if entry[1] == self.versions[entry[2]]]
+        heapq.heapify(self.heap)
+
+    def pop_due(self, now=None, limit=None):
+        """
+        Removes and returns the ids of the cameras due at ``now``, most overdue first.
+        """
+        now = (now or timezone.now()).timestamp()
+        due = []
+        while self.heap and self.heap[0][0] <= now and (limit is None or len(due) < limit):
+            _, version, i = heapq.heappop(self.heap)
+            if version != self.versions[i]:
+                continue
+            self.last_polled[i] = now
+            self._push(i, now)
+            due.append(int(self.camera_ids[i]))
+        return due
+
+    def observe(self, camera_id, connected, detections=None, now=None):
+        """
+        Folds a new photo of a camera into its statistics and re-queues it if its interval changed.
+
+        :param camera_id: The camera of the photo.
+        :param connected: Whether the photo has a file.
+        :param detections: The above-threshold detection counts by class name of the latest
+            photo of the camera through inference, None when there is no new one.
+        """
+        i = self.index.get(camera_id)
+        if i is None:
+            return
+        now = now or timezone.now()
+        self.uptime[i] = self.decay * self.uptime[i] + (1 - self.decay) * connected
+        if detections is not None:
+            weighted = sum(count * CLASS_WEIGHTS.get(name, 0.0) for name, count in detections.items())
+            self.rate[i] = self.decay * self.rate[i] + (1 - self.decay) * weighted
+
+        # Only this camera is re-ranked, at the scale of the last rebalance; the others keep
+        # their interval until the next one.
+        self.current_priorities[i] = self.priority(i, now)
+        if not self.scale:
+            return
+        interval = float(self.intervals_at(self.current_priorities[i], self.scale))
+        if abs(interval - self.intervals[i]) > 0.1 * self.intervals[i]:
+            self.intervals[i] = interval
+            self._push(i, now.timestamp())
+
+    def allocation(self):
+        """
+        Returns the current split of the budget, as of the last ``rebalance``.
+
+        :return: A list of ``(camera_id, interval, polls_per_minute, priority)`` tuples,
+            highest priority first.
+        """
+        priorities = self.current_priorities
+        order = np.argsort(-priorities)
+        return [
+            (int(self.camera_ids[i]), float(self.intervals[i]), 60.0 / float(self.intervals[i]), float(priorities[i]))
+            for i in order
+        ]
+
+
+def replay(history_photos, intervals, start, days, tolerance=60.0, seed=0):
+    """
+    Replays historical photos against polling intervals.
+
+    Every camera is polled at its interval for the UTC hour of day from a random phase, and
+    each poll scores the weighted detections of the latest historical photo of that camera
+    taken at most ``tolerance`` seconds earlier.
+
+    :param history_photos: A dict of camera index to ``(timestamps, weighted)`` sorted arrays.
+    :param intervals: The polling intervals in seconds, of shape ``(cameras, 24)``.
+    :param start: Replay start, a POSIX timestamp at midnight UTC.
+    :param days: Number of days to replay.
+    :return: A ``(polls, score)`` pair.
+    """
+    rng = np.random.default_rng(seed)
+    day_starts = start + 86400.0 * np.arange(days)
+    polls = 0
+    score = 0.0
+    for i, camera_intervals in enumerate(intervals):
+        phase = rng.uniform(0, 1)
+        offsets = np.concatenate([
+            np.arange(3600.0 * hour + phase * interval, 3600.0 * (hour + 1), interval)
+            for hour, interval in enumerate(camera_intervals)
+        ])
+        times = (day_starts[:, None] + offsets[None, :]).ravel()
+        polls += len(times)
+        if i not in history_photos:
+            continue
+        timestamps, weighted = history_photos[i]
+        nearest = np.searchsorted(timestamps, times, side="right") - 1
+        valid = nearest >= 0
+        valid[valid] &= times[valid] - timestamps[nearest[valid]] <= tolerance
+        score += weighted[nearest[valid]].sum()
+    return polls, score
+
+
+def load_replay_photos(camera_ids, since, until):
+    """
+    Loads the photos of a period for ``replay``.
+    """
+    index = {int(camera_id): i for i, camera_id in enumerate(camera_ids)}
+    rows = (
+        Photo.objects
+        .filter(camera_id__in=index, captured_at__gte=since, captured_at__lt=until, deleted_at__isnull=True)
+        .order_by("camera_id", "captured_at")
+        .values_list("camera_id", "captured_at", *(f"{name}_count_above_system_confidence" for name in CLASS_WEIGHTS))
+    )
+    weights = list(CLASS_WEIGHTS.values())
+    photos = {}
+    for camera_id, captured_at, *counts in rows.iterator(chunk_size=10_000):
+        timestamps, weighted = photos.setdefault(index[camera_id], ([], []))
+        timestamps.append(captured_at.timestamp())
+        weighted.append(sum(count * weight for count, weight in zip(counts, weights)))
+    return {i: (np.array(timestamps), np.array(weighted)) for i, (timestamps, weighted) in photos.items()}
+
+
+def evaluate(queryset=None, budget=None, train_days=14, test_days=7, now=None):
+    """
+    Compares adaptive and fixed-interval polling with the same budget on historical photos.
+
+    The priorities are learned on the ``train_days`` before the last ``test_days`` and the
+    photos of the latter are replayed.
+
+    :return: A dict with the polls and score of both policies.
+    """
+    now = now or timezone.now()
+    end = datetime.combine(now.date(), datetime.min.time(), dt_timezone.utc)
+    split = end - timedelta(days=test_days)
+    history = load_history(split - timedelta(days=train_days), split, queryset=queryset)
+    count = len(history["camera_ids"])
+    budget = budget or count
+    scheduler = PollingScheduler(history, budget)
+
+    adaptive = np.column_stack([
+        scheduler.allocate(scheduler.priorities(split + timedelta(hours=hour)))
+        for hour in range(24)
+    ]) if count else np.zeros((0, 24))
+    fixed = np.full((count, 24), 60.0 * count / budget)
+
+    photos = load_replay_photos(history["camera_ids"], split, end)
+    adaptive_polls, adaptive_score = replay(photos, adaptive, split.timestamp(), test_days)
+    fixed_polls, fixed_score = replay(photos, fixed, split.timestamp(), test_days)
+    return {
+        "adaptive": {"polls": adaptive_polls, "score": adaptive_score},
+        "fixed": {"polls": fixed_polls, "score": fixed_score},
+    }
@@ -0,0 +1,85 @@
+"""
+Typo-tolerant search of the cameras, roads and cities by name.
+
+The upper-cased names carry ``pg_trgm`` GIN indexes (``gin_trgm_ops``), which serve both the
+case-insensitive substring match (``UPPER(name) LIKE '%...%'``) and the trigram word
+similarity (``%>``) used here, so a search reads the index instead of scanning the table.
+Results are ranked by word similarity, which scores how well the query matches the best
+part of the name: "exit 12" ranks "I-95 at Exit 12" first, and a misspelt query still
+matches names sharing enough trigrams with it.
+
+The admins of the camera-related tables resolve the matching camera ids with ``camera_ids``
+and then filter by id, instead of joining their table to the cameras on ``icontains``.
+"""
+from django.contrib.postgres.search import TrigramWordSimilarity
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import F, Q
+from django.db.models.functions import Upper
+
+from states.models import City, Road
+from .models import Camera
+
+KINDS = ("camera", "road", "city")
+
+
+def create_trigram_extension(using=DEFAULT_DB_ALIAS, **kwargs):
+    """
+    Creates the ``pg_trgm`` extension before the tables and their indexes, on ``pre_migrate``.
+    """
+    connection = connections[using]
+    if connection.vendor != "postgresql":
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+
+
+def matching(queryset, query, field="name"):
+    """
+    Filters a queryset to the rows whose ``field`` contains or resembles the query, best match first.
+    """
+    # Both conditions are on UPPER(field), the expression of the indexes.
+    query = query.strip().upper()
+    return (
+        queryset
+        .alias(search_name=Upper(field))
+        .filter(Q(search_name__contains=query) | Q(search_name__trigram_word_similar=query))
+        .annotate(rank=TrigramWordSimilarity(query, Upper(field)))
+        .order_by("-rank", field)
+    )
+
+
+def camera_ids(query, limit=1000):
+    """
+    Returns the ids of the cameras matching the query, best match first.
+    """
+    return list(matching(Camera.objects.all(), query).values_list("id", flat=True)[:limit])
+
+
+def search(query, kinds=KINDS, state_ids=None, limit=10):
+    """
+    Searches the cameras, roads and cities by name.
+
+    :param kinds: The kinds of results to return, among ``KINDS``.
+    :param state_ids: When given, only the results in these states are returned.
+    :param limit: Maximum number of results per kind.
+    :return: A dict from kind to a list of result dicts, best match first.
+    """
+    results = {}
+    if "camera" in kinds:
+        cameras = matching(Camera.objects.all(), query)
+        if state_ids is not None:
+            cameras = cameras.filter(city__state_id__in=state_ids)
+        results["camera"] = list(
+            cameras.values("id", "name", "slug", "rank", road_name=F("road__name"), city_name=F("city__name"))[:limit]
+        )
+    if "road" in kinds:
+        roads = matching(Road.objects.all(), query)
+        if state_ids is not None:
+            roads = roads.filter(states__id__in=state_ids).distinct()
+        results["road"] = list(roads.values("id", "name", "slug", "rank")[:limit])
+    if "city" in kinds:
+        cities = matching(City.objects.all(), query)
+        if state_ids is not None:
+            cities = cities.filter(state_id__in=state_ids)
+        results["city"] = list(cities.values("id", "name", "slug", "rank", state_name=F("state__name"))[:limit])
+    return results
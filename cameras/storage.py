@@ -0,0 +1,102 @@
+"""
+Storage layout of photos and object crops.
+
+Files are spread over two levels of hash-sharded directories (256 x 256) so that no
+directory holds more than a few hundred files, and every name is unique:
+
+* ``photos/<state>/<ab>/<cd>/<camera>-<YYYYmmdd-HHMMSS>-<unique>.jpg``
+* ``objects/<class>/<ab>/<cd>/<photo id>-<unique>.jpg``
+
+``unique`` is the row id when it is known and a random token otherwise.
+"""
+import hashlib
+import os
+import re
+import uuid
+
+from django.core.files.storage import default_storage
+
+PHOTO_NAME_RE = re.compile(r"^photos/[\w-]+/[0-9a-f]{2}/[0-9a-f]{2}/[\w-]+-\d{8}-\d{6}-\w+\.jpg$")
+OBJECT_NAME_RE = re.compile(r"^objects/\w+/[0-9a-f]{2}/[0-9a-f]{2}/\d+-\w+\.jpg$")
+
+
+def shard(basename):
+    """
+    Returns the two directory levels of a file name, e.g. ``"3f/a0"``.
+    """
+    digest = hashlib.blake2b(basename.encode(), digest_size=2).hexdigest()
+    return f"{digest[:2]}/{digest[2:]}"
+
+
+def unique_token(pk=None):
+    return str(pk) if pk is not None else uuid.uuid4().hex[:12]
+
+
+def photo_name(state_slug, camera_slug, captured_at, pk=None):
+    """
+    Returns the storage name of a photo.
+
+    :param state_slug: The slug of the camera's state.
+    :param camera_slug: The slug of the camera.
+    :param captured_at: When the photo was captured.
+    :param pk: The photo id, if already known.
+    """
+    basename = f"{camera_slug}-{captured_at:%Y%m%d-%H%M%S}-{unique_token(pk)}.jpg"
+    return f"photos/{state_slug}/{shard(basename)}/{basename}"
+
+
+def object_name(class_name, photo_id, pk=None):
+    """
+    Returns the storage name of the crop of a detected object.
+
+    :param class_name: The class of the object.
+    :param photo_id: The id of the photo the object was detected in.
+    :param pk: The object id, if already known.
+    """
+    basename = f"{photo_id}-{unique_token(pk)}.jpg"
+    return f"objects/{class_name}/{shard(basename)}/{basename}"
+
+
+def is_sharded(name):
+    return bool(PHOTO_NAME_RE.match(name) or OBJECT_NAME_RE.match(name))
+
+
+def local_path(name, storage=None):
+    """
+    Returns the filesystem path of a file, None when the storage is not local.
+    """
+    try:
+        return (storage or default_storage).path(name)
+    except NotImplementedError:
+        return None
+
+
+def move(old, new, storage=None):
+    """
+    Moves a file inside a storage; a rename when the storage is on the local filesystem.
+
+    A file that was already moved by an interrupted run is left as is.
+
+    :return: The new name, or None when neither the old nor the new file exists.
+    """
+    storage = storage or default_storage
+    try:
+        old_path, new_path = storage.path(old), storage.path(new)
+    except NotImplementedError:
+        if storage.exists(new):
+            return new
+        if not storage.exists(old):
+            return None
+        with storage.open(old) as f:
+            new = storage.save(new, f)
+        storage.delete(old)
+        return new
+
+    if os.path.exists(new_path):
+        return new
+    os.makedirs(os.path.dirname(new_path), exist_ok=True)
+    try:
+        os.replace(old_path, new_path)
+    except FileNotFoundError:
+        return None
+    return new
@@ -0,0 +1,143 @@
+"""
+Local stand-in for DOT camera hosts, used to exercise the prober and the capture pipeline.
+
+Playlists are served at ``/<behaviour>/<camera>/playlist.m3u8`` and preview images at
+``/<behaviour>/<camera>/preview.jpg``, where the behaviour is one of:
+
+``ok``
+    Answers immediately.
+``slow``
+    Answers after ``slow_delay`` seconds.
+``dead``
+    Answers with ``503 Service Unavailable``.
+``hang``
+    Never answers, so clients run into their timeout.
+``flapping``
+    Alternates between ``ok`` and ``dead`` every ``flap_every`` requests per camera.
+"""
+import asyncio
+import io
+import threading
+from collections import Counter
+
+from aiohttp import web
+from PIL import Image
+
+PLAYLIST = (
+    "#EXTM3U\n"
+    "#EXT-X-VERSION:3\n"
+    "#EXT-X-TARGETDURATION:2\n"
+    "#EXT-X-MEDIA-SEQUENCE:1\n"
+    "#EXTINF:2.0,\n"
+    "segment-1.ts\n"
+)
+
+
+def make_preview(camera_id, size=(320, 240)):
+    """
+    Returns a JPEG whose colour depends on the camera id.
+    """
+    output = io.BytesIO()
+    color = (camera_id * 37 % 256, camera_id * 91 % 256, camera_id * 53 % 256)
+    Image.new("RGB", size, color).save(output, format="JPEG")
+    return output.getvalue()
+
+
+class StubCameraServer:
+    """
+    Runs the stub camera host on a background thread.
+
+    Usage::
+
+        with StubCameraServer() as server:
+            url = server.url("flapping", 42)
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, slow_delay=2.0, flap_every=1):
+        self.host = host
+        self.port = port
+        self.slow_delay = slow_delay
+        self.flap_every = flap_every
+        self.requests = Counter()
+        self._loop = None
+        self._runner = None
+        self._thread = None
+        self._started = threading.Event()
+
+    def url(self, behaviour, camera_id):
+        return f"http://{self.host}:{self.port}/{behaviour}/{camera_id}/playlist.m3u8"
+
+    def preview_url(self, behaviour, camera_id):
+        return f"http://{self.host}:{self.port}/{behaviour}/{camera_id}/preview.jpg"
+
+    def application(self):
+        app = web.Application()
+        app.router.add_get("/{behaviour}/{camera}/playlist.m3u8", self.playlist)
+        app.router.add_get("/{behaviour}/{camera}/preview.jpg", self.preview)
+        return app
+
+    async def playlist(self, request):
+        return await self.respond(
+            request,
+            lambda: web.Response(text=PLAYLIST, content_type="application/vnd.apple.mpegurl"),
+        )
+
+    async def preview(self, request):
+        camera_id = int(request.match_info["camera"])
+        return await self.respond(
+            request,
+            lambda: web.Response(body=make_preview(camera_id), content_type="image/jpeg"),
+        )
+
+    async def respond(self, request, ok):
+        behaviour = request.match_info["behaviour"]
+        camera = request.match_info["camera"]
+        self.requests[behaviour, camera] += 1
+
+        if behaviour == "flapping":
+            up = (self.requests[behaviour, camera] - 1) // self.flap_every % 2 == 0
+            behaviour = "ok" if up else "dead"
+
+        if behaviour == "ok":
+            return ok()
+        if behaviour == "slow":
+            await asyncio.sleep(self.slow_delay)
+            return ok()
+        if behaviour == "dead":
+            return web.Response(status=503)
+        if behaviour == "hang":
+            await asyncio.sleep(3600)
+        raise web.HTTPNotFound()
+
+    async def start(self):
+        self._runner = web.AppRunner(self.application(), shutdown_timeout=0.5)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = self._runner.addresses[0][1]
+
+    async def stop(self):
+        await self._runner.cleanup()
+
+    def _serve(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_until_complete(self.start())
+        self._started.set()
+        self._loop.run_forever()
+        self._loop.run_until_complete(self.stop())
+        pending = asyncio.all_tasks(self._loop)
+        for task in pending:
+            task.cancel()
+        self._loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+        self._loop.close()
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+        self._started.wait()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
@@ -0,0 +1,14 @@
+"""
+Jobs of the camera pipeline, run by the ``jobs`` workers.
+"""
+from .cropping import CropPool
+
+
+def crop_objects(photo_ids, quality=90):
+    """
+    Crops the detected objects of some photos in the worker process.
+
+    :return: The number of objects cropped.
+    """
+    with CropPool(workers=0, quality=quality) as pool:
+        return pool.crop(pool.pending(0, photo_ids=photo_ids))
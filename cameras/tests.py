@@ -1,3 +1,821 @@
-from django.test import TestCase
+import asyncio
+import csv
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.core.management import call_command
+from django.db import DatabaseError
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from core.testing import AdminQueryBudgetMixin, QueryBudgetMixin, build_activity, build_network, make_user
+from . import importing, storage, thumbnails, workers
+from .capture import CaptureScheduler, FrameCapturer
+from .connectivity import ConnectivityTracker
+from .dedup import FrameDeduplicator
+from .detectors import FakeDetector
+from .importing import DetectionLoader
+from .inference import InferencePool
+from .models import Camera, CameraConnectivity, DetectedObject, OutageEvent, Photo, Video
+from .probe import PROBE_LATENCY, CameraProber, probe_cameras
+from .reference import ReferenceCache, bump_version, references
+from .scheduling import PollingScheduler, load_history
+from .stub_server import StubCameraServer
+from .tracking import Tracker, greedy_match, iou_matrix
+from .views import parse_range
+
+
+def call_quietly(*args, **options):
+    with open(os.devnull, "w") as devnull:
+        call_command(*args, stdout=devnull, stderr=devnull, **options)
+
+
+class CamerasAdminQueryBudgetTests(AdminQueryBudgetMixin, TestCase):
+    admin_models = [Camera, Photo, DetectedObject, Video, CameraConnectivity, OutageEvent]
+
+    def setUp(self):
+        self.add_data(cities=1, cameras_per_city=2, photos_per_camera=4)
+
+    def grow(self):
+        self.add_data(cities=3, cameras_per_city=5, photos_per_camera=12)
+
+    def add_data(self, cities, cameras_per_city, photos_per_camera):
+        cameras = build_network(cities_per_state=cities, cameras_per_city=cameras_per_city)["cameras"]
+        photos, _ = build_activity(cameras, photos_per_camera=photos_per_camera, detections_per_photo=3)
+        Video.objects.bulk_create([Video(camera=camera, file=f"videos/{camera.slug}.mp4") for camera in cameras])
+        tracker = ConnectivityTracker().load()
+        with self.assertLogs("cameras.connectivity", "INFO"):
+            for photo in sorted(photos, key=lambda photo: photo.captured_at):
+                tracker.observe(photo.camera_id, bool(photo.file), photo.captured_at)
+        tracker.save()
+
+
+class ImportCamerasQueryBudgetTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.dir = directory.name
+        self.states = build_network(states=2, cities_per_state=0, roads=1)["states"]
+
+    def write_cameras(self, per_state):
+        cameras = [
+            {
+                "id": f"{state.abbreviation}{n}",
+                "locationId": f"{state.abbreviation}_C{n % 4}",
+                "name": f"I-{70 + n % 5} at Exit {state.abbreviation}{n}",
+                "videoStreamUrl": f"https://cameras.example.com/{state.abbreviation}{n}/playlist.m3u8",
+                "latitude": 39.0 + n * 0.001,
+                "longitude": -77.0 - n * 0.001,
+            }
+            for state in self.states
+            for n in range(per_state)
+        ]
+        with open(os.path.join(self.dir, "cameras.json"), "w") as f:
+            json.dump(cameras, f)
+
+    def write_cities(self, near_timezone="US/Pacific"):
+        """
+        Writes a city around the first cameras of every state, and one far from them.
+        """
+        cities_dir = os.path.join(self.dir, "Cities")
+        os.makedirs(cities_dir, exist_ok=True)
+        cities = []
+        for state in self.states:
+            cities.append({
+                "id": f"{state.abbreviation}_NEAR", "name": "Near", "regionName": state.name,
+                "timeZone": near_timezone, "latitude": 39.05, "longitude": -77.05,
+                "northLatitude": 39.1, "southLatitude": 38.95, "eastLongitude": -76.9, "westLongitude": -77.5,
+            })
+            cities.append({
+                "id": f"{state.abbreviation}_FAR", "name": "Far", "regionName": state.name,
+                "timeZone": "US/Central", "latitude": 41.0, "longitude": -80.0,
+                "northLatitude": 41.1, "southLatitude": 40.9, "eastLongitude": -79.9, "westLongitude": -80.1,
+            })
+        with open(os.path.join(cities_dir, "cities.json"), "w") as f:
+            json.dump(cities, f)
+        return cities_dir
+
+    def test_import_cameras(self):
+        self.write_cameras(5)
+        cities_dir = self.write_cities()
+        report = os.path.join(self.dir, "outside.csv")
+        self.assertFixedQueries(
+            lambda: call_quietly("import_cameras", dir=self.dir, cities_dir=cities_dir, report=report),
+            lambda: self.write_cameras(200),
+            budget=20,
+        )
+        self.assertEqual(Camera.objects.count(), 400)
+        self.assertEqual(Camera.objects.filter(road__slug="i-72").count(), 80)
+        # Located in the nearest city of their state, with its time zone, whatever their locationId.
+        self.assertEqual(Camera.objects.filter(city__abbreviation="NEAR", city__timezone="US/Pacific").count(), 400)
+        with open(report) as f:
+            outside = list(csv.DictReader(f))
+        # The cameras north of 39.1 are outside every box.
+        self.assertEqual(len(outside), 2 * 99)
+        self.assertEqual({row["city_id"].split("_")[1] for row in outside}, {"NEAR"})
+
+    def test_city_without_a_us_time_zone_gets_the_one_of_its_state(self):
+        self.write_cameras(5)
+        call_quietly("import_cameras", dir=self.dir, cities_dir=self.write_cities(near_timezone="UTC"))
+        self.assertEqual(
+            set(Camera.objects.values_list("city__abbreviation", "city__timezone")), {("NEAR", "US/Central")}
+        )
+
+    def test_import_cameras_is_fast(self):
+        self.write_cameras(1000)
+        self.assertFasterThan(10, lambda: call_quietly("import_cameras", dir=self.dir))
+        self.assertEqual(Camera.objects.count(), 2000)
+
+
+class ImportDetectionsQueryBudgetTests(QueryBudgetMixin, TransactionTestCase):
+    # The loader's temporary table is dropped on commit, which a TestCase never does.
+    start = datetime(2025, 1, 1, 12, tzinfo=timezone.utc)
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.media_root = directory.name
+        self.enterContext(override_settings(MEDIA_ROOT=self.media_root))
+        self.cameras = build_network(cities_per_state=1, cameras_per_city=3)["cameras"]
+        self.written = 0
+
+    def write_photos(self, count):
+        """
+        Writes detector output for ``count`` more photos of every camera.
+        """
+        for camera in self.cameras:
+            directory = os.path.join(self.media_root, "output", camera.slug)
+            os.makedirs(directory, exist_ok=True)
+            for i in range(self.written, self.written + count):
+                stem = f"{camera.slug}-{self.start + timedelta(minutes=i):%Y%m%d-%H%M%S}"
+                Image.new("RGB", (64, 48)).save(os.path.join(directory, f"{stem}.jpg"))
+                with open(os.path.join(directory, f"{stem}.json"), "w") as f:
+                    json.dump({"detections": [
+                        {"name": "deer", "conf": 0.9, "x": 10 + i % 3, "y": 10, "width": 20, "height": 15},
+                        {"name": "car", "conf": 0.8, "x": 40, "y": 20, "width": 12, "height": 10},
+                    ]}, f)
+        self.written += count
+
+    def records(self, count):
+        return [
+            (camera.slug, self.start + timedelta(minutes=i), f"photos/{camera.slug}/{i}.jpg", [
+                ("deer", 0.9, 10.0 + i % 3, 10.0, 20.0, 15.0),
+                ("car", 0.8, 40.0, 20.0, 12.0, 10.0),
+            ])
+            for camera in self.cameras
+            for i in range(count)
+        ]
+
+    def test_import_detections(self):
+        self.write_photos(2)
+
+        def import_detections():
+            Photo.objects.all().delete()
+            call_quietly("import_detections", dir=os.path.join(self.media_root, "output"), workers=1)
+
+        self.assertFixedQueries(import_detections, lambda: self.write_photos(20), budget=20)
+        self.assertEqual(Photo.objects.count(), 3 * 22)
+        self.assertEqual(DetectedObject.objects.count(), 2 * 3 * 22)
+
+    def test_detection_loader(self):
+        loader = DetectionLoader({reference.slug: reference for reference in references.all()})
+        size = 5
+
+        def load():
+            Photo.objects.all().delete()
+            loader.load(self.records(size))
+
+        def grow():
+            nonlocal size
+            size = 500
+
+        self.assertFixedQueries(load, grow, budget=12)
+        self.assertEqual(Photo.objects.count(), 3 * 500)
+
+    def test_detection_loader_skips_present_and_invalid_photos(self):
+        loader = DetectionLoader({reference.slug: reference for reference in references.all()})
+        records = self.records(3)
+        self.assertEqual(loader.load(records), (9, 18, 0))
+
+        slug = self.cameras[0].slug
+        box = (0.9, 10.0, 10.0, 20.0, 15.0)
+        added = [
+            (slug, self.start + timedelta(hours=1), "photos/a.jpg", [("deer", *box), ("motorcycle", *box)]),
+            (slug, self.start + timedelta(hours=2), "photos/b.jpg", [("x" * 20, *box)]),
+            (slug, self.start + timedelta(hours=3), "photos/c.jpg", [("car", *box)]),
+        ]
+        self.assertEqual(loader.load(records + added), (1, 1, 11))
+        self.assertEqual(Photo.objects.count(), 10)
+        self.assertEqual(DetectedObject.objects.count(), 19)
+        self.assertEqual(set(DetectedObject.objects.values_list("name", flat=True)), {"deer", "car"})
+
+    def test_failed_load_leaves_the_tracks_unchanged(self):
+        loader = DetectionLoader({reference.slug: reference for reference in references.all()})
+        records = self.records(2)
+        copy_rows = importing.copy_rows
+
+        def fail_on_objects(cursor, table, column_names, rows):
+            if table == DetectedObject._meta.db_table:
+                raise DatabaseError("COPY failed")
+            return copy_rows(cursor, table, column_names, rows)
+
+        with mock.patch.object(importing, "copy_rows", side_effect=fail_on_objects):
+            with self.assertRaises(DatabaseError):
+                loader.load(records)
+        self.assertEqual(loader.tracker.cameras, {})
+
+        loader.load(records)
+        track_ids = set(DetectedObject.objects.values_list("track_id", flat=True))
+        self.assertEqual(set(DetectedObject.objects.filter(id__in=track_ids).values_list("id", flat=True)), track_ids)
+
+    def test_detection_loader_is_fast(self):
+        loader = DetectionLoader({reference.slug: reference for reference in references.all()})
+        records = self.records(3000)
+
+        photos, objects, skipped = self.assertFasterThan(10, lambda: loader.load(records))
+        self.assertEqual((photos, objects, skipped), (9000, 18000, 0))
+
+
+class ConnectivityTrackerTests(QueryBudgetMixin, TestCase):
+    def test_observe_is_fast_and_saves_in_bulk(self):
+        cameras = build_network(cities_per_state=5, cameras_per_city=20)["cameras"]
+        tracker = ConnectivityTracker().load()
+        start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+        def observe():
+            for minute in range(100):
+                at = start + timedelta(minutes=minute)
+                for camera in cameras:
+                    tracker.observe(camera.id, (camera.id + minute) % 7 != 0, at)
+
+        with self.assertLogs("cameras.connectivity", "INFO"):
+            self.assertFasterThan(5, observe)
+        self.assertLessEqual(self.count_queries(tracker.save), 6)
+        self.assertEqual(CameraConnectivity.objects.count(), 100)
+
+
+class TrackingTests(SimpleTestCase):
+    def test_iou_matrix(self):
+        iou = iou_matrix([[0, 0, 10, 10]], [[0, 0, 10, 10], [5, 0, 10, 10], [20, 20, 5, 5], [0, 0, 0, 0]])
+        np.testing.assert_allclose(iou, [[1.0, 1 / 3, 0.0, 0.0]])
+
+    def test_greedy_match_pairs_each_row_and_column_once(self):
+        iou = np.array([[0.9, 0.8], [0.85, 0.1]])
+        self.assertEqual(greedy_match(iou, 0.3), [(0, 0)])
+        self.assertEqual(sorted(greedy_match(iou, 0.05)), [(0, 0), (1, 1)])
+
+    def test_tracks_continue_across_photos(self):
+        tracker = Tracker(threshold=0.3, max_gap=300)
+        first = tracker.update(1, 0, ["deer", "deer"], [[0, 0, 10, 10], [100, 0, 10, 10]], [1, 2])
+        # Both deer moved a little, listed in the other order.
+        second = tracker.update(1, 60, ["deer", "deer"], [[102, 0, 10, 10], [2, 0, 10, 10]], [3, 4])
+        self.assertEqual(first.tolist(), [1, 2])
+        self.assertEqual(second.tolist(), [2, 1])
+
+    def test_tracks_do_not_cross_classes_or_cameras(self):
+        tracker = Tracker()
+        tracker.update(1, 0, ["deer"], [[0, 0, 10, 10]], [1])
+        self.assertEqual(tracker.update(1, 60, ["car"], [[0, 0, 10, 10]], [2]).tolist(), [2])
+        self.assertEqual(tracker.update(2, 60, ["deer"], [[0, 0, 10, 10]], [3]).tolist(), [3])
+
+    def test_tracks_close_after_the_gap(self):
+        tracker = Tracker(max_gap=300)
+        tracker.update(1, 0, ["deer"], [[0, 0, 10, 10]], [1])
+        self.assertEqual(tracker.update(1, 200, ["deer"], [[0, 0, 10, 10]], [2]).tolist(), [1])
+        self.assertEqual(tracker.update(1, 600, ["deer"], [[0, 0, 10, 10]], [3]).tolist(), [3])
+        tracker.expire(1000)
+        self.assertEqual(tracker.cameras, {})
+
+    def test_restore_a_snapshot(self):
+        tracker = Tracker()
+        tracker.update(1, 0, ["deer"], [[0, 0, 10, 10]], [1])
+        snapshot = tracker.snapshot([1, 2])
+        tracker.update(1, 60, ["deer"], [[50, 50, 10, 10]], [2])
+        tracker.update(2, 60, ["car"], [[0, 0, 10, 10]], [3])
+
+        tracker.restore(snapshot)
+        self.assertEqual(list(tracker.cameras), [1])
+        self.assertEqual(tracker.update(1, 120, ["deer"], [[50, 50, 10, 10]], [4]).tolist(), [4])
+        self.assertEqual(tracker.update(1, 180, ["deer"], [[0, 0, 10, 10]], [5]).tolist(), [1])
+
+
+class ProbeTests(SimpleTestCase):
+    def setUp(self):
+        self.server = self.enterContext(StubCameraServer(slow_delay=0.5, flap_every=1))
+        self.prober = CameraProber(timeout=0.25, retries=2, backoff=0.01)
+
+    def probe(self, *behaviours):
+        cameras = [(n, self.server.url(behaviour, n)) for n, behaviour in enumerate(behaviours)]
+        return asyncio.run(self.prober.run(cameras))
+
+    def test_healthy_slow_and_failing_cameras(self):
+        ok, slow, dead, missing = self.probe("ok", "slow", "dead", "gone")
+        self.assertEqual((ok.connected, ok.attempts, ok.error), (True, 1, ""))
+        # Timeouts and 5xx are retried, 4xx are not.
+        self.assertEqual((slow.connected, slow.attempts, slow.error), (False, 3, "TimeoutError"))
+        self.assertEqual((dead.connected, dead.attempts, dead.error), (False, 3, "HTTP 503"))
+        self.assertEqual((missing.connected, missing.attempts, missing.error), (False, 1, "HTTP 404"))
+
+    def test_flapping_cameras_are_retried(self):
+        [up] = self.probe("flapping")
+        # Down on the first attempt, up again on the retry.
+        [retried] = self.probe("flapping")
+        self.assertEqual((up.connected, up.attempts), (True, 1))
+        self.assertEqual((retried.connected, retried.attempts), (True, 2))
+
+    def test_slow_cameras_within_the_timeout(self):
+        self.prober.timeout = 2
+        [slow] = self.probe("slow")
+        self.assertTrue(slow.connected)
+        self.assertGreaterEqual(slow.latency, 0.5)
+
+    def test_latency_quantiles_of_a_cycle(self):
+        self.prober.timeout = 2
+        self.probe("slow")
+        cycle = PROBE_LATENCY.snapshot()
+        self.probe("ok", "ok", "ok")
+        self.assertLess(PROBE_LATENCY.quantile(0.99, since=cycle), 0.5)
+        self.assertGreaterEqual(PROBE_LATENCY.quantile(0.99), 0.5)
+
+
+class ProbeCamerasTests(TestCase):
+    def test_statuses_are_stored(self):
+        cameras = build_network(cities_per_state=1, cameras_per_city=3)["cameras"]
+        with StubCameraServer() as server:
+            for camera, behaviour in zip(cameras, ["ok", "dead", "gone"]):
+                camera.url = server.url(behaviour, camera.id)
+            Camera.objects.bulk_update(cameras, ["url"])
+            Camera.objects.update(last_connection_status=False)
+            results, changed = probe_cameras(CameraProber(timeout=1, retries=1, backoff=0.01))
+        self.assertEqual(changed, 1)
+        self.assertEqual(
+            dict(Camera.objects.values_list("id", "last_connection_status")),
+            {cameras[0].id: True, cameras[1].id: False, cameras[2].id: False},
+        )
+
+
+class CaptureTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.media_root = directory.name
+        self.enterContext(override_settings(MEDIA_ROOT=self.media_root))
+        self.cameras = build_network(cities_per_state=1, cameras_per_city=3)["cameras"]
+        self.server = self.enterContext(StubCameraServer())
+        for camera, behaviour in zip(self.cameras, ["ok", "dead", "ok"]):
+            camera.preview_url = self.server.preview_url(behaviour, camera.id)
+        Camera.objects.bulk_update(self.cameras, ["preview_url"])
+
+    def capture(self, cycles=1, **options):
+        """
+        Runs capture cycles of every camera; returns the scheduler and the frames.
+        """
+        capturer = FrameCapturer(timeout=2, workers=2)
+        scheduler = CaptureScheduler(capturer, Camera.objects.all(), interval=0.01, **options)
+        frames = []
+        # async_to_sync runs the database calls of the cycle in this thread, in the test transaction.
+        async_to_sync(scheduler.serve)(cycles=cycles, on_cycle=lambda cycle, lag, duration: frames.extend(cycle))
+        return scheduler, frames
+
+    def test_run_cycle(self):
+        _, frames = self.capture()
+        self.assertEqual([bool(frame.error) for frame in frames], [False, True, False])
+        photos = list(Photo.objects.order_by("camera_id"))
+        self.assertEqual([bool(photo.file) for photo in photos], [True, False, True])
+        self.assertEqual({photo.state_id for photo in photos}, {self.cameras[0].city.state_id})
+        self.assertTrue(os.path.exists(os.path.join(self.media_root, photos[0].file.name)))
+        self.assertEqual(
+            dict(Camera.objects.values_list("id", "last_connection_status")),
+            {self.cameras[0].id: True, self.cameras[1].id: False, self.cameras[2].id: True},
+        )
+
+    def stored_files(self):
+        return [name for _, _, names in os.walk(self.media_root) for name in names]
+
+    def test_failed_insert_skips_the_cycle(self):
+        bulk_create = Photo.objects.bulk_create
+        failures = [DatabaseError]
+
+        def fail_once(*args, **kwargs):
+            if failures:
+                raise failures.pop()
+            return bulk_create(*args, **kwargs)
+
+        connectivity = ConnectivityTracker().load()
+        with (
+            mock.patch.object(Photo.objects, "bulk_create", side_effect=fail_once),
+            mock.patch.object(connectivity, "observe", wraps=connectivity.observe) as observe,
+            self.assertLogs("cameras.capture", "ERROR"),
+        ):
+            scheduler, frames = self.capture(cycles=2, connectivity=connectivity)
+
+        # Only the second cycle was inserted and observed.
+        self.assertEqual(len(frames), 3)
+        self.assertEqual(Photo.objects.count(), 3)
+        self.assertEqual(observe.call_count, 3)
+        self.assertEqual(
+            sorted(self.stored_files()),
+            sorted(os.path.basename(photo.file.name) for photo in Photo.objects.exclude(file="")),
+        )
+        self.assertEqual(
+            {camera_id: connected for camera_id, (connected, _) in scheduler.connection_states.items()},
+            {self.cameras[0].id: True, self.cameras[1].id: False, self.cameras[2].id: True},
+        )
+
+    def test_benchmark_capture(self):
+        output = io.StringIO()
+        call_command("benchmark_capture", cameras=200, stdout=output)
+        self.assertIn("Captured 200/200 frames", output.getvalue())
+        self.assertEqual(self.stored_files(), [])
+
+    def test_capture_keeps_up_with_15000_cameras_per_minute(self):
+        self.assertFasterThan(60, lambda: call_quietly("benchmark_capture", cameras=15_000))
+
+    def test_polling_is_fed_the_latest_detections(self):
+        photos, _ = build_activity(self.cameras[:1], photos_per_camera=3, detections_per_photo=1)
+        polling = PollingScheduler(load_history(datetime.now(timezone.utc) - timedelta(days=1)), budget=60)
+        i = polling.index[self.cameras[0].id]
+        rate = polling.rate[i]
+        scheduler, _ = self.capture(polling=polling)
+        # The deer of the latest photo through inference count once.
+        self.assertEqual(scheduler.observed_photos, {self.cameras[0].id: photos[-1].id})
+        self.assertGreater(polling.rate[i], rate)
+        self.assertEqual(scheduler.load_detections([camera.id for camera in self.cameras]), {})
+
+
+class PollingSchedulerTests(SimpleTestCase):
+    def scheduler(self, weighted, budget, **options):
+        """
+        Returns a scheduler of cameras with the given weighted detections per photo.
+        """
+        weighted = np.asarray(weighted, dtype=np.float64)
+        photos = np.full((len(weighted), 24), 100.0)
+        history = {
+            "camera_ids": np.arange(1, len(weighted) + 1, dtype=np.int64),
+            "timezones": ["US/Eastern"] * len(weighted),
+            "photos": photos,
+            "connected": photos.copy(),
+            "weighted": photos * weighted[:, None],
+        }
+        return PollingScheduler(history, budget, **options)
+
+    def test_allocation_spends_the_budget_within_the_bounds(self):
+        rng = np.random.default_rng(0)
+        priorities = rng.lognormal(0, 2, 500)
+        for budget in (60, 500, 900):
+            with self.subTest(budget=budget):
+                scheduler = self.scheduler(np.ones(500), budget, min_interval=30, max_interval=900)
+                intervals = scheduler.allocate(priorities)
+                self.assertTrue(np.all((intervals >= 30 - 1e-9) & (intervals <= 900 + 1e-9)))
+                self.assertAlmostEqual((60 / intervals).sum(), budget, delta=budget * 1e-6)
+                # A higher priority never gets a longer interval.
+                order = np.argsort(priorities)
+                self.assertTrue(np.all(np.diff(intervals[order]) <= 1e-9))
+
+    def test_allocation_is_clamped_when_the_budget_cannot_be_spent(self):
+        scheduler = self.scheduler(np.ones(10), budget=1, min_interval=30, max_interval=600)
+        np.testing.assert_allclose(scheduler.allocate(np.arange(1.0, 11.0)), 600)
+        scheduler.budget = 1000
+        np.testing.assert_allclose(scheduler.allocate(np.arange(1.0, 11.0)), 30)
+
+    def test_observe_uses_the_allocation(self):
+        scheduler = self.scheduler([0.1, 1.0, 5.0, 0.5], budget=2)
+        now = datetime(2025, 6, 1, 15, tzinfo=timezone.utc)
+        scheduler.rebalance(now)
+        intervals = scheduler.intervals.copy()
+        # An observation that does not change the priority keeps the interval of the rebalance.
+        scheduler.decay = 1.0
+        scheduler.observe(3, True, detections={}, now=now)
+        self.assertAlmostEqual(scheduler.intervals[2], intervals[2])
+        # Deer detections raise the priority and shorten the interval, still within the bounds.
+        scheduler.decay = 0.5
+        for _ in range(5):
+            scheduler.observe(1, True, detections={"deer": 3}, now=now)
+        self.assertLess(scheduler.intervals[0], intervals[0])
+        self.assertGreaterEqual(scheduler.intervals[0], scheduler.min_interval)
+
+
+class InferenceTests(TestCase):
+    def setUp(self):
+        # The spawned workers read the photos from the MEDIA_ROOT of the settings.
+        self.prefix = f"test-inference-{os.getpid()}-{id(self)}"
+        self.addCleanup(shutil.rmtree, os.path.join(settings.MEDIA_ROOT, self.prefix), ignore_errors=True)
+        cameras = build_network(cities_per_state=1, cameras_per_city=2)["cameras"]
+        self.photos, _ = build_activity(cameras, photos_per_camera=8, detections_per_photo=0)
+        rng = np.random.default_rng(0)
+        for photo in self.photos:
+            photo.detected_at = None
+            if photo.file:
+                photo.file.name = f"{self.prefix}/{photo.pk}.jpg"
+                path = os.path.join(settings.MEDIA_ROOT, photo.file.name)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                Image.fromarray(rng.integers(0, 256, (960, 1280, 3), dtype=np.uint8)).save(path)
+        Photo.objects.bulk_update(self.photos, ["file", "detected_at"])
+        self.connected = [photo for photo in self.photos if photo.file]
+
+    def test_detect_batch(self):
+        batch = [(photo.id, photo.file.name) for photo in self.connected] + [(0, f"{self.prefix}/missing.jpg")]
+        with mock.patch.object(workers, "_detector", FakeDetector()):
+            results, _, _ = workers.detect_batch(batch)
+            self.assertEqual(workers.detect_batch(batch)[0], results)
+        detections = dict(results)
+        self.assertIsNone(detections.pop(0))
+        self.assertEqual(sorted(detections), sorted(photo.id for photo in self.connected))
+        boxes = [detection for objects in detections.values() for detection in objects]
+        self.assertTrue(boxes)
+        # In photo coordinates, not in those of the image decoded at the input size.
+        self.assertTrue(all(0 <= box.x and box.x + box.width <= 1280.01 for box in boxes))
+        self.assertGreater(max(box.x + box.width for box in boxes), 640)
+
+    def test_inference_pool(self):
+        with mock.patch.object(workers, "_detector", FakeDetector()):
+            expected, _, _ = workers.detect_batch([(photo.id, photo.file.name) for photo in self.connected])
+        with InferencePool(workers=2, batch_size=3, detector="cameras.detectors.FakeDetector") as pool:
+            self.assertEqual(pool.run(once=True), len(self.photos))
+
+        self.assertFalse(Photo.objects.filter(detected_at__isnull=True).exists())
+        rows = DetectedObject.objects.values_list("photo_id", "name", "conf", "x", "y", "width", "height")
+        self.assertEqual(
+            sorted(rows),
+            sorted(
+                (photo_id, d.name, d.conf, d.x, d.y, d.width, d.height)
+                for photo_id, detections in expected for d in detections
+            ),
+        )
+        self.assertFalse(DetectedObject.objects.filter(track_id__isnull=True).exists())
+        for photo in Photo.objects.filter(pk__in=[photo.pk for photo in self.connected]):
+            self.assertEqual(photo.has_detected_objects, photo.detected_objects.exists())
+
+
+class StorageLayoutTests(SimpleTestCase):
+    captured_at = datetime(2025, 1, 1, 12, tzinfo=timezone.utc)
+
+    def test_photo_names_are_unique_and_sharded(self):
+        names = {storage.photo_name("ga", "i-75-exit-1", self.captured_at) for _ in range(1000)}
+        self.assertEqual(len(names), 1000)
+        self.assertTrue(all(storage.is_sharded(name) for name in names))
+        self.assertGreater(len({name.rsplit("/", 1)[0] for name in names}), 900)
+
+    def test_names_from_row_ids_are_stable(self):
+        name = storage.photo_name("ga", "i-75-exit-1", self.captured_at, pk=42)
+        self.assertEqual(name, storage.photo_name("ga", "i-75-exit-1", self.captured_at, pk=42))
+        self.assertRegex(name, r"^photos/ga/[0-9a-f]{2}/[0-9a-f]{2}/i-75-exit-1-20250101-120000-42\.jpg$")
+        self.assertNotEqual(name, storage.photo_name("ga", "i-75-exit-1", self.captured_at, pk=43))
+
+    def test_object_names_are_unique_and_sharded(self):
+        names = {storage.object_name("deer", 7) for _ in range(1000)} | {storage.object_name("deer", 7, pk=1)}
+        self.assertEqual(len(names), 1001)
+        self.assertTrue(all(storage.is_sharded(name) for name in names))
+        self.assertFalse(storage.is_sharded("photos/i-75-exit-1/0.jpg"))
+
+
+class ReferenceCacheTests(TestCase):
+    def setUp(self):
+        self.camera = build_network(cities_per_state=1, cameras_per_city=1)["cameras"][0]
+        self.cache = ReferenceCache(check_interval=3600)
+
+    def test_lookups_run_no_query_once_loaded(self):
+        self.assertEqual(self.cache.get(self.camera.id).slug, self.camera.slug)
+        with self.assertNumQueries(0):
+            self.cache.get(self.camera.id)
+            self.cache.photo_fields(self.camera.id)
+
+    def test_bump_version_invalidates(self):
+        self.cache.get(self.camera.id)
+        Camera.objects.filter(pk=self.camera.pk).update(slug="renamed")
+        self.assertEqual(self.cache.get(self.camera.id).slug, self.camera.slug)
+        # As another process would: the version changes, this cache only sees it once expired.
+        bump_version()
+        self.assertEqual(self.cache.get(self.camera.id).slug, self.camera.slug)
+        self.cache.expire()
+        self.assertEqual(self.cache.get(self.camera.id).slug, "renamed")
+
+    def test_version_is_checked_every_interval(self):
+        self.cache.check_interval = 0
+        self.cache.get(self.camera.id)
+        Camera.objects.filter(pk=self.camera.pk).update(slug="renamed")
+        bump_version()
+        self.assertEqual(self.cache.get(self.camera.id).slug, "renamed")
+
+    def test_unknown_and_new_cameras(self):
+        self.cache.get(self.camera.id)
+        with self.assertRaises(Camera.DoesNotExist):
+            self.cache.get(0)
+        camera = build_network(cities_per_state=1, cameras_per_city=1)["cameras"][0]
+        self.assertEqual(self.cache.get(camera.id).slug, camera.slug)
+
+
+class FrameDeduplicatorTests(SimpleTestCase):
+    def frame(self, seed, quality=85, noise=0):
+        rng = np.random.default_rng(seed)
+        # A smooth scene, like a road, so its hash is stable under noise and recompression.
+        y, x = np.mgrid[0:240, 0:320]
+        pixels = 128 + 60 * np.sin(x / (20 + seed * 7)) * np.cos(y / (15 + seed * 3))
+        pixels = pixels[..., None] + rng.normal(0, noise, (240, 320, 1)) if noise else pixels[..., None]
+        image = Image.fromarray(np.clip(np.repeat(pixels, 3, axis=2), 0, 255).astype(np.uint8))
+        output = io.BytesIO()
+        image.save(output, format="JPEG", quality=quality)
+        return output.getvalue()
+
+    def test_near_duplicates(self):
+        dedup = FrameDeduplicator(threshold=3)
+        self.assertFalse(dedup.check(1, self.frame(1)))
+        # The same scene recompressed, or with sensor noise, is stale; another scene is not.
+        self.assertTrue(dedup.check(1, self.frame(1, quality=60)))
+        self.assertTrue(dedup.check(1, self.frame(1, noise=2)))
+        self.assertFalse(dedup.check(1, self.frame(2)))
+        # The hashes are kept per camera.
+        self.assertFalse(dedup.check(2, self.frame(1)))
+
+    def test_frozen_cameras(self):
+        dedup = FrameDeduplicator(frozen_after=2)
+        frame = self.frame(1)
+        dedup.check(1, frame)
+        dedup.check(1, frame)
+        self.assertFalse(dedup.is_frozen(1))
+        dedup.check(1, frame)
+        self.assertTrue(dedup.is_frozen(1))
+        dedup.check(1, self.frame(2))
+        self.assertFalse(dedup.is_frozen(1))
+
+    def test_history_is_bounded(self):
+        dedup = FrameDeduplicator(history=2)
+        dedup.check(1, self.frame(1))
+        dedup.check(1, self.frame(2))
+        dedup.check(1, self.frame(3))
+        self.assertFalse(dedup.check(1, self.frame(1)))
+        self.assertTrue(dedup.check(1, self.frame(3)))
+
+
+class ThumbnailCacheTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.storage = FileSystemStorage(location=directory.name)
+        # No background prune while the test writes.
+        self.enterContext(override_settings(THUMBNAIL_CACHE_BYTES=0))
+
+    def add(self, name, size, age):
+        thumbnails.write(name, b"x" * size, self.storage)
+        self.age(name, age)
+
+    def age(self, name, seconds):
+        at = time.time() - seconds
+        os.utime(self.storage.path(name), (at, at))
+
+    def remaining(self):
+        return sorted(os.listdir(self.storage.path("thumbnails/small")))
+
+    def test_prune_deletes_the_least_recently_used(self):
+        for i in range(10):
+            self.add(f"thumbnails/small/{i}.jpg", 1000, age=1000 * (10 - i))
+        self.assertEqual(thumbnails.prune(budget=20_000, storage=self.storage), (10_000, 0, 0))
+        self.assertEqual(thumbnails.prune(budget=5000, target=0.9, storage=self.storage), (4000, 6, 6000))
+        self.assertEqual(self.remaining(), ["6.jpg", "7.jpg", "8.jpg", "9.jpg"])
+
+    def test_served_derivatives_are_kept(self):
+        output = io.BytesIO()
+        Image.new("RGB", (800, 600), "gray").save(output, format="JPEG")
+        self.storage.save("photos/a.jpg", ContentFile(output.getvalue()))
+        served = thumbnails.get_or_create("photos/a.jpg", "small", "jpg", storage=self.storage)
+        self.age(served, 10 * thumbnails.TOUCH_INTERVAL)
+        for i in range(3):
+            self.add(f"thumbnails/small/{i}.jpg", 1000, age=2 * thumbnails.TOUCH_INTERVAL)
+
+        self.assertEqual(thumbnails.get_or_create("photos/a.jpg", "small", "jpg", storage=self.storage), served)
+        thumbnails.prune(budget=1000, target=1, storage=self.storage)
+        self.assertEqual(self.remaining(), ["photos"])
+        self.assertTrue(self.storage.exists(served))
+
+
+class VideoViewTests(TestCase):
+    content = bytes(range(256)) * 4
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=directory.name))
+        self.addCleanup(cache.clear)
+        network = build_network(states=2, cities_per_state=1, cameras_per_city=1)
+        self.video = Video.objects.create(camera=network["cameras"][0], file=ContentFile(self.content, "clip.mp4"))
+        self.url = reverse("cameras:video", args=[self.video.pk])
+        self.client.force_login(make_user(states=network["states"][:1]))
+
+    def get(self, url=None, **headers):
+        response = self.client.get(url or self.url, headers=headers)
+        self.addCleanup(response.close)
+        return response
+
+    def assertServes(self, response, status, start, end):
+        self.assertEqual(response.status_code, status)
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+        self.assertEqual(b"".join(response.streaming_content), self.content[start:end + 1])
+        if status == 206:
+            self.assertEqual(response["Content-Range"], f"bytes {start}-{end}/{len(self.content)}")
+            self.assertEqual(response["Content-Length"], str(end - start + 1))
+
+    def test_whole_file(self):
+        self.assertServes(self.get(), 200, 0, 1023)
+
+    def test_range(self):
+        self.assertServes(self.get(Range="bytes=100-199"), 206, 100, 199)
+        self.assertServes(self.get(Range="bytes=1000-5000"), 206, 1000, 1023)
+
+    def test_open_ended_range(self):
+        self.assertServes(self.get(Range="bytes=1000-"), 206, 1000, 1023)
+
+    def test_suffix_range(self):
+        self.assertServes(self.get(Range="bytes=-100"), 206, 924, 1023)
+        self.assertServes(self.get(Range="bytes=-5000"), 206, 0, 1023)
+
+    def test_unsatisfiable_range(self):
+        response = self.get(Range="bytes=1024-")
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response["Content-Range"], "bytes */1024")
+
+    def test_malformed_or_stale_range_serves_the_whole_file(self):
+        self.assertServes(self.get(Range="bytes=0-1,5-9"), 200, 0, 1023)
+        self.assertServes(self.get(Range="bytes=100-199", **{"If-Range": "Thu, 01 Jan 1970 00:00:00 GMT"}), 200, 0, 1023)
+
+    def test_accel_redirect(self):
+        with override_settings(VIDEO_ACCEL_REDIRECT_PREFIX="/protected/"):
+            response = self.get()
+        self.assertEqual(response["X-Accel-Redirect"], f"/protected/{self.video.file.name}")
+
+    def test_user_without_the_state(self):
+        self.client.force_login(make_user())
+        self.assertEqual(self.get().status_code, 403)
+
+    def test_missing_video(self):
+        self.assertEqual(self.get(reverse("cameras:video", args=[self.video.pk + 1])).status_code, 404)
+        self.video.file.delete(save=False)
+        self.assertEqual(self.get().status_code, 404)
+
+
+class ParseRangeTests(SimpleTestCase):
+    def test_parse_range(self):
+        cases = [
+            (None, None),
+            ("bytes=0-99", (0, 99)),
+            ("bytes=900-", (900, 999)),
+            ("bytes=-100", (900, 999)),
+            ("bytes=-0", ()),
+            ("bytes=500-5000", (500, 999)),
+            ("bytes=1000-", ()),
+            ("bytes=99-0", ()),
+            ("bytes=-", None),
+            ("bytes=0-1,5-9", None),
+            ("items=0-1", None),
+        ]
+        for header, expected in cases:
+            with self.subTest(header=header):
+                self.assertEqual(parse_range(header, 1000), expected)
+
+
+class ThumbnailViewTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=directory.name, THUMBNAIL_CACHE_BYTES=0))
+        self.addCleanup(cache.clear)
+        network = build_network(cities_per_state=1, cameras_per_city=1)
+        photos, _ = build_activity(network["cameras"], photos_per_camera=1, detections_per_photo=0)
+        self.photo = photos[0]
+        output = io.BytesIO()
+        Image.new("RGB", (800, 600), "gray").save(output, format="JPEG")
+        default_storage.save(self.photo.file.name, ContentFile(output.getvalue()))
+        self.url = reverse("cameras:thumbnail", args=["photo", self.photo.pk, "small", "webp"])
+        self.client.force_login(make_user(states=network["states"]))
+
+    def test_local_file_is_cached_for_a_year(self):
+        response = self.client.get(self.url)
+        self.addCleanup(response.close)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "image/webp")
+        self.assertIn("immutable", response["Cache-Control"])
+        self.assertIn("max-age=31536000", response["Cache-Control"])
+
+    def test_redirect_is_cached_less_than_the_url_lives(self):
+        with (
+            mock.patch.object(storage, "local_path", return_value=None),
+            mock.patch.object(default_storage, "url", return_value="https://bucket.example.com/signed"),
+            mock.patch.object(default_storage, "url_expiry", 600, create=True),
+        ):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response["Location"], "https://bucket.example.com/signed")
+        self.assertNotIn("immutable", response["Cache-Control"])
+        self.assertIn("max-age=150", response["Cache-Control"])
@@ -0,0 +1,207 @@
+"""
+Derivatives (thumbnails and WebP variants) of photos and object crops.
+
+A derivative is generated on its first request and stored in the same storage as its
+original, under ``thumbnails/<size>/<original name>.<jpg|webp>``. Original names are unique
+and never rewritten, so a derivative never changes and is served with a long-lived cache
+header.
+
+On a local storage the derivatives are an LRU cache bounded by
+``settings.THUMBNAIL_CACHE_BYTES``: serving a derivative refreshes its mtime (at most once
+per ``TOUCH_INTERVAL``) and ``prune`` deletes the least recently served ones.
+"""
+import io
+import os
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image
+
+from core import metrics
+
+from .storage import local_path
+
+PREFIX = "thumbnails"
+FORMATS = {
+    "jpg": ("JPEG", "image/jpeg"),
+    "webp": ("WEBP", "image/webp"),
+}
+TOUCH_INTERVAL = 3600
+
+GENERATED = metrics.counter("thumbnails_generated_total", "Derivatives generated.")
+HITS = metrics.counter("thumbnails_hits_total", "Derivatives served from the cache.")
+EVICTED = metrics.counter("thumbnails_evicted_total", "Derivatives deleted by the LRU budget.")
+RENDER_SECONDS = metrics.histogram("thumbnails_render_seconds", "Time to render a derivative.")
+
+_written = 0
+_written_lock = threading.Lock()
+_prune_lock = threading.Lock()
+
+
+def sizes():
+    return settings.THUMBNAIL_SIZES
+
+
+def derivative_name(name, size, ext):
+    """
+    Returns the storage name of a derivative, e.g.
+    ``thumbnails/small/photos/ga/3f/a0/i-75-20250101-120000-42.webp``.
+    """
+    stem, _ = os.path.splitext(name)
+    return f"{PREFIX}/{size}/{stem}.{ext}"
+
+
+def render(source, size, ext, quality=80):
+    """
+    Renders a derivative fitting in a ``size x size`` box.
+
+    :param source: A file object or the bytes of the original image.
+    :return: The encoded bytes.
+    """
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    started = time.perf_counter()
+    with Image.open(source) as image:
+        # Let the JPEG decoder downscale first, it is much cheaper than resampling.
+        image.draft("RGB", (size, size))
+        image = image.convert("RGB")
+        image.thumbnail((size, size), Image.Resampling.LANCZOS)
+        output = io.BytesIO()
+        image.save(output, format=FORMATS[ext][0], quality=quality)
+    RENDER_SECONDS.observe(time.perf_counter() - started)
+    return output.getvalue()
+
+
+def write(name, data, storage=None):
+    """
+    Stores a derivative under its exact name; a rename on a local storage so a concurrent
+    request never reads a partial file.
+    """
+    storage = storage or default_storage
+    path = local_path(name, storage)
+    if path is None:
+        if not storage.exists(name):
+            storage.save(name, ContentFile(data))
+        return
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+    _account(len(data))
+
+
+def get_or_create(name, size, ext, storage=None):
+    """
+    Returns the name of a derivative of the file ``name``, generating it when missing.
+
+    :raises KeyError: When the size or the format is unknown.
+    :raises FileNotFoundError: When the original does not exist.
+    """
+    storage = storage or default_storage
+    box = sizes()[size]
+    if ext not in FORMATS:
+        raise KeyError(ext)
+    target = derivative_name(name, size, ext)
+
+    path = local_path(target, storage)
+    if path is not None:
+        try:
+            touch(path)
+            HITS.inc()
+            return target
+        except FileNotFoundError:
+            pass
+    elif storage.exists(target):
+        HITS.inc()
+        return target
+
+    with storage.open(name) as original:
+        data = render(original, box, ext)
+    write(target, data, storage)
+    GENERATED.inc()
+    return target
+
+
+def generate(name, data, size_names=None, exts=("jpg", "webp")):
+    """
+    Generates the derivatives of an original whose bytes are already in memory.
+    """
+    for size in size_names or sizes():
+        for ext in exts:
+            write(derivative_name(name, size, ext), render(data, sizes()[size], ext))
+            GENERATED.inc()
+
+
+def touch(path):
+    """
+    Marks a local derivative as recently used.
+
+    :raises FileNotFoundError: When it does not exist.
+    """
+    mtime = os.stat(path).st_mtime
+    now = time.time()
+    if now - mtime > TOUCH_INTERVAL:
+        os.utime(path, (now, now))
+
+
+def _account(size):
+    """
+    Counts the bytes written and prunes in the background once they reach 5% of the budget.
+    """
+    global _written
+    budget = settings.THUMBNAIL_CACHE_BYTES
+    with _written_lock:
+        _written += size
+        if not budget or _written < budget * 0.05:
+            return
+        _written = 0
+    threading.Thread(target=prune, args=(budget,), daemon=True).start()
+
+
+def prune(budget=None, target=0.9, storage=None):
+    """
+    Deletes the least recently used derivatives of a local storage until they fit in
+    ``target`` of the budget.
+
+    :return: A ``(kept_bytes, deleted_files, deleted_bytes)`` tuple, or None when another
+        prune is already running.
+    """
+    budget = settings.THUMBNAIL_CACHE_BYTES if budget is None else budget
+    root = local_path(PREFIX, storage)
+    if root is None or not _prune_lock.acquire(blocking=False):
+        return None
+    try:
+        files = []
+        for directory, _, names in os.walk(root):
+            for name in names:
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in files)
+        deleted = deleted_bytes = 0
+        if total > budget:
+            files.sort()
+            for _, size, path in files:
+                if total <= budget * target:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                deleted += 1
+                deleted_bytes += size
+            EVICTED.inc(deleted)
+        return total, deleted, deleted_bytes
+    finally:
+        _prune_lock.release()
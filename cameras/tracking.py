@@ -0,0 +1,184 @@
+"""
+Tracking of detected objects across the consecutive photos of a camera.
+
+A detection continues a track when its box overlaps the last box of a track of the same
+class by at least ``threshold`` IoU; otherwise it starts a new track. The ``track_id`` of a
+detection is the id of the first detection of its track, so the unique objects are the
+distinct ``track_id`` values and a new track needs no extra table.
+
+The state of each camera (the last box of its open tracks) is kept in memory. A track that
+is not seen for ``max_gap`` seconds is closed, which also bridges a missed detection in
+between.
+"""
+from datetime import datetime
+
+import numpy as np
+from django.db import connection
+
+from core import metrics
+
+TRACKS = metrics.counter("tracking_tracks_total", "Tracks started.")
+MATCHES = metrics.counter("tracking_matches_total", "Detections continuing a track.")
+
+
+def iou_matrix(a, b):
+    """
+    Returns the intersection over union of every pair of boxes.
+
+    :param a: An ``(n, 4)`` array of ``x, y, width, height``.
+    :param b: An ``(m, 4)`` array of ``x, y, width, height``.
+    :return: An ``(n, m)`` array.
+    """
+    a = np.asarray(a, dtype=np.float64).reshape(-1, 4)
+    b = np.asarray(b, dtype=np.float64).reshape(-1, 4)
+    ax1, ay1 = a[:, 0:1], a[:, 1:2]
+    ax2, ay2 = ax1 + a[:, 2:3], ay1 + a[:, 3:4]
+    bx1, by1 = b[:, 0], b[:, 1]
+    bx2, by2 = bx1 + b[:, 2], by1 + b[:, 3]
+    width = np.clip(np.minimum(ax2, bx2) - np.maximum(ax1, bx1), 0, None)
+    height = np.clip(np.minimum(ay2, by2) - np.maximum(ay1, by1), 0, None)
+    intersection = width * height
+    union = (a[:, 2:3] * a[:, 3:4]) + (b[:, 2] * b[:, 3]) - intersection
+    return np.divide(intersection, union, out=np.zeros_like(intersection), where=union > 0)
+
+
+def greedy_match(iou, threshold):
+    """
+    Pairs rows and columns by decreasing IoU, each at most once.
+
+    :return: A list of ``(row, column)`` pairs.
+    """
+    rows, columns = np.nonzero(iou >= threshold)
+    order = np.argsort(-iou[rows, columns], kind="stable")
+    used_rows, used_columns = set(), set()
+    pairs = []
+    for row, column in zip(rows[order].tolist(), columns[order].tolist()):
+        if row not in used_rows and column not in used_columns:
+            used_rows.add(row)
+            used_columns.add(column)
+            pairs.append((row, column))
+    return pairs
+
+
+def reserve_ids(model, count):
+    """
+    Takes ``count`` ids from the primary key sequence of a model, so the rows can reference
+    each other before they are inserted.
+    """
+    if not count:
+        return []
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT nextval(pg_get_serial_sequence(%s, %s)) FROM generate_series(1, %s)",
+            [table, model._meta.pk.column, count],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+class CameraTracks:
+    __slots__ = ("names", "boxes", "track_ids", "last_seen")
+
+    def __init__(self):
+        self.names = np.empty(0, dtype=object)
+        self.boxes = np.empty((0, 4))
+        self.track_ids = np.empty(0, dtype=np.int64)
+        self.last_seen = np.empty(0)
+
+    def copy(self):
+        tracks = CameraTracks()
+        tracks.names = self.names.copy()
+        tracks.boxes = self.boxes.copy()
+        tracks.track_ids = self.track_ids.copy()
+        tracks.last_seen = self.last_seen.copy()
+        return tracks
+
+
+class Tracker:
+    """
+    Assigns track ids to the detections of the photos of every camera.
+
+    :param threshold: Minimum IoU for a detection to continue a track.
+    :param max_gap: Seconds after which a track that is not seen anymore is closed.
+    """
+
+    def __init__(self, threshold=0.3, max_gap=300.0):
+        self.threshold = threshold
+        self.max_gap = max_gap
+        self.cameras = {}
+
+    def update(self, camera_id, captured_at, names, boxes, ids):
+        """
+        Tracks the detections of a photo. The photos of a camera must come in capture order.
+
+        :param names: The class of every detection.
+        :param boxes: An ``(n, 4)`` array of ``x, y, width, height``.
+        :param ids: The ids of the detections, used as the id of the tracks they start.
+        :return: The track id of every detection.
+        """
+        now = captured_at.timestamp() if isinstance(captured_at, datetime) else float(captured_at)
+        state = self.cameras.get(camera_id)
+        if state is None:
+            state = self.cameras[camera_id] = CameraTracks()
+
+        open_tracks = now - state.last_seen <= self.max_gap
+        if not open_tracks.all():
+            state.names = state.names[open_tracks]
+            state.boxes = state.boxes[open_tracks]
+            state.track_ids = state.track_ids[open_tracks]
+            state.last_seen = state.last_seen[open_tracks]
+
+        names = np.asarray(names, dtype=object)
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        track_ids = np.asarray(ids, dtype=np.int64).copy()
+        if not len(names):
+            return track_ids
+
+        iou = iou_matrix(state.boxes, boxes)
+        iou[state.names[:, None] != names[None, :]] = 0.0
+        pairs = greedy_match(iou, self.threshold)
+        matched = np.zeros(len(names), dtype=bool)
+        for track, detection in pairs:
+            track_ids[detection] = state.track_ids[track]
+            state.boxes[track] = boxes[detection]
+            state.last_seen[track] = now
+            matched[detection] = True
+
+        new = ~matched
+        state.names = np.concatenate([state.names, names[new]])
+        state.boxes = np.concatenate([state.boxes, boxes[new]])
+        state.track_ids = np.concatenate([state.track_ids, track_ids[new]])
+        state.last_seen = np.concatenate([state.last_seen, np.full(new.sum(), now)])
+        TRACKS.inc(int(new.sum()))
+        MATCHES.inc(len(pairs))
+        return track_ids
+
+    def snapshot(self, camera_ids):
+        """
+        Returns a copy of the tracks of some cameras, to ``restore`` when their updates are not kept.
+        """
+        return {
+            camera_id: self.cameras[camera_id].copy() if camera_id in self.cameras else None
+            for camera_id in camera_ids
+        }
+
+    def restore(self, snapshot):
+        """
+        Puts back the tracks of a ``snapshot``.
+        """
+        for camera_id, state in snapshot.items():
+            if state is None:
+                self.cameras.pop(camera_id, None)
+            else:
+                self.cameras[camera_id] = state
+
+    def expire(self, now):
+        """
+        Forgets the cameras without an open track at ``now``.
+        """
+        now = now.timestamp() if isinstance(now, datetime) else float(now)
+        for camera_id in [
+            camera_id for camera_id, state in self.cameras.items()
+            if not len(state.last_seen) or now - state.last_seen.max() > self.max_gap
+        ]:
+            del self.cameras[camera_id]
@@ -0,0 +1,15 @@
+from django.urls import path, re_path
+
+from . import views
+
+app_name = "cameras"
+
+urlpatterns = [
+    re_path(
+        r"^(?P<kind>photo|object)s/(?P<pk>\d+)/thumbnails/(?P<size>\w+)\.(?P<ext>jpg|webp)$",
+        views.ThumbnailView.as_view(),
+        name="thumbnail",
+    ),
+    path("videos/<int:pk>/", views.VideoView.as_view(), name="video"),
+    path("search/", views.SearchView.as_view(), name="search"),
+]
@@ -1,3 +1,212 @@
-from django.shortcuts import render
+import mimetypes
+import os
+import re
+from urllib.parse import quote
 
-# Create your views here.
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseRedirect
+from django.utils.cache import patch_cache_control
+from django.utils.http import http_date
+from rest_framework.exceptions import PermissionDenied, ValidationError
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from . import search, storage, thumbnails
+from .models import DetectedObject, Photo, Video
+from .reference import references
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def parse_range(header, size):
+    """
+    Parses a single-range ``Range`` header.
+
+    :param header: The header value, e.g. ``"bytes=1000-"`` or ``"bytes=-500"``.
+    :param size: The size of the file.
+    :return: A ``(start, end)`` pair with an inclusive end, None when the header is absent or
+        not a single byte range (the whole file is served), or ``()`` when unsatisfiable.
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes.
+        length = int(last)
+        return (max(size - length, 0), size - 1) if length and size else ()
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        return ()
+    return start, end
+
+
+class FileRange:
+    """
+    A window of an open file, read by ``FileResponse``.
+
+    It keeps ``fileno`` and leaves the file positioned at the start of the window, so a WSGI
+    server with ``sendfile`` support (gunicorn) sends the range without copying it through
+    Python; otherwise it is read in blocks and never held in memory.
+    """
+
+    def __init__(self, file, start, length):
+        file.seek(start)
+        self.file = file
+        self.name = file.name
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+class RangeFileResponse(FileResponse):
+    block_size = 256 * 1024
+
+
+class ThumbnailView(APIView):
+    """
+    Serves a derivative of a photo or of an object crop, generating it on the first request.
+
+    The URL names the size (a key of ``settings.THUMBNAIL_SIZES``) and the format (``jpg`` or
+    ``webp``). Derivatives never change, so they are cached by the browser for a year. On a
+    remote storage the client is redirected to the file URL, which may be presigned and
+    expire: the redirect is only cached for ``redirect_max_age``, and for at most a quarter of
+    the lifetime of the URLs of the storage (``url_expiry``), as a reused URL has half of it left.
+    """
+
+    permission_classes = [IsAuthenticated]
+    max_age = 365 * 24 * 3600
+    redirect_max_age = 300
+    # (queryset, file field, path to the state id)
+    sources = {
+        "photo": (Photo.objects, "file", "state_id"),
+        "object": (DetectedObject.objects, "image", "photo__state_id"),
+    }
+
+    def get(self, request, kind, pk, size, ext):
+        queryset, field, state_field = self.sources[kind]
+        row = queryset.filter(pk=pk, deleted_at__isnull=True).values_list(field, state_field).first()
+        if row is None or not row[0]:
+            raise Http404
+        name, state_id = row
+        if not request.user.can_view_state(state_id):
+            raise PermissionDenied
+
+        try:
+            target = thumbnails.get_or_create(name, size, ext)
+        except (KeyError, OSError):
+            # Unknown size, or a missing or unreadable original.
+            raise Http404
+
+        path = storage.local_path(target)
+        if path is None:
+            response = HttpResponseRedirect(default_storage.url(target))
+            url_expiry = getattr(default_storage, "url_expiry", None)
+            max_age = self.redirect_max_age if url_expiry is None else min(self.redirect_max_age, url_expiry // 4)
+            patch_cache_control(response, private=True, max_age=max_age)
+            return response
+
+        response = FileResponse(open(path, "rb"), content_type=thumbnails.FORMATS[ext][1])
+        patch_cache_control(response, private=True, max_age=self.max_age, immutable=True)
+        return response
+
+
+class VideoView(APIView):
+    """
+    Serves a video file with support for single ``Range`` requests, so players can seek.
+
+    With ``settings.VIDEO_ACCEL_REDIRECT_PREFIX`` the transfer is handed to the front web
+    server with an ``X-Accel-Redirect`` header. On a remote storage the client is redirected
+    to the file URL. Otherwise the file is streamed from disk without being loaded in memory.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk):
+        row = Video.objects.filter(pk=pk).values_list("file", "camera_id").first()
+        if row is None or not row[0]:
+            raise Http404
+        name, camera_id = row
+        if not request.user.can_view_state(references.get(camera_id).state_id):
+            raise PermissionDenied
+
+        if settings.VIDEO_ACCEL_REDIRECT_PREFIX:
+            response = HttpResponse(content_type=mimetypes.guess_type(name)[0] or "application/octet-stream")
+            response["X-Accel-Redirect"] = quote(settings.VIDEO_ACCEL_REDIRECT_PREFIX + name)
+            return response
+
+        path = storage.local_path(name)
+        if path is None:
+            return HttpResponseRedirect(default_storage.url(name))
+
+        try:
+            file = open(path, "rb")
+        except FileNotFoundError:
+            raise Http404
+        stat = os.fstat(file.fileno())
+        size = stat.st_size
+        last_modified = http_date(stat.st_mtime)
+
+        byte_range = None
+        if request.headers.get("If-Range", last_modified) == last_modified:
+            byte_range = parse_range(request.headers.get("Range"), size)
+
+        if byte_range == ():
+            file.close()
+            response = HttpResponse(status=416)
+            response["Content-Range"] = f"bytes */{size}"
+        elif byte_range is None:
+            response = RangeFileResponse(file)
+        else:
+            start, end = byte_range
+            response = RangeFileResponse(FileRange(file, start, end - start + 1), status=206)
+            response["Content-Length"] = end - start + 1
+            response["Content-Range"] = f"bytes {start}-{end}/{size}"
+        response["Accept-Ranges"] = "bytes"
+        response["Last-Modified"] = last_modified
+        return response
+
+
+class SearchView(APIView):
+    """
+    Searches the cameras, roads and cities of the states the user can see by name, best match first.
+
+    Query parameters: ``q``, ``kind`` (repeatable, among ``camera``, ``road`` and ``city``;
+    all by default) and ``limit`` (per kind, at most 50).
+    """
+
+    permission_classes = [IsAuthenticated]
+    max_limit = 50
+
+    def get(self, request):
+        query = request.query_params.get("q", "").strip()
+        if not query:
+            raise ValidationError({"q": "This parameter is required."})
+        kinds = request.query_params.getlist("kind") or search.KINDS
+        if not set(kinds) <= set(search.KINDS):
+            raise ValidationError({"kind": f"Must be among {', '.join(search.KINDS)}."})
+        try:
+            limit = min(max(int(request.query_params.get("limit", 10)), 1), self.max_limit)
+        except ValueError:
+            limit = 10
+
+        state_ids = None
+        if not request.user.is_staff:
+            state_ids = [state_id for state_id, *_ in request.user.get_assigned_states()]
+        return Response({"query": query, **search.search(query, kinds, state_ids=state_ids, limit=limit)})
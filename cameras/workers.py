@@ -0,0 +1,250 @@
+"""
+Functions run in worker processes.
+
+Workers are spawned, so they unpickle these functions before Django is set up: this
+module must not import models at import time. They don't use the ORM at all, so they only
+load the settings (see ``core.startup.setup_worker``).
+"""
+import hashlib
+import io
+import json
+import os
+import re
+import shutil
+import time
+from dataclasses import replace
+from datetime import datetime, timezone
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.utils.module_loading import import_string
+from PIL import Image
+
+from core.startup import setup_worker
+from . import storage
+
+_detector = None
+
+
+def init_detector_worker(detector_path):
+    setup_worker(apps=False)
+    global _detector
+    _detector = import_string(detector_path)()
+    _detector.load()
+
+
+def load_image(name, size):
+    """
+    Opens a stored photo as RGB, letting the JPEG decoder skip the resolution the detector
+    doesn't use.
+
+    :return: The image and the factor from its coordinates to the photo coordinates.
+    """
+    with default_storage.open(name) as f:
+        with Image.open(f) as image:
+            width = image.width
+            image.draft("RGB", (size, size))
+            image = image.convert("RGB")
+    return image, width / image.width
+
+
+def detect_batch(batch):
+    """
+    Runs the worker's detector on a micro-batch.
+
+    :param batch: A list of ``(photo_id, file_name)``.
+    :return: ``(results, load_seconds, detect_seconds)`` where results is a list of
+        ``(photo_id, detections)`` and detections is None when the file couldn't be read.
+    """
+    started = time.perf_counter()
+    loaded, results = [], []
+    for photo_id, name in batch:
+        try:
+            image, scale = load_image(name, _detector.input_size)
+        except OSError:
+            results.append((photo_id, None))
+        else:
+            loaded.append((photo_id, image, scale))
+    decoded = time.perf_counter()
+
+    detections = _detector.detect([image for _, image, _ in loaded]) if loaded else []
+    for (photo_id, _, scale), objects in zip(loaded, detections):
+        results.append((photo_id, [
+            replace(
+                detection,
+                x=detection.x * scale,
+                y=detection.y * scale,
+                width=detection.width * scale,
+                height=detection.height * scale,
+            )
+            for detection in objects
+        ]))
+    return results, decoded - started, time.perf_counter() - decoded
+
+
+def init_worker():
+    setup_worker(apps=False)
+
+
+def crop_image(image, boxes, quality=90):
+    """
+    Cuts and encodes the boxes of a decoded image.
+
+    :param image: An RGB ``PIL.Image``.
+    :param boxes: A list of ``(key, x, y, width, height)`` in image coordinates.
+    :param quality: The JPEG quality of the crops.
+    :return: A list of ``(key, jpeg, width, height)``; jpeg is None when the box is empty.
+    """
+    crops = []
+    for key, x, y, width, height in boxes:
+        left, top = max(round(x), 0), max(round(y), 0)
+        right, bottom = min(round(x + width), image.width), min(round(y + height), image.height)
+        if right <= left or bottom <= top:
+            crops.append((key, None, 0, 0))
+            continue
+        output = io.BytesIO()
+        image.crop((left, top, right, bottom)).save(output, format="JPEG", quality=quality)
+        crops.append((key, output.getvalue(), right - left, bottom - top))
+    return crops
+
+
+def crop_photo(name, boxes, quality=90):
+    """
+    Decodes a stored photo once and writes the crops of all its boxes.
+
+    :param name: The name of the photo in the default storage.
+    :param boxes: A list of ``(object_id, upload_name, x, y, width, height)``.
+    :return: A list of ``(object_id, saved_name, width, height)``; saved_name is None when the
+        box is empty or the photo couldn't be read.
+    """
+    try:
+        with default_storage.open(name) as f:
+            with Image.open(f) as image:
+                image = image.convert("RGB")
+    except OSError:
+        return [(object_id, None, 0, 0) for object_id, *_ in boxes]
+
+    upload_names = {object_id: upload_name for object_id, upload_name, *_ in boxes}
+    results = []
+    for object_id, jpeg, width, height in crop_image(
+        image, [(object_id, *box) for object_id, _, *box in boxes], quality=quality
+    ):
+        if jpeg is None:
+            results.append((object_id, None, 0, 0))
+        else:
+            saved = default_storage.save(upload_names[object_id], ContentFile(jpeg))
+            results.append((object_id, saved, width, height))
+    return results
+
+
+TIMESTAMP_RE = re.compile(r"(\d{8})[-_T]?(\d{6})")
+
+
+def parse_timestamp(stem):
+    """
+    Reads the UTC capture time in a file name such as ``i-75-20250101-120000``.
+    """
+    match = TIMESTAMP_RE.search(stem)
+    if match is None:
+        return None
+    return datetime.strptime("".join(match.groups()), "%Y%m%d%H%M%S").replace(tzinfo=timezone.utc)
+
+
+def read_labels(label_path, image_path, class_names):
+    """
+    Reads a label file written by the detector.
+
+    A ``.json`` file holds ``{"camera", "captured_at", "detections": [{"name", "conf", "x",
+    "y", "width", "height"}]}`` in pixels, every key but ``detections`` being optional, or
+    only the list of detections. A ``.txt`` file holds YOLO lines
+    ``class x_center y_center width height [conf]`` normalized to the image size.
+
+    :param label_path: The label file, None when the detector found nothing.
+    :return: ``(metadata, detections)`` with detections as ``(name, conf, x, y, width, height)``.
+    """
+    if label_path is None:
+        return {}, []
+    if label_path.endswith(".json"):
+        with open(label_path) as f:
+            data = json.load(f)
+        if isinstance(data, list):
+            data = {"detections": data}
+        detections = [
+            (d["name"], float(d.get("conf", 1.0)), float(d["x"]), float(d["y"]), float(d["width"]), float(d["height"]))
+            for d in data.get("detections", [])
+        ]
+        return data, detections
+
+    detections = []
+    with open(label_path) as f:
+        lines = [line.split() for line in f if line.strip()]
+    if lines:
+        with Image.open(image_path) as image:
+            # Only the header is read.
+            width, height = image.size
+        for values in lines:
+            class_id, cx, cy, w, h = int(values[0]), *map(float, values[1:5])
+            conf = float(values[5]) if len(values) > 5 else 1.0
+            detections.append((
+                class_names[class_id],
+                conf,
+                (cx - w / 2) * width,
+                (cy - h / 2) * height,
+                w * width,
+                h * height,
+            ))
+    return {}, detections
+
+
+def parse_label_files(paths, class_names, media_root, copy_files, camera_states):
+    """
+    Parses a chunk of label files and places their images in the storage.
+
+    The camera is the ``camera`` of a JSON label or the name of the directory, and the capture
+    time its ``captured_at`` or the timestamp in the file name. An image under ``media_root``
+    is referenced where it is; any other one is copied to its storage name when ``copy_files``,
+    under a name derived from its path so a second import finds it in place.
+
+    :param paths: ``(image_path, label_path)`` pairs; label_path is None for an image without label.
+    :param camera_states: Camera slug to state slug.
+    :return: A list of ``(image_path, camera_slug, captured_at, file_name, detections)``, or of
+        ``(image_path, None, None, None, error)`` for the images that cannot be imported.
+    """
+    media_root = os.path.abspath(media_root) + os.sep
+    records = []
+    for image_path, label_path in paths:
+        try:
+            metadata, detections = read_labels(label_path, image_path, class_names)
+            stem = os.path.splitext(os.path.basename(image_path))[0]
+            camera = metadata.get("camera") or os.path.basename(os.path.dirname(image_path))
+            if camera not in camera_states:
+                raise ValueError(f"unknown camera {camera!r}")
+            captured_at = metadata.get("captured_at")
+            captured_at = datetime.fromisoformat(captured_at) if captured_at else parse_timestamp(stem)
+            if captured_at is None:
+                raise ValueError("no capture time")
+            if captured_at.tzinfo is None:
+                captured_at = captured_at.replace(tzinfo=timezone.utc)
+
+            absolute = os.path.abspath(image_path)
+            if absolute.startswith(media_root):
+                name = absolute[len(media_root):].replace(os.sep, "/")
+            elif copy_files:
+                token = hashlib.blake2b(absolute.encode(), digest_size=6).hexdigest()
+                name = storage.photo_name(camera_states[camera], camera, captured_at, token)
+                if not default_storage.exists(name):
+                    try:
+                        target = default_storage.path(name)
+                    except NotImplementedError:
+                        with open(image_path, "rb") as f:
+                            name = default_storage.save(name, f)
+                    else:
+                        os.makedirs(os.path.dirname(target), exist_ok=True)
+                        shutil.copyfile(image_path, target)
+            else:
+                raise ValueError("image outside MEDIA_ROOT, use --copy-files")
+        except (OSError, ValueError, KeyError, IndexError, TypeError) as e:
+            records.append((image_path, None, None, None, f"{type(e).__name__}: {e}"))
+        else:
+            records.append((image_path, camera, captured_at, name, detections))
+    return records
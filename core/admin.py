@@ -0,0 +1,20 @@
+from core.routers import use_replica
+
+
+class ReplicaChangeListMixin:
+    """
+    Reads the changelist pages from the read replica (see ``core.routers``).
+
+    The page is rendered inside the replica scope, as the template evaluates the queryset and
+    the ``list_display`` callables. Only GET requests qualify: bulk actions post to the
+    changelist and read what they change from the primary.
+    """
+
+    def changelist_view(self, request, extra_context=None):
+        if request.method != "GET":
+            return super().changelist_view(request, extra_context)
+        with use_replica():
+            response = super().changelist_view(request, extra_context)
+            if hasattr(response, "render"):
+                response.render()
+        return response
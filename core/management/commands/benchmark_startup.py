@@ -0,0 +1,90 @@
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.startup import FULL_SETTINGS, WORKER_SETTINGS, parse_importtime
+
+SETUP_SNIPPET = 'import django; django.setup()'
+SETTINGS_ONLY_SNIPPET = 'from core.startup import setup_worker; setup_worker(apps=False)'
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure the cold start of fresh processes per settings module: Django setup alone, and a '
+        'management command including its system checks, with an -X importtime breakdown'
+    )
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--settings-module',
+            action='append',
+            dest='settings_modules',
+            help=f'Settings module to measure, repeatable (default: {FULL_SETTINGS} and {WORKER_SETTINGS})'
+        )
+        parser.add_argument('--command', type=str, default='check', help='Command line timed (default: check)')
+        parser.add_argument('--import', action='append', dest='imports', default=[], help='Module also imported after the setup, repeatable')
+        parser.add_argument('--runs', type=int, default=5, help='Runs per measure, the median is reported (default: 5)')
+        parser.add_argument('--top', type=int, default=15, help='Packages and modules listed (default: 15)')
+
+    def time_process(self, arguments, settings_module, runs):
+        environment = {**os.environ, 'DJANGO_SETTINGS_MODULE': settings_module}
+        durations = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            subprocess.run(arguments, env=environment, check=True, capture_output=True, cwd=settings.BASE_DIR)
+            durations.append(time.perf_counter() - started)
+        return statistics.median(durations)
+
+    def handle(self, *args, **options):
+        snippet = '; '.join([SETUP_SNIPPET, *(f'import {module}' for module in options['imports'])])
+        command = [sys.executable, 'manage.py', *options['command'].split()]
+        baseline = self.time_process([sys.executable, '-c', 'pass'], FULL_SETTINGS, options['runs'])
+        self.stdout.write(f'Bare interpreter: {baseline * 1000:.0f}ms')
+
+        results = {}
+        for settings_module in options['settings_modules'] or [FULL_SETTINGS, WORKER_SETTINGS]:
+            setup = self.time_process([sys.executable, '-c', snippet], settings_module, options['runs'])
+            run = self.time_process(command, settings_module, options['runs'])
+            results[settings_module] = setup, run
+
+            output = subprocess.run(
+                [sys.executable, '-X', 'importtime', '-c', snippet],
+                env={**os.environ, 'DJANGO_SETTINGS_MODULE': settings_module},
+                check=True,
+                capture_output=True,
+                text=True,
+                cwd=settings.BASE_DIR,
+            ).stderr
+            modules, packages = parse_importtime(output)
+
+            self.stdout.write(self.style.SUCCESS(
+                f'\n{settings_module}: setup {setup * 1000:.0f}ms, '
+                f'"manage.py {options["command"]}" {run * 1000:.0f}ms, {len(modules)} modules imported'
+            ))
+            self.stdout.write('  Self import time per package:')
+            for package, self_us in packages.most_common(options['top']):
+                self.stdout.write(f'    {self_us / 1000:>8.1f}ms  {package}')
+            self.stdout.write('  Slowest modules, cumulative:')
+            for self_us, cumulative_us, module in sorted(modules, reverse=True, key=lambda m: m[1])[:options['top']]:
+                self.stdout.write(f'    {cumulative_us / 1000:>8.1f}ms  {module}')
+
+        (first, (first_setup, first_run)), *others = results.items()
+        for settings_module, (setup, run) in others:
+            self.stdout.write(self.style.SUCCESS(
+                f'\n{settings_module} vs {first}: setup {setup / first_setup:.0%}, '
+                f'command {run / first_run:.0%} of the time'
+            ))
+
+        # What the spawned workers that don't use the ORM run (see core.startup.setup_worker).
+        snippet = '; '.join([SETTINGS_ONLY_SNIPPET, *(f'import {module}' for module in options['imports'])])
+        settings_only = self.time_process([sys.executable, '-c', snippet], FULL_SETTINGS, options['runs'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Settings-only worker start: {settings_only * 1000:.0f}ms, '
+            f'{settings_only / first_setup:.0%} of the {first} setup'
+        ))
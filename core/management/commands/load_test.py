@@ -0,0 +1,150 @@
+import asyncio
+import json
+import time
+from collections import defaultdict
+
+import aiohttp
+from django.core.management.base import BaseCommand, CommandError
+
+DEFAULT_PATHS = [
+    '/admin/',
+    '/admin/cameras/camera/',
+    '/admin/cameras/photo/',
+    '/admin/states/state/',
+    '/api/analytics/dashboard/',
+]
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(int(q * len(values)), len(values) - 1)]
+
+
+async def login(session, base_url, username, password):
+    """
+    Logs in through the admin login form, leaving the session cookie in the session.
+    """
+    async with session.get(f'{base_url}/admin/login/') as response:
+        await response.read()
+    csrf = session.cookie_jar.filter_cookies(base_url).get('csrftoken')
+    if csrf is None:
+        raise CommandError('No CSRF cookie from /admin/login/')
+    async with session.post(
+        f'{base_url}/admin/login/?next=/admin/',
+        data={'username': username, 'password': password, 'csrfmiddlewaretoken': csrf.value},
+        headers={'Referer': f'{base_url}/admin/login/'},
+        allow_redirects=False,
+    ) as response:
+        if response.status != 302:
+            raise CommandError(f'Login failed ({response.status})')
+
+
+async def run(base_url, paths, username, password, concurrency, duration, warmup):
+    """
+    Requests the paths in turn from ``concurrency`` clients for ``warmup + duration`` seconds.
+
+    :return: Path to ``(latencies, errors)`` of the requests after the warmup.
+    """
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=60)) as session:
+        if username:
+            await login(session, base_url, username, password)
+        started = time.perf_counter()
+        measured_from = started + warmup
+        deadline = measured_from + duration
+
+        async def client(offset):
+            index = offset
+            while time.perf_counter() < deadline:
+                path = paths[index % len(paths)]
+                index += 1
+                sent = time.perf_counter()
+                try:
+                    async with session.get(f'{base_url}{path}', allow_redirects=False) as response:
+                        await response.read()
+                        failed = response.status >= 400
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    failed = True
+                if sent < measured_from:
+                    continue
+                if failed:
+                    errors[path] += 1
+                else:
+                    latencies[path].append(time.perf_counter() - sent)
+
+        await asyncio.gather(*(client(offset) for offset in range(concurrency)))
+    return {path: (latencies[path], errors[path]) for path in paths}
+
+
+class Command(BaseCommand):
+    help = (
+        'Load-test a running server on the admin and API endpoints and report requests/sec and '
+        'latency percentiles; save a run and compare another one against it to measure a change'
+    )
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', type=str, default='http://127.0.0.1:8000', help='Server base URL')
+        parser.add_argument('--path', action='append', dest='paths', help='Path to request, repeatable (default: admin and API pages)')
+        parser.add_argument('--username', type=str, help='Staff user logged in through the admin before the run')
+        parser.add_argument('--password', type=str, default='')
+        parser.add_argument('--concurrency', type=int, default=32, help='Concurrent clients (default: 32)')
+        parser.add_argument('--duration', type=float, default=20, help='Measured seconds (default: 20)')
+        parser.add_argument('--warmup', type=float, default=3, help='Seconds before measuring (default: 3)')
+        parser.add_argument('--save', type=str, help='Write the results to this JSON file')
+        parser.add_argument('--compare', type=str, help='JSON file of a previous run to compare with')
+
+    def handle(self, *args, **options):
+        base_url = options['url'].rstrip('/')
+        paths = options['paths'] or DEFAULT_PATHS
+        results = asyncio.run(run(
+            base_url,
+            paths,
+            options['username'],
+            options['password'],
+            options['concurrency'],
+            options['duration'],
+            options['warmup'],
+        ))
+
+        report = {}
+        for path, (latencies, errors) in results.items():
+            report[path] = {
+                'requests': len(latencies),
+                'errors': errors,
+                'rps': len(latencies) / options['duration'],
+                'p50_ms': (percentile(latencies, 0.5) or 0) * 1000,
+                'p99_ms': (percentile(latencies, 0.99) or 0) * 1000,
+            }
+        all_latencies = [latency for latencies, _ in results.values() for latency in latencies]
+        report['total'] = {
+            'requests': len(all_latencies),
+            'errors': sum(errors for _, errors in results.values()),
+            'rps': len(all_latencies) / options['duration'],
+            'p50_ms': (percentile(all_latencies, 0.5) or 0) * 1000,
+            'p99_ms': (percentile(all_latencies, 0.99) or 0) * 1000,
+        }
+
+        baseline = {}
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)
+
+        self.stdout.write(f'{"path":<40} {"req/s":>9} {"p50 ms":>9} {"p99 ms":>9} {"errors":>7}')
+        for path, row in report.items():
+            line = f'{path:<40} {row["rps"]:>9.1f} {row["p50_ms"]:>9.1f} {row["p99_ms"]:>9.1f} {row["errors"]:>7}'
+            before = baseline.get(path)
+            if before:
+                line += (
+                    f'   (before: {before["rps"]:.1f} req/s, p99 {before["p99_ms"]:.1f} ms)'
+                )
+            self.stdout.write(self.style.SUCCESS(line) if path == 'total' else line)
+
+        if options['save']:
+            with open(options['save'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f'Saved to {options["save"]}')
@@ -0,0 +1,49 @@
+import argparse
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+from core.profiling import QueryProfile
+
+
+class Command(BaseCommand):
+    help = (
+        'Run a management command and report its queries: count, database time, most repeated '
+        'fingerprints, N+1 patterns and slow queries with their plans. Only the queries of the '
+        'main thread are seen, not the ones of worker threads or processes.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=10, help='Fingerprints listed (default: 10)')
+        parser.add_argument('--n-plus-one', type=int, help='Runs of a fingerprint flagged as N+1 (default: QUERY_PROFILING_N_PLUS_ONE)')
+        parser.add_argument('--slow-ms', type=float, help='Slow query threshold in ms (default: QUERY_PROFILING_SLOW_MS)')
+        parser.add_argument('--explain-rate', type=float, default=1.0, help='Share of the slow queries explained (default: 1)')
+        parser.add_argument('command_name', help='The command to profile')
+        parser.add_argument('command_args', nargs=argparse.REMAINDER, help='Its arguments')
+
+    def handle(self, *args, **options):
+        name = options['command_name']
+        with QueryProfile(
+            name,
+            n_plus_one=options['n_plus_one'],
+            slow_ms=options['slow_ms'],
+            explain_rate=options['explain_rate'],
+        ) as profile:
+            call_command(name, *options['command_args'], stdout=self.stdout, stderr=self.stderr)
+
+        self.stdout.write(f'\n{"=" * 50}\n{profile.summary()}')
+        self.stdout.write('\nMost repeated queries:')
+        for key, count in profile.fingerprints.most_common(options['top']):
+            self.stdout.write(f'  {count:>7}  {key[:200]}')
+
+        for key, count in profile.repeated:
+            self.stdout.write(self.style.WARNING(f'\nN+1: {count} runs of {key[:200]}\n{profile.stacks[key]}'))
+        for elapsed, sql, plan in profile.explain():
+            self.stdout.write(self.style.WARNING(f'\nSlow query ({elapsed * 1000:.1f}ms): {sql[:500]}'))
+            if plan:
+                self.stdout.write(plan)
+
+        style = self.style.WARNING if profile.repeated or profile.slow else self.style.SUCCESS
+        self.stdout.write(style(
+            f'\n{len(profile.repeated)} N+1 patterns, {len(profile.slow)} slow queries'
+        ))
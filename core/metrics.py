@@ -0,0 +1,322 @@
+"""
+Minimal in-process metrics shared by the workers and management commands.
+
+Metrics are created once at import time through ``counter``, ``gauge`` and ``histogram``
+and kept in ``REGISTRY`` by name, so calling one of them again returns the same object.
+
+With the ``METRICS_DIR`` environment variable, the processes of a host aggregate their
+metrics: every process writes a snapshot of its own to ``<METRICS_DIR>/<pid>-<id>.json``
+every ``FLUSH_INTERVAL`` seconds and when it exits, and ``render`` merges the snapshots of
+all of them, so one scrape of any gunicorn worker reports the whole server. Counters and
+histograms are summed, and those of the processes that exited are folded into
+``archive.json`` so the totals never go down when a worker is recycled; gauges are summed
+over the running processes only.
+"""
+import atexit
+import bisect
+import fcntl
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+
+REGISTRY = {}
+_lock = threading.Lock()
+
+FLUSH_INTERVAL = 5.0
+ARCHIVE = "archive.json"
+_directory = os.getenv("METRICS_DIR") or None
+_snapshot_name = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Counter:
+    type = "counter"
+
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def reset(self):
+        with self._lock:
+            self.value = 0
+
+    def record(self):
+        return {"value": self.value}
+
+
+class Gauge:
+    type = "gauge"
+
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+    def reset(self):
+        self.value = 0
+
+    def record(self):
+        return {"value": self.value}
+
+
+class Histogram:
+    type = "histogram"
+
+    def __init__(self, name, documentation, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self):
+        """
+        Returns the current bucket counts, to pass as ``since`` to ``quantile``.
+        """
+        with self._lock:
+            return list(self.counts)
+
+    def reset(self):
+        with self._lock:
+            self.counts = [0] * (len(self.buckets) + 1)
+            self.sum = 0.0
+            self.count = 0
+
+    def record(self):
+        with self._lock:
+            return {"buckets": list(self.buckets), "counts": list(self.counts), "sum": self.sum, "count": self.count}
+
+    def quantile(self, q, since=None):
+        """
+        Returns the upper bound of the bucket holding the ``q`` quantile, or None when empty.
+
+        :param since: A ``snapshot``: only the observations made after it count, e.g. those of
+            the current cycle of a loop, while the exported buckets stay cumulative.
+        """
+        counts = self.snapshot()
+        if since is not None:
+            counts = [count - before for count, before in zip(counts, since)]
+        total = sum(counts)
+        if not total:
+            return None
+        rank = q * total
+        seen = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+def _get_or_create(cls, name, *args, **kwargs):
+    with _lock:
+        metric = REGISTRY.get(name)
+        if metric is None:
+            metric = REGISTRY[name] = cls(name, *args, **kwargs)
+        elif not isinstance(metric, cls):
+            raise ValueError(f"Metric {name} is already registered as a {metric.type}.")
+        return metric
+
+
+def counter(name, documentation):
+    return _get_or_create(Counter, name, documentation)
+
+
+def gauge(name, documentation):
+    return _get_or_create(Gauge, name, documentation)
+
+
+def histogram(name, documentation, buckets=DEFAULT_BUCKETS):
+    return _get_or_create(Histogram, name, documentation, buckets=buckets)
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def records():
+    """
+    Returns the metrics of this process as JSON-serializable dicts by name.
+    """
+    with _lock:
+        registered = list(REGISTRY.values())
+    return {
+        metric.name: {"type": metric.type, "documentation": metric.documentation, **metric.record()}
+        for metric in registered
+    }
+
+
+def merge(total, added, gauges=True):
+    """
+    Adds the ``records`` of a process to ``total``; the ones whose type or buckets differ are
+    skipped.
+    """
+    for name, record in added.items():
+        if record["type"] == "gauge" and not gauges:
+            continue
+        current = total.get(name)
+        if current is None:
+            total[name] = {**record, "counts": list(record["counts"])} if "counts" in record else dict(record)
+        elif current["type"] != record["type"] or current.get("buckets") != record.get("buckets"):
+            continue
+        elif "counts" in record:
+            current["counts"] = [a + b for a, b in zip(current["counts"], record["counts"])]
+            current["sum"] += record["sum"]
+            current["count"] += record["count"]
+        else:
+            current["value"] += record["value"]
+    return total
+
+
+def snapshot_path():
+    global _snapshot_name
+    if _snapshot_name is None or not _snapshot_name.startswith(f"{os.getpid()}-"):
+        # The id tells a process from an earlier one with the same pid.
+        _snapshot_name = f"{os.getpid()}-{uuid.uuid4().hex[:8]}.json"
+    return os.path.join(_directory, _snapshot_name)
+
+
+def write_snapshot():
+    """
+    Writes the snapshot of this process to the metrics directory.
+    """
+    if _directory is None:
+        return
+    os.makedirs(_directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=_directory, prefix=".tmp-")
+    with os.fdopen(fd, "w") as f:
+        json.dump(records(), f)
+    os.replace(tmp, snapshot_path())
+
+
+def running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def read(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def collect():
+    """
+    Returns the merged ``records`` of the processes sharing the metrics directory, or the
+    ones of this process without a directory.
+    """
+    if _directory is None:
+        return records()
+    write_snapshot()
+    total = {}
+    with open(os.path.join(_directory, ".lock"), "a") as lock:
+        # One process at a time folds the snapshots of the exited ones into the archive.
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        archive_path = os.path.join(_directory, ARCHIVE)
+        archive = read(archive_path)
+        exited = []
+        for filename in sorted(os.listdir(_directory)):
+            if not filename.endswith(".json") or filename == ARCHIVE or filename.startswith("."):
+                continue
+            path = os.path.join(_directory, filename)
+            pid = int(filename.split("-", 1)[0])
+            if running(pid):
+                merge(total, read(path))
+            else:
+                merge(archive, read(path), gauges=False)
+                exited.append(path)
+        if exited:
+            fd, tmp = tempfile.mkstemp(dir=_directory, prefix=".tmp-")
+            with os.fdopen(fd, "w") as f:
+                json.dump(archive, f)
+            os.replace(tmp, archive_path)
+            for path in exited:
+                os.remove(path)
+    return merge(total, archive)
+
+
+def format_records(collected):
+    lines = []
+    for name, record in sorted(collected.items()):
+        lines.append(f"# HELP {name} {record['documentation']}")
+        lines.append(f"# TYPE {name} {record['type']}")
+        if record["type"] == "histogram":
+            cumulative = 0
+            for bound, bucket_count in zip(record["buckets"] + [float("inf")], record["counts"]):
+                cumulative += bucket_count
+                lines.append(f'{name}_bucket{{le="{format_value(bound)}"}} {cumulative}')
+            lines.append(f"{name}_sum {format_value(record['sum'])}")
+            lines.append(f"{name}_count {record['count']}")
+        else:
+            lines.append(f"{name} {format_value(record['value'])}")
+    return "\n".join(lines) + "\n"
+
+
+def render():
+    """
+    Returns the metrics in the Prometheus text exposition format, those of every process of
+    the host with ``METRICS_DIR``.
+    """
+    return format_records(collect())
+
+
+def _write_periodically():
+    while True:
+        time.sleep(FLUSH_INTERVAL)
+        try:
+            write_snapshot()
+        except OSError:
+            logger.warning("Could not write the metrics snapshot", exc_info=True)
+
+
+def _start_writer():
+    threading.Thread(target=_write_periodically, name="metrics-writer", daemon=True).start()
+
+
+def _after_fork():
+    # The counts of the parent are in its own snapshot.
+    with _lock:
+        registered = list(REGISTRY.values())
+    for metric in registered:
+        metric.reset()
+    _start_writer()
+
+
+if _directory is not None:
+    _start_writer()
+    atexit.register(write_snapshot)
+    os.register_at_fork(after_in_child=_after_fork)
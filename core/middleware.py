@@ -0,0 +1,50 @@
+from django.conf import settings
+
+from .profiling import QueryProfile
+from .routers import STICKY_COOKIE, routing_state
+
+
+class QueryProfilingMiddleware:
+    """
+    Profiles the queries of every request (see ``core.profiling``).
+
+    It logs the N+1 patterns and slow queries of the request and adds its query count and
+    database time as ``X-DB-Queries`` and ``X-DB-Time`` headers. Enabled with the
+    ``QUERY_PROFILING`` environment variable, as it costs a few microseconds per query.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with QueryProfile(f"{request.method} {request.path}") as profile:
+            response = self.get_response(request)
+        profile.log()
+        response["X-DB-Queries"] = str(profile.count)
+        response["X-DB-Time"] = f"{profile.duration * 1000:.1f}ms"
+        return response
+
+
+class ReplicaStickinessMiddleware:
+    """
+    Keeps the reads of a user on the primary database after their own writes (see ``core.routers``).
+
+    A request that writes sets a cookie for ``REPLICA_STICKY_SECONDS``; while it is present,
+    the reads that could go to the replica go to the primary.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with routing_state(pinned=STICKY_COOKIE in request.COOKIES) as state:
+            response = self.get_response(request)
+        if state.wrote:
+            response.set_cookie(
+                STICKY_COOKIE,
+                "1",
+                max_age=settings.REPLICA_STICKY_SECONDS,
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
@@ -0,0 +1,172 @@
+"""
+Opt-in instrumentation of the database queries of a request or a management command.
+
+``QueryProfile`` installs an execute wrapper on every database connection of the current
+thread and records the number of queries, their total time and how often each SQL
+fingerprint (the statement with its literals and ``IN`` lists collapsed) ran. A fingerprint
+repeated ``n_plus_one`` times is reported as an N+1 pattern together with the application
+frames that issued it. Queries slower than ``slow_ms`` (the first ``max_slow`` of them) are logged
+and, for an ``explain_rate`` share of them, explained once the profile is finished.
+
+It is used by ``core.middleware.QueryProfilingMiddleware`` and the ``profile_queries``
+command, and feeds the metrics served at ``/metrics``.
+"""
+import functools
+import logging
+import random
+import re
+import time
+import traceback
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from core import metrics
+
+logger = logging.getLogger(__name__)
+
+QUERIES = metrics.counter("db_queries_total", "Database queries run by profiled requests and commands.")
+QUERY_SECONDS = metrics.histogram("db_query_seconds", "Time of a database query.")
+QUERIES_PER_UNIT = metrics.histogram(
+    "db_queries_per_profile",
+    "Database queries of a profiled request or command.",
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 5000),
+)
+N_PLUS_ONE = metrics.counter("db_n_plus_one_total", "Repeated query fingerprints flagged as N+1 patterns.")
+SLOW_QUERIES = metrics.counter("db_slow_queries_total", "Queries slower than the slow query threshold.")
+
+STRING_RE = re.compile(r"'(?:''|[^'])*'")
+NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+IN_LIST_RE = re.compile(r"\(\s*(?:(?:%s|\?)\s*,\s*)+(?:%s|\?)\s*\)")
+SPACE_RE = re.compile(r"\s+")
+
+
+@functools.lru_cache(maxsize=4096)
+def fingerprint(sql):
+    """
+    Returns the SQL with its literals replaced by ``?`` and its parameter lists collapsed,
+    so the queries of a loop share a fingerprint whatever their values.
+    """
+    sql = STRING_RE.sub("?", sql)
+    sql = NUMBER_RE.sub("?", sql)
+    sql = IN_LIST_RE.sub("(...)", sql)
+    return SPACE_RE.sub(" ", sql).strip()
+
+
+def application_stack(limit=8):
+    """
+    Returns the innermost frames of the current stack that belong to the project, formatted.
+    """
+    root = str(settings.BASE_DIR)
+    frames = [
+        frame for frame in traceback.extract_stack()[:-1]
+        if frame.filename.startswith(root)
+        and "site-packages" not in frame.filename
+        and not frame.filename.endswith(("core/profiling.py", "core/middleware.py"))
+    ]
+    return "".join(traceback.format_list(frames[-limit:]))
+
+
+class QueryProfile:
+    """
+    Records the queries run on this thread while active.
+
+    Usage::
+
+        with QueryProfile("capture_frames") as profile:
+            ...
+        profile.log()
+
+    :param label: What is profiled, e.g. the request path.
+    :param n_plus_one: Number of runs of a fingerprint from which it is flagged.
+    :param slow_ms: Duration in milliseconds from which a query is logged as slow.
+    :param explain_rate: Share of the slow ``SELECT`` queries explained.
+    """
+
+    max_slow = 100
+
+    def __init__(self, label, n_plus_one=None, slow_ms=None, explain_rate=None):
+        self.label = label
+        self.n_plus_one = n_plus_one or settings.QUERY_PROFILING_N_PLUS_ONE
+        self.slow_ms = slow_ms if slow_ms is not None else settings.QUERY_PROFILING_SLOW_MS
+        self.explain_rate = explain_rate if explain_rate is not None else settings.QUERY_PROFILING_EXPLAIN_RATE
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints = Counter()
+        self.stacks = {}
+        self.slow = []
+        self._stack = None
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.count += 1
+            self.duration += elapsed
+            QUERIES.inc()
+            QUERY_SECONDS.observe(elapsed)
+            key = fingerprint(sql)
+            self.fingerprints[key] += 1
+            if self.fingerprints[key] == self.n_plus_one:
+                # Only the stack of the flagged fingerprints is captured, once each.
+                self.stacks[key] = application_stack()
+            if elapsed * 1000 >= self.slow_ms:
+                SLOW_QUERIES.inc()
+                if len(self.slow) < self.max_slow:
+                    self.slow.append((elapsed, sql, params, many, context["connection"].alias))
+
+    def __enter__(self):
+        self._stack = ExitStack()
+        for connection in connections.all():
+            self._stack.enter_context(connection.execute_wrapper(self))
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stack.close()
+        QUERIES_PER_UNIT.observe(self.count)
+        N_PLUS_ONE.inc(len(self.stacks))
+
+    @property
+    def repeated(self):
+        """
+        The ``(fingerprint, count)`` pairs flagged as N+1 patterns, most frequent first.
+        """
+        return [(key, count) for key, count in self.fingerprints.most_common() if key in self.stacks]
+
+    def explain(self):
+        """
+        Explains a sample of the slow ``SELECT`` queries.
+
+        :return: A ``(seconds, sql, plan)`` tuple per slow query, where the plan is None for
+            the queries not sampled.
+        """
+        plans = []
+        for elapsed, sql, params, many, alias in self.slow:
+            plan = None
+            if not many and sql.lstrip().upper().startswith("SELECT") and random.random() < self.explain_rate:
+                connection = connections[alias]
+                try:
+                    with connection.cursor() as cursor:
+                        cursor.execute(f"{connection.ops.explain_query_prefix()} {sql}", params)
+                        plan = "\n".join(" ".join(map(str, row)) for row in cursor.fetchall())
+                except Exception as e:
+                    # E.g. the query used a temporary table that is gone by now.
+                    plan = f"(not explained: {e})"
+            plans.append((elapsed, sql, plan))
+        return plans
+
+    def summary(self):
+        return f"{self.label}: {self.count} queries in {self.duration * 1000:.1f}ms"
+
+    def log(self):
+        """
+        Logs the N+1 patterns and the slow queries, with the plans of the sampled ones.
+        """
+        for key, count in self.repeated:
+            logger.warning("%s: N+1 query ran %d times: %s\n%s", self.label, count, key, self.stacks[key])
+        for elapsed, sql, plan in self.explain():
+            logger.warning("%s: slow query (%.1fms): %s%s", self.label, elapsed * 1000, sql, f"\n{plan}" if plan else "")
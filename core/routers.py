@@ -0,0 +1,166 @@
+"""
+Routing of the heavy read-only queries to a read replica.
+
+Only the code running inside ``use_replica`` (dashboards, exports, admin changelists) reads
+from the ``replica`` database; everything else, and every write, uses ``default``. Inside
+that scope the reads still go to the primary when:
+
+* the request already wrote, or the user wrote less than ``REPLICA_STICKY_SECONDS`` ago
+  (``ReplicaStickinessMiddleware`` pins them with a cookie), so users read their own writes;
+* the replica lags more than ``REPLICA_MAX_LAG`` seconds behind, or cannot be reached. Its lag
+  is measured at most every ``REPLICA_LAG_CHECK_INTERVAL`` seconds per process.
+
+Without a ``replica`` entry in ``DATABASES`` everything uses ``default``.
+"""
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+from . import metrics
+
+REPLICA_DB_ALIAS = "replica"
+STICKY_COOKIE = "replica_pin"
+
+REPLICA_LAG = metrics.gauge("db_replica_lag_seconds", "Replication lag of the read replica at the last check.")
+REPLICA_READS = metrics.counter("db_replica_reads_total", "Reads routed to the read replica.")
+REPLICA_FALLBACKS = metrics.counter(
+    "db_replica_fallbacks_total", "Replica-eligible reads sent to the primary for stickiness, lag or errors."
+)
+
+LAG_SQL = """
+SELECT CASE
+    WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+END
+"""
+
+
+class RoutingState:
+    """
+    Routing state of a request or a block of code; mutable so that the changes made in a
+    thread running a sync view are seen by the middleware around it.
+    """
+
+    def __init__(self, replica=False, pinned=False):
+        self.replica = replica
+        self.pinned = pinned
+        self.wrote = False
+
+
+_state = contextvars.ContextVar("db_routing_state", default=None)
+
+
+class LagMonitor:
+    """
+    Measures the replication lag of the replica, at most once every ``interval`` seconds.
+    """
+
+    def __init__(self):
+        self.checked_at = float("-inf")
+        self.available = False
+        self._lock = threading.Lock()
+
+    def replica_usable(self):
+        interval = settings.REPLICA_LAG_CHECK_INTERVAL
+        if time.monotonic() - self.checked_at < interval:
+            return self.available
+        with self._lock:
+            if time.monotonic() - self.checked_at >= interval:
+                self.available = self.check()
+                self.checked_at = time.monotonic()
+        return self.available
+
+    def check(self):
+        try:
+            with connections[REPLICA_DB_ALIAS].cursor() as cursor:
+                cursor.execute(LAG_SQL)
+                lag = float(cursor.fetchone()[0])
+        except DatabaseError:
+            # Unreachable: use the primary until the next check.
+            return False
+        REPLICA_LAG.set(lag)
+        return lag <= settings.REPLICA_MAX_LAG
+
+    def expire(self):
+        self.checked_at = float("-inf")
+
+
+lag_monitor = LagMonitor()
+
+
+def has_replica():
+    return REPLICA_DB_ALIAS in settings.DATABASES
+
+
+def read_alias():
+    """
+    Returns the database the replica-eligible reads of the current code should use now.
+
+    Useful for querysets evaluated later, such as streamed responses: ``queryset.using(read_alias())``.
+    """
+    state = _state.get()
+    if not has_replica():
+        return DEFAULT_DB_ALIAS
+    if state is not None and (state.pinned or state.wrote) or not lag_monitor.replica_usable():
+        REPLICA_FALLBACKS.inc()
+        return DEFAULT_DB_ALIAS
+    REPLICA_READS.inc()
+    return REPLICA_DB_ALIAS
+
+
+@contextmanager
+def use_replica():
+    """
+    Lets the reads of the block go to the replica; usable as a decorator.
+    """
+    current = _state.get()
+    token = _state.set(RoutingState(replica=True, pinned=current is not None and (current.pinned or current.wrote)))
+    try:
+        yield
+    finally:
+        state = _state.get()
+        _state.reset(token)
+        if current is not None and state.wrote:
+            current.wrote = True
+
+
+@contextmanager
+def routing_state(pinned=False):
+    """
+    Tracks the writes of a block, e.g. a request, and returns its ``RoutingState``.
+    """
+    state = RoutingState(pinned=pinned)
+    token = _state.set(state)
+    try:
+        yield state
+    finally:
+        _state.reset(token)
+
+
+class ReplicaRouter:
+    """
+    Sends the reads of ``use_replica`` blocks to the replica and everything else to the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or not state.replica:
+            return None
+        return read_alias()
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both databases hold the same data.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
@@ -0,0 +1,191 @@
+"""
+Local stand-in for an S3-compatible object store, used to exercise ``SpooledS3Storage``.
+
+Objects are kept in memory. It implements what the storage uses: put, get (with ranges),
+head, delete, ``ListObjectsV2`` and the multipart upload calls. Signatures are not checked.
+"""
+import asyncio
+import hashlib
+import threading
+import uuid
+from collections import Counter, defaultdict
+from xml.sax.saxutils import escape
+
+from aiohttp import web
+
+XMLNS = "http://s3.amazonaws.com/doc/2006-03-01/"
+
+
+def xml(body, status=200):
+    return web.Response(
+        status=status,
+        body=f'<?xml version="1.0" encoding="UTF-8"?>\n{body}'.encode(),
+        content_type="application/xml",
+    )
+
+
+def error(code, status):
+    return xml(f"<Error><Code>{code}</Code><Message>{code}</Message></Error>", status)
+
+
+class StubS3Server:
+    """
+    Runs the stub object store on a background thread.
+
+    Usage::
+
+        with StubS3Server() as server:
+            storage = SpooledS3Storage("bucket", endpoint_url=server.endpoint_url)
+
+    :param fail_every: When set, every n-th object or part upload answers ``500``.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, fail_every=0):
+        self.host = host
+        self.port = port
+        self.fail_every = fail_every
+        self.buckets = defaultdict(dict)
+        self.uploads = {}
+        self.requests = Counter()
+        self._loop = None
+        self._runner = None
+        self._thread = None
+        self._started = threading.Event()
+
+    @property
+    def endpoint_url(self):
+        return f"http://{self.host}:{self.port}"
+
+    def application(self):
+        app = web.Application(client_max_size=1024 ** 3)
+        app.router.add_get("/{bucket}", self.list_objects)
+        app.router.add_route("*", "/{bucket}/{key:.+}", self.object)
+        return app
+
+    async def list_objects(self, request):
+        self.requests["list"] += 1
+        bucket = self.buckets[request.match_info["bucket"]]
+        prefix = request.query.get("prefix", "")
+        delimiter = request.query.get("delimiter", "")
+        keys, prefixes = [], set()
+        for key in sorted(bucket):
+            if not key.startswith(prefix):
+                continue
+            rest = key[len(prefix):]
+            if delimiter and delimiter in rest:
+                prefixes.add(prefix + rest.split(delimiter, 1)[0] + delimiter)
+            else:
+                keys.append(key)
+        contents = "".join(
+            f"<Contents><Key>{escape(key)}</Key><Size>{len(bucket[key][0])}</Size>"
+            f"<ETag>&quot;{bucket[key][1]}&quot;</ETag></Contents>"
+            for key in keys
+        )
+        common = "".join(f"<CommonPrefixes><Prefix>{escape(p)}</Prefix></CommonPrefixes>" for p in sorted(prefixes))
+        return xml(
+            f'<ListBucketResult xmlns="{XMLNS}"><Name>{request.match_info["bucket"]}</Name>'
+            f"<Prefix>{escape(prefix)}</Prefix><KeyCount>{len(keys) + len(prefixes)}</KeyCount>"
+            f"<IsTruncated>false</IsTruncated>{contents}{common}</ListBucketResult>"
+        )
+
+    def failing(self):
+        self.requests["uploads"] += 1
+        return self.fail_every and self.requests["uploads"] % self.fail_every == 0
+
+    async def object(self, request):
+        bucket = self.buckets[request.match_info["bucket"]]
+        key = request.match_info["key"]
+        query = request.query
+        self.requests[request.method] += 1
+
+        if request.method == "POST" and "uploads" in query:
+            upload_id = uuid.uuid4().hex
+            self.uploads[upload_id] = ({}, request.headers.get("Content-Type", "binary/octet-stream"))
+            return xml(
+                f'<InitiateMultipartUploadResult xmlns="{XMLNS}"><Bucket>{request.match_info["bucket"]}</Bucket>'
+                f"<Key>{escape(key)}</Key><UploadId>{upload_id}</UploadId></InitiateMultipartUploadResult>"
+            )
+        if request.method == "PUT" and "uploadId" in query:
+            if query["uploadId"] not in self.uploads:
+                return error("NoSuchUpload", 404)
+            if self.failing():
+                return error("InternalError", 500)
+            data = await request.read()
+            etag = hashlib.md5(data).hexdigest()
+            self.uploads[query["uploadId"]][0][int(query["partNumber"])] = data
+            return web.Response(headers={"ETag": f'"{etag}"'})
+        if request.method == "POST" and "uploadId" in query:
+            if query["uploadId"] not in self.uploads:
+                return error("NoSuchUpload", 404)
+            parts, content_type = self.uploads.pop(query["uploadId"])
+            await request.read()
+            data = b"".join(parts[number] for number in sorted(parts))
+            etag = f"{hashlib.md5(data).hexdigest()}-{len(parts)}"
+            bucket[key] = (data, etag, content_type)
+            return xml(
+                f'<CompleteMultipartUploadResult xmlns="{XMLNS}"><Key>{escape(key)}</Key>'
+                f"<ETag>&quot;{etag}&quot;</ETag></CompleteMultipartUploadResult>"
+            )
+        if request.method == "DELETE" and "uploadId" in query:
+            self.uploads.pop(query["uploadId"], None)
+            return web.Response(status=204)
+
+        if request.method == "PUT":
+            if self.failing():
+                return error("InternalError", 500)
+            data = await request.read()
+            etag = hashlib.md5(data).hexdigest()
+            bucket[key] = (data, etag, request.headers.get("Content-Type", "binary/octet-stream"))
+            return web.Response(headers={"ETag": f'"{etag}"'})
+        if request.method in ("GET", "HEAD"):
+            if key not in bucket:
+                if request.method == "HEAD":
+                    return web.Response(status=404)
+                return error("NoSuchKey", 404)
+            data, etag, content_type = bucket[key]
+            headers = {"ETag": f'"{etag}"', "Content-Type": content_type}
+            if request.method == "HEAD":
+                headers["Content-Length"] = str(len(data))
+                return web.Response(headers=headers)
+            if request.http_range.start is not None or request.http_range.stop is not None:
+                start, stop, _ = request.http_range.indices(len(data))
+                headers["Content-Range"] = f"bytes {start}-{stop - 1}/{len(data)}"
+                return web.Response(status=206, body=data[start:stop], headers=headers)
+            return web.Response(body=data, headers=headers)
+        if request.method == "DELETE":
+            bucket.pop(key, None)
+            return web.Response(status=204)
+        raise web.HTTPMethodNotAllowed(request.method, ["GET", "HEAD", "PUT", "POST", "DELETE"])
+
+    async def start(self):
+        self._runner = web.AppRunner(self.application(), shutdown_timeout=0.5)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = self._runner.addresses[0][1]
+
+    async def stop(self):
+        await self._runner.cleanup()
+
+    def _serve(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_until_complete(self.start())
+        self._started.set()
+        self._loop.run_forever()
+        self._loop.run_until_complete(self.stop())
+        pending = asyncio.all_tasks(self._loop)
+        for task in pending:
+            task.cancel()
+        self._loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+        self._loop.close()
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+        self._started.wait()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
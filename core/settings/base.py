@@ -24,16 +24,21 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'import_export',
 
     'accounts.apps.AccountsConfig',
     'states.apps.StatesConfig',
     'cameras.apps.CamerasConfig',
+    'analytics.apps.AnalyticsConfig',
+    'jobs.apps.JobsConfig',
+    'core.apps.CoreConfig',
 ]
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.ReplicaStickinessMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -42,6 +47,18 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Query profiling (see core.profiling): a fingerprint repeated N times in a request is
+# reported as N+1, queries slower than SLOW_MS are logged and a share of them explained.
+QUERY_PROFILING = bool(os.getenv("QUERY_PROFILING"))
+QUERY_PROFILING_N_PLUS_ONE = int(os.getenv("QUERY_PROFILING_N_PLUS_ONE", 10))
+QUERY_PROFILING_SLOW_MS = float(os.getenv("QUERY_PROFILING_SLOW_MS", 200))
+QUERY_PROFILING_EXPLAIN_RATE = float(os.getenv("QUERY_PROFILING_EXPLAIN_RATE", 0.1))
+if QUERY_PROFILING:
+    MIDDLEWARE.insert(0, 'core.middleware.QueryProfilingMiddleware')
+
+# Bearer token of the Prometheus scraper at /metrics; staff sessions only when empty.
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
 ROOT_URLCONF = 'core.urls'
 
 TEMPLATES = [
@@ -88,9 +105,30 @@ DATABASES = {
         "PASSWORD": os.getenv("DB_PASSWORD"),
         "HOST": os.getenv("DB_HOST", "localhost"),
         "PORT": os.getenv("DB_PORT", "5432"),
+        # Reuse connections across requests, checked before reuse; the production profile
+        # replaces this with a connection pool.
+        "CONN_MAX_AGE": int(os.getenv("DB_CONN_MAX_AGE", 60)),
+        "CONN_HEALTH_CHECKS": True,
     }
 }
 
+# Optional streaming replica of the primary; the heavy read-only queries (dashboards, exports,
+# admin changelists) read from it through core.routers.ReplicaRouter. It uses the credentials
+# of the primary. The reads go back to the primary when it lags more than REPLICA_MAX_LAG
+# seconds, and for REPLICA_STICKY_SECONDS after a user's own writes, so keep the latter at
+# least as long as the lag tolerated.
+if os.getenv("DB_REPLICA_HOST"):
+    DATABASES["replica"] = {
+        **DATABASES["default"],
+        "HOST": os.getenv("DB_REPLICA_HOST"),
+        "PORT": os.getenv("DB_REPLICA_PORT", DATABASES["default"]["PORT"]),
+        "TEST": {"MIRROR": "default"},
+    }
+DATABASE_ROUTERS = ['core.routers.ReplicaRouter']
+REPLICA_MAX_LAG = float(os.getenv("REPLICA_MAX_LAG", 30))
+REPLICA_STICKY_SECONDS = int(os.getenv("REPLICA_STICKY_SECONDS", 30))
+REPLICA_LAG_CHECK_INTERVAL = float(os.getenv("REPLICA_LAG_CHECK_INTERVAL", 5))
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
 
@@ -110,10 +148,60 @@ STATIC_ROOT = BASE_DIR / "staticfiles"
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
 
+# Media in an S3-compatible object store when S3_BUCKET is set: files are written to a local
+# spool and uploaded in the background (see core.storages).
+if os.getenv("S3_BUCKET"):
+    STORAGES = {
+        "default": {
+            "BACKEND": "core.storages.SpooledS3Storage",
+            "OPTIONS": {
+                "bucket": os.getenv("S3_BUCKET"),
+                "endpoint_url": os.getenv("S3_ENDPOINT_URL") or None,
+                "access_key": os.getenv("S3_ACCESS_KEY"),
+                "secret_key": os.getenv("S3_SECRET_KEY"),
+                "region": os.getenv("S3_REGION") or None,
+                "spool_dir": os.getenv("S3_SPOOL_DIR", str(BASE_DIR / "spool")),
+                "spool_max_bytes": int(os.getenv("S3_SPOOL_MAX_BYTES", 2 * 1024 ** 3)),
+                "workers": int(os.getenv("S3_UPLOAD_WORKERS", 16)),
+                "url_expiry": int(os.getenv("S3_URL_EXPIRY", 3600)),
+            },
+        },
+        "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+    }
+
+# Statement timeout of the reads of the detection exports, which replaces DB_STATEMENT_TIMEOUT
+# for them ("0" for none).
+EXPORT_STATEMENT_TIMEOUT = os.getenv("EXPORT_STATEMENT_TIMEOUT", "0")
+
+# Seconds the assigned states of a user stay cached; changes miss the cache right away.
+ASSIGNED_STATES_CACHE_TIMEOUT = int(os.getenv("ASSIGNED_STATES_CACHE_TIMEOUT", 300))
+
+# Photo and object thumbnails: longest side in pixels per size, and disk budget of the cache.
+THUMBNAIL_SIZES = {"small": 160, "medium": 480, "large": 1024}
+THUMBNAIL_CACHE_BYTES = int(os.getenv("THUMBNAIL_CACHE_BYTES", 2 * 1024 ** 3))
+
+# Side in degrees of the grid cells of the deer heatmap (about 5 km); changing it requires
+# "refresh_heatmap --rebuild".
+HEATMAP_CELL_DEGREES = float(os.getenv("HEATMAP_CELL_DEGREES", 0.05))
+
+# Internal location of MEDIA_ROOT in the front web server (e.g. "/protected-media/"); when set,
+# videos are sent by the web server with X-Accel-Redirect instead of by Django.
+VIDEO_ACCEL_REDIRECT_PREFIX = os.getenv("VIDEO_ACCEL_REDIRECT_PREFIX", "")
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # Custom User
-AUTH_USER_MODEL = 'accounts.User'
\ No newline at end of file
+AUTH_USER_MODEL = 'accounts.User'
+
+# Object detection
+DETECTOR = os.getenv("DETECTOR", "cameras.detectors.YoloWorldDetector")
+YOLO_WORLD_MODEL = os.getenv("YOLO_WORLD_MODEL", "yolov8s-worldv2.pt")
+YOLO_WORLD_MODEL_CLASSES = {
+    "deer": {"MINIMUM_CONFIDENCE_THRESHOLD": 0.3},
+    "car": {"MINIMUM_CONFIDENCE_THRESHOLD": 0.5},
+    "truck": {"MINIMUM_CONFIDENCE_THRESHOLD": 0.5},
+    "person": {"MINIMUM_CONFIDENCE_THRESHOLD": 0.5},
+}
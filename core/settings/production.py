@@ -1,8 +1,29 @@
+from psycopg_pool import ConnectionPool
+
 from .base import *
 
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = False
 
+# Connections come from a psycopg 3 pool per process and database, checked before being handed
+# out, instead of being opened per request. A thread waits up to DB_POOL_TIMEOUT seconds for a
+# free one, so DB_POOL_MAX_SIZE should be at least the number of threads of a worker.
+# DB_STATEMENT_TIMEOUT (e.g. "30s") cancels runaway queries; it is set by gunicorn.conf.py
+# for the web workers only, as the batch commands legitimately run long statements.
+for database in DATABASES.values():
+    database["CONN_MAX_AGE"] = 0
+    database["OPTIONS"] = {
+        "pool": {
+            "min_size": int(os.getenv("DB_POOL_MIN_SIZE", 2)),
+            "max_size": int(os.getenv("DB_POOL_MAX_SIZE", 10)),
+            "timeout": float(os.getenv("DB_POOL_TIMEOUT", 10)),
+            "max_idle": 300,
+            "check": ConnectionPool.check_connection,
+        },
+    }
+    if os.getenv("DB_STATEMENT_TIMEOUT"):
+        database["OPTIONS"]["options"] = f"-c statement_timeout={os.getenv('DB_STATEMENT_TIMEOUT')}"
+
 # SECURE_SSL_REDIRECT = False  # TODO: Fix it
 # SESSION_COOKIE_HTTPONLY = True
 # SESSION_COOKIE_SECURE = True
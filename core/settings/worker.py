@@ -0,0 +1,27 @@
+"""
+Lean settings of the worker processes and short-lived batch commands.
+
+They load the settings of MODE_SETTINGS without the apps only the web front needs (the admin
+and its import-export integration, sessions, messages, static files and the REST framework),
+so ``django.setup`` skips the admin autodiscovery and imports less. Select them with
+``DJANGO_SETTINGS_MODULE=core.settings.worker``; the spawned workers use them by default
+(see ``core.startup.setup_worker``).
+"""
+from . import *  # noqa: F401,F403
+
+WORKER_EXCLUDED_APPS = {
+    'django.contrib.admin',
+    'django.contrib.messages',
+    'django.contrib.sessions',
+    'django.contrib.staticfiles',
+    'rest_framework',
+    'import_export',
+}
+
+INSTALLED_APPS = [app for app in INSTALLED_APPS if app not in WORKER_EXCLUDED_APPS]
+MIDDLEWARE = []
+ROOT_URLCONF = 'core.worker_urls'
+
+# Django's default logging configuration instantiates the mail_admins handler, which imports
+# the whole view and HTTP layer. Without it, warnings and errors still reach stderr.
+LOGGING_CONFIG = None
@@ -0,0 +1,55 @@
+"""
+Start-up of the worker processes, and its measurement.
+"""
+import os
+from collections import Counter
+
+import django
+
+FULL_SETTINGS = "core.settings"
+WORKER_SETTINGS = "core.settings.worker"
+
+
+def setup_worker(apps=True):
+    """
+    Sets Django up in a spawned worker process.
+
+    The workers inherit the settings module of their parent; when it is the full one they
+    switch to the lean worker settings, which load the same configuration without the web apps.
+
+    :param apps: Whether the worker uses the ORM. Workers that only need the settings and the
+        storages skip loading the apps and their models, and the database driver with them.
+    """
+    if os.environ.get("DJANGO_SETTINGS_MODULE", FULL_SETTINGS) == FULL_SETTINGS:
+        os.environ["DJANGO_SETTINGS_MODULE"] = WORKER_SETTINGS
+    if apps:
+        django.setup()
+        return
+    from django.conf import settings
+
+    if settings.LOGGING_CONFIG:
+        from django.utils.log import configure_logging
+
+        configure_logging(settings.LOGGING_CONFIG, settings.LOGGING)
+
+
+def parse_importtime(output):
+    """
+    Parses the ``-X importtime`` report of a process.
+
+    :return: A ``(modules, packages)`` pair: ``(self_us, cumulative_us, module)`` per imported
+        module, and a ``Counter`` of the self time per top-level package.
+    """
+    modules = []
+    packages = Counter()
+    for line in output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        if not self_us.strip().isdigit():
+            # The header line.
+            continue
+        name = name.strip()
+        modules.append((int(self_us), int(cumulative_us), name))
+        packages[name.split(".")[0]] += int(self_us)
+    return modules, packages
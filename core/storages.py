@@ -0,0 +1,340 @@
+"""
+Storage backend writing to a local spool and uploading to an S3-compatible object store.
+
+``save`` only writes the file to the spool directory and returns; a pool of background
+threads uploads it (as a multipart upload above ``multipart_threshold``, which is what
+videos get) and removes it from the spool. Until then, the file is read from the spool.
+
+When the spool holds more than ``spool_max_bytes``, ``save`` blocks until uploads free
+enough space, and fails after ``spool_timeout`` seconds: a slow object store slows the
+producers down instead of filling the disk. Failed uploads are retried after a growing delay
+without holding an upload thread. Files left in the spool by a process that died are
+uploaded when the storage is next created, by the one process holding the lock of the spool
+directory, so the processes sharing a spool do not all upload them.
+
+URLs are presigned when ``url`` is called, never at save time, and the most recently used
+ones are reused for half of their lifetime.
+
+``boto3`` is only imported when the storage is created.
+"""
+import fcntl
+import logging
+import mimetypes
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files import File
+from django.core.files.storage import Storage
+from django.utils.deconstruct import deconstructible
+
+from core import metrics
+
+logger = logging.getLogger(__name__)
+
+UPLOADS = metrics.counter("storage_uploads_total", "Files uploaded to the object store.")
+UPLOAD_FAILURES = metrics.counter("storage_upload_failures_total", "Failed upload attempts.")
+UPLOAD_SECONDS = metrics.histogram("storage_upload_seconds", "Time to upload a file.")
+SPOOL_BYTES = metrics.gauge("storage_spool_bytes", "Bytes waiting in the spool.")
+SPOOL_WAIT_SECONDS = metrics.histogram("storage_spool_wait_seconds", "Time a save waited for spool space.")
+
+TMP_PREFIX = ".tmp-"
+LOCK_NAME = ".lock"
+
+
+@deconstructible
+class SpooledS3Storage(Storage):
+    """
+    :param bucket: The bucket name.
+    :param endpoint_url: The URL of the S3-compatible service, None for AWS.
+    :param access_key: The access key id.
+    :param secret_key: The secret access key.
+    :param region: The region name.
+    :param spool_dir: The local directory holding the files waiting for upload.
+    :param spool_max_bytes: Bytes in the spool above which ``save`` blocks.
+    :param spool_timeout: Seconds ``save`` waits for spool space before failing.
+    :param workers: Number of concurrent uploads.
+    :param multipart_threshold: Size in bytes from which files are uploaded in parts.
+    :param part_size: Size in bytes of the parts.
+    :param url_expiry: Lifetime in seconds of the presigned URLs.
+    :param retries: Upload attempts before a file is left in the spool for the next start.
+    :param retry_delay: Seconds before the first retry of an upload, doubled at every attempt.
+    :param url_cache_size: Number of presigned URLs kept.
+    :param unique_prefixes: Prefixes of the names that are unique by construction (see
+        ``cameras.storage``), saved without checking whether they exist.
+    """
+
+    def __init__(
+        self,
+        bucket,
+        endpoint_url=None,
+        access_key=None,
+        secret_key=None,
+        region=None,
+        spool_dir="spool",
+        spool_max_bytes=2 * 1024 ** 3,
+        spool_timeout=60.0,
+        workers=16,
+        multipart_threshold=16 * 1024 ** 2,
+        part_size=16 * 1024 ** 2,
+        url_expiry=3600,
+        retries=5,
+        retry_delay=2.0,
+        url_cache_size=10_000,
+        unique_prefixes=("photos/", "objects/", "thumbnails/"),
+    ):
+        try:
+            import boto3
+            from boto3.s3.transfer import TransferConfig
+            from botocore.config import Config
+        except ImportError as e:
+            raise ImproperlyConfigured("SpooledS3Storage requires boto3") from e
+
+        self.bucket = bucket
+        self.spool_dir = os.path.abspath(spool_dir)
+        self.spool_max_bytes = spool_max_bytes
+        self.spool_timeout = spool_timeout
+        self.url_expiry = url_expiry
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.url_cache_size = url_cache_size
+        self.unique_prefixes = tuple(unique_prefixes)
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=endpoint_url,
+            aws_access_key_id=access_key,
+            aws_secret_access_key=secret_key,
+            region_name=region,
+            config=Config(max_pool_connections=workers * 4, retries={"max_attempts": 3}),
+        )
+        self.transfer_config = TransferConfig(
+            multipart_threshold=multipart_threshold,
+            multipart_chunksize=part_size,
+            max_concurrency=4,
+        )
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="s3-upload")
+        self.spool_bytes = 0
+        self.pending = {}
+        self.urls = OrderedDict()
+        self.urls_lock = threading.Lock()
+        self.condition = threading.Condition()
+        self.lock_fd = None
+        os.makedirs(self.spool_dir, exist_ok=True)
+        if self.acquire_spool():
+            self.recover()
+
+    def spool_path(self, name):
+        return os.path.join(self.spool_dir, *name.split("/"))
+
+    def acquire_spool(self):
+        """
+        Takes the lock of the spool directory without waiting; it is held until ``close`` or
+        the end of the process.
+
+        :return: Whether this storage holds the lock.
+        """
+        fd = os.open(os.path.join(self.spool_dir, LOCK_NAME), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        self.lock_fd = fd
+        return True
+
+    def close(self):
+        """
+        Waits for the uploads in progress and releases the lock of the spool directory.
+        """
+        self.executor.shutdown()
+        if self.lock_fd is not None:
+            os.close(self.lock_fd)
+            self.lock_fd = None
+
+    def recover(self):
+        """
+        Queues the files left in the spool by a previous process.
+        """
+        for directory, _, names in os.walk(self.spool_dir):
+            for filename in names:
+                if filename.startswith(TMP_PREFIX) or filename == LOCK_NAME:
+                    continue
+                path = os.path.join(directory, filename)
+                name = os.path.relpath(path, self.spool_dir).replace(os.sep, "/")
+                try:
+                    size = os.path.getsize(path)
+                except FileNotFoundError:
+                    continue
+                self.enqueue(name, size)
+
+    def enqueue(self, name, size):
+        with self.condition:
+            self.spool_bytes += size
+            self.pending[name] = size
+            SPOOL_BYTES.set(self.spool_bytes)
+        self.executor.submit(self.upload, name)
+
+    def reserve(self, size):
+        """
+        Blocks until the spool has room for ``size`` more bytes.
+        """
+        started = time.monotonic()
+        with self.condition:
+            # A file larger than the whole spool still goes through once the spool is empty.
+            if not self.condition.wait_for(
+                lambda: self.spool_bytes + size <= self.spool_max_bytes or not self.spool_bytes,
+                timeout=self.spool_timeout,
+            ):
+                raise OSError(f"Upload spool full ({self.spool_bytes} bytes waiting)")
+        SPOOL_WAIT_SECONDS.observe(time.monotonic() - started)
+
+    def upload(self, name, attempt=1):
+        path = self.spool_path(name)
+        started = time.monotonic()
+        try:
+            self.client.upload_file(
+                path,
+                self.bucket,
+                name,
+                ExtraArgs={"ContentType": mimetypes.guess_type(name)[0] or "application/octet-stream"},
+                Config=self.transfer_config,
+            )
+        except FileNotFoundError:
+            # Deleted while waiting, or uploaded by another process.
+            pass
+        except Exception:
+            UPLOAD_FAILURES.inc()
+            if attempt < self.retries:
+                logger.warning("Upload of %s failed, retrying", name, exc_info=True)
+                # The upload thread moves on to the next file meanwhile.
+                timer = threading.Timer(
+                    min(self.retry_delay * 2 ** (attempt - 1), 30),
+                    self.executor.submit,
+                    args=(self.upload, name, attempt + 1),
+                )
+                timer.daemon = True
+                timer.start()
+                return
+            logger.exception("Upload of %s failed, left in the spool", name)
+            self.release(name)
+            return
+        else:
+            UPLOADS.inc()
+            UPLOAD_SECONDS.observe(time.monotonic() - started)
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        self.release(name)
+
+    def release(self, name):
+        with self.condition:
+            self.spool_bytes -= self.pending.pop(name, 0)
+            SPOOL_BYTES.set(self.spool_bytes)
+            self.condition.notify_all()
+
+    def flush(self, timeout=None):
+        """
+        Waits until every spooled file is uploaded.
+
+        :return: Whether the spool is empty.
+        """
+        with self.condition:
+            return self.condition.wait_for(lambda: not self.pending, timeout=timeout)
+
+    def _save(self, name, content):
+        size = content.size
+        self.reserve(size)
+        path = self.spool_path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=TMP_PREFIX)
+        with os.fdopen(fd, "wb") as f:
+            if hasattr(content, "chunks"):
+                for chunk in content.chunks():
+                    f.write(chunk)
+            else:
+                f.write(content.read())
+        os.replace(tmp, path)
+        self.enqueue(name, os.path.getsize(path))
+        return name
+
+    def _open(self, name, mode="rb"):
+        try:
+            return File(open(self.spool_path(name), mode), name)
+        except FileNotFoundError:
+            pass
+        f = tempfile.SpooledTemporaryFile(max_size=8 * 1024 ** 2)
+        try:
+            self.client.download_fileobj(self.bucket, name, f)
+        except self.client.exceptions.ClientError as e:
+            f.close()
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey"):
+                raise FileNotFoundError(name) from e
+            raise
+        f.seek(0)
+        return File(f, name)
+
+    def get_available_name(self, name, max_length=None):
+        if name.startswith(self.unique_prefixes):
+            # Skip the existence checks, which would cost a request to the object store per save.
+            return self.generate_filename(name)
+        return super().get_available_name(name, max_length)
+
+    def exists(self, name):
+        if name in self.pending or os.path.exists(self.spool_path(name)):
+            return True
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=name)
+        except self.client.exceptions.ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+        return True
+
+    def delete(self, name):
+        try:
+            os.remove(self.spool_path(name))
+        except FileNotFoundError:
+            pass
+        with self.urls_lock:
+            self.urls.pop(name, None)
+        self.client.delete_object(Bucket=self.bucket, Key=name)
+
+    def size(self, name):
+        try:
+            return os.path.getsize(self.spool_path(name))
+        except FileNotFoundError:
+            return self.client.head_object(Bucket=self.bucket, Key=name)["ContentLength"]
+
+    def listdir(self, path):
+        prefix = f"{path.rstrip('/')}/" if path else ""
+        directories, files = [], []
+        for page in self.client.get_paginator("list_objects_v2").paginate(
+            Bucket=self.bucket, Prefix=prefix, Delimiter="/"
+        ):
+            directories.extend(p["Prefix"][len(prefix):].rstrip("/") for p in page.get("CommonPrefixes", []))
+            files.extend(o["Key"][len(prefix):] for o in page.get("Contents", []))
+        return directories, files
+
+    def url(self, name):
+        now = time.monotonic()
+        with self.urls_lock:
+            cached = self.urls.get(name)
+            if cached is not None and cached[1] > now:
+                self.urls.move_to_end(name)
+                return cached[0]
+        url = self.client.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": self.bucket, "Key": name},
+            ExpiresIn=self.url_expiry,
+        )
+        with self.urls_lock:
+            self.urls[name] = (url, now + self.url_expiry / 2)
+            self.urls.move_to_end(name)
+            if len(self.urls) > self.url_cache_size:
+                self.urls.popitem(last=False)
+        return url
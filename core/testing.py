@@ -0,0 +1,258 @@
+"""
+Fixtures and assertions shared by the test suites of the apps.
+
+The factories build realistic data in bulk: ``build_network`` creates states with their
+cities, roads and cameras, ``build_activity`` photos and detections for some cameras.
+``QueryBudgetMixin`` checks that an operation runs a fixed number of queries: it is counted
+at a first data size, the data is grown, and the same count is asserted again, so any query
+per row fails the test whatever the exact count is. Its duration assertions depend on the
+machine, so they are only checked when the ``RUN_TIMING_TESTS`` environment variable is set.
+"""
+import itertools
+import os
+import time
+from datetime import timedelta
+
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+_sequence = itertools.count(1)
+
+RUN_TIMING_TESTS = bool(os.getenv("RUN_TIMING_TESTS"))
+
+CLASS_NAMES = ("deer", "car", "truck", "person")
+
+
+def sequence():
+    return next(_sequence)
+
+
+def state_code(n):
+    return chr(65 + n // 26 % 26) + chr(65 + n % 26)
+
+
+def make_state(**fields):
+    from states.models import State
+
+    n = sequence()
+    return State.objects.create(**{
+        "name": f"State {n}",
+        "slug": f"state-{n}",
+        "abbreviation": state_code(n),
+        "latitude": 38.0 + n % 10,
+        "longitude": -77.0 - n % 10,
+        **fields,
+    })
+
+
+def make_city(state, **fields):
+    from states.models import City
+
+    n = sequence()
+    return City.objects.create(**{
+        "state": state,
+        "name": f"City {n}",
+        "slug": f"city-{n}",
+        "abbreviation": f"C{n}"[:6],
+        "timezone": "US/Eastern",
+        "latitude": state.latitude + n % 7 * 0.1,
+        "longitude": state.longitude + n % 5 * 0.1,
+        **fields,
+    })
+
+
+def make_road(**fields):
+    from states.models import Road
+
+    n = sequence()
+    return Road.objects.create(**{"name": f"I-{n}", "slug": f"i-{n}", "is_interstate": True, **fields})
+
+
+def make_user(staff=False, states=(), **fields):
+    from accounts.models import UserState
+
+    user = get_user_model().objects.create_user(
+        email=f"user{sequence()}@example.com",
+        password="password",
+        is_staff=staff,
+        is_superuser=staff,
+        **fields,
+    )
+    UserState.objects.bulk_create([
+        UserState(user=user, state=state, default=index == 0) for index, state in enumerate(states)
+    ])
+    return user
+
+
+def build_network(states=1, cities_per_state=2, roads=2, cameras_per_city=3):
+    """
+    Creates states, their cities and roads, and cameras along the roads in every city.
+
+    :return: A dict of the ``states``, ``cities``, ``roads`` and ``cameras`` lists.
+    """
+    from cameras.models import Camera
+    from cameras.reference import bump_version
+    from states.models import CityRoad, StateRoad
+
+    created_states = [make_state() for _ in range(states)]
+    cities = [make_city(state) for state in created_states for _ in range(cities_per_state)]
+    created_roads = [make_road() for _ in range(roads)]
+    cameras = []
+    for city in cities:
+        for i in range(cameras_per_city):
+            n = sequence()
+            road = created_roads[i % len(created_roads)]
+            cameras.append(Camera(
+                name=f"{road.name} at Exit {n}",
+                slug=f"{road.slug}-exit-{n}",
+                url=f"https://cameras.example.com/{n}/playlist.m3u8",
+                preview_url=f"https://cameras.example.com/{n}/preview.jpg",
+                latitude=city.latitude + i * 0.01,
+                longitude=city.longitude + i * 0.01,
+                road=road,
+                city=city,
+            ))
+    cameras = Camera.objects.bulk_create(cameras)
+    StateRoad.objects.bulk_create([
+        StateRoad(state=state, road=road) for state in created_states for road in created_roads
+    ])
+    CityRoad.objects.bulk_create([CityRoad(city=city, road=road) for city in cities for road in created_roads])
+    bump_version()
+    return {"states": created_states, "cities": cities, "roads": created_roads, "cameras": cameras}
+
+
+def build_activity(cameras, photos_per_camera=4, detections_per_photo=2, start=None, interval=60):
+    """
+    Creates photos of the cameras every ``interval`` seconds, one in four disconnected, and
+    detections cycling through the classes on the connected ones.
+
+    :return: A ``(photos, objects)`` pair of lists.
+    """
+    from cameras.models import DetectedObject, Photo
+
+    start = start or timezone.now() - timedelta(seconds=interval * photos_per_camera)
+    photos = []
+    for camera in cameras:
+        city = camera.city
+        for i in range(photos_per_camera):
+            captured_at = start + timedelta(seconds=interval * i)
+            connected = i % 4 != 3
+            photos.append(Photo(
+                camera=camera,
+                file=f"photos/{camera.slug}/{i}.jpg" if connected else "",
+                state_id=city.state_id,
+                city=city,
+                road_id=camera.road_id,
+                timezone=city.timezone,
+                captured_at=captured_at,
+                connection_start_date=captured_at,
+                detected_at=captured_at,
+                has_detected_objects=connected and detections_per_photo > 0,
+                deer_count_above_system_confidence=connected and detections_per_photo > 0,
+            ))
+    photos = Photo.objects.bulk_create(photos)
+
+    objects = []
+    for photo in photos:
+        if not photo.file:
+            continue
+        for j in range(detections_per_photo):
+            objects.append(DetectedObject(
+                photo=photo,
+                name=CLASS_NAMES[j % len(CLASS_NAMES)],
+                image=f"objects/{photo.camera.slug}/{photo.pk}-{j}.jpg",
+                conf=0.95 - 0.1 * j,
+                x=100.0 * j,
+                y=50.0,
+                width=40.0,
+                height=30.0,
+                timezone=photo.timezone,
+                captured_at=photo.captured_at,
+            ))
+    objects = DetectedObject.objects.bulk_create(objects)
+    return photos, objects
+
+
+class QueryBudgetMixin:
+    """
+    Assertions on the number of queries and the duration of operations, for ``TestCase``.
+    """
+
+    def count_queries(self, function):
+        with CaptureQueriesContext(connection) as context:
+            function()
+        return len(context.captured_queries)
+
+    def assertFixedQueries(self, function, grow, budget):
+        """
+        Asserts that ``function`` runs at most ``budget`` queries, and as many after ``grow()``
+        adds data. ``function`` runs once beforehand to fill the process caches.
+        """
+        function()
+        count = self.count_queries(function)
+        self.assertLessEqual(count, budget, f"{count} queries, over the budget of {budget}")
+        grow()
+        with self.assertNumQueries(count):
+            function()
+
+    def assertFasterThan(self, seconds, function):
+        """
+        Runs ``function`` and, with ``RUN_TIMING_TESTS``, asserts that it took less than
+        ``seconds``; returns its result.
+        """
+        started = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - started
+        if RUN_TIMING_TESTS:
+            self.assertLess(elapsed, seconds, f"took {elapsed:.2f}s, over {seconds}s")
+        return result
+
+
+class AdminQueryBudgetMixin(QueryBudgetMixin):
+    """
+    Checks the query budget of the changelist and change pages of ``admin_models``.
+
+    The test case creates the data of the first size in ``setUp`` and adds more in ``grow``.
+    """
+
+    admin_models = []
+    admin_budget = 20
+
+    def grow(self):
+        """
+        Adds more data; by default cameras in a few cities with their photos and detections.
+        """
+        build_activity(build_network(states=2, cities_per_state=3, cameras_per_city=4)["cameras"])
+
+    def admin_urls(self):
+        urls = []
+        for model in self.admin_models:
+            prefix = f"admin:{model._meta.app_label}_{model._meta.model_name}"
+            self.assertIn(model, admin.site._registry)
+            urls.append(reverse(f"{prefix}_changelist"))
+            obj = model._default_manager.order_by("pk").first()
+            self.assertIsNotNone(obj, f"No {model.__name__} to open the change page of")
+            urls.append(reverse(f"{prefix}_change", args=[obj.pk]))
+        return urls
+
+    def get_page(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+
+    def test_admin_pages_have_a_fixed_query_budget(self):
+        self.client.force_login(make_user(staff=True))
+        urls = self.admin_urls()
+        counts = {}
+        for url in urls:
+            self.get_page(url)
+            counts[url] = self.count_queries(lambda: self.get_page(url))
+        self.grow()
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertLessEqual(counts[url], self.admin_budget)
+                with self.assertNumQueries(counts[url]):
+                    self.get_page(url)
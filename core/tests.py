@@ -0,0 +1,240 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from unittest import mock
+
+from django.core.files.base import ContentFile
+from django.test import SimpleTestCase, TestCase
+
+from accounts.models import UserState
+from core import metrics
+from core.profiling import QueryProfile, fingerprint
+from core.s3_stub import StubS3Server
+from core.storages import SpooledS3Storage
+from core.testing import make_state, make_user
+
+
+class FingerprintTests(SimpleTestCase):
+    def test_literals_and_lists_are_collapsed(self):
+        self.assertEqual(
+            fingerprint("SELECT * FROM cameras_camera  WHERE id = 12 AND name = 'it''s' AND state_id IN (%s, %s, %s)"),
+            "SELECT * FROM cameras_camera WHERE id = ? AND name = ? AND state_id IN (...)",
+        )
+        self.assertEqual(
+            fingerprint("SELECT * FROM t WHERE id IN (%s, %s)"),
+            fingerprint("SELECT * FROM t WHERE id IN (%s, %s, %s, %s)"),
+        )
+
+    def test_identifiers_with_digits_are_kept(self):
+        self.assertEqual(fingerprint("SELECT col2 FROM t1 LIMIT 21"), "SELECT col2 FROM t1 LIMIT ?")
+
+
+class QueryProfileTests(TestCase):
+    def setUp(self):
+        self.states = [make_state() for _ in range(5)]
+        self.user = make_user(states=self.states)
+
+    def test_loop_of_queries_is_flagged(self):
+        with QueryProfile("test", n_plus_one=5, slow_ms=10_000) as profile:
+            # One query per assignment, as a template iterating a relation would run them.
+            names = [
+                assignment.state.name
+                for assignment in UserState.objects.filter(user=self.user)
+            ]
+
+        self.assertEqual(len(names), 5)
+        self.assertEqual(profile.count, 6)
+        [(key, count)] = profile.repeated
+        self.assertEqual(count, 5)
+        self.assertIn("WHERE", key)
+        self.assertIn("test_loop_of_queries_is_flagged", profile.stacks[key])
+
+    def test_prefetched_queries_are_not_flagged(self):
+        with QueryProfile("test", n_plus_one=5, slow_ms=10_000) as profile:
+            names = [
+                assignment.state.name
+                for assignment in UserState.objects.filter(user=self.user).select_related("state")
+            ]
+
+        self.assertEqual(len(names), 5)
+        self.assertEqual(profile.count, 1)
+        self.assertEqual(profile.repeated, [])
+        self.assertEqual(profile.stacks, {})
+
+    def test_queries_outside_the_profile_are_not_recorded(self):
+        with QueryProfile("test", n_plus_one=2, slow_ms=10_000) as profile:
+            list(UserState.objects.filter(user=self.user))
+        list(UserState.objects.filter(user=self.user))
+
+        self.assertEqual(profile.count, 1)
+        self.assertEqual(profile.repeated, [])
+
+
+class SpooledS3StorageTests(SimpleTestCase):
+    def setUp(self):
+        self.server = self.enterContext(StubS3Server())
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.spool_dir = directory.name
+
+    def storage(self, **options):
+        storage = SpooledS3Storage(
+            "bucket",
+            endpoint_url=self.server.endpoint_url,
+            access_key="key",
+            secret_key="secret",
+            region="us-east-1",
+            spool_dir=self.spool_dir,
+            **options,
+        )
+        self.addCleanup(storage.close)
+        return storage
+
+    def stored(self, name):
+        return self.server.buckets["bucket"][name][0]
+
+    def spool(self, name, data):
+        path = os.path.join(self.spool_dir, *name.split("/"))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+
+    def test_save_and_open(self):
+        storage = self.storage()
+        name = storage.save("photos/ab/cd/a.jpg", ContentFile(b"frame"))
+        self.assertEqual(name, "photos/ab/cd/a.jpg")
+        self.assertTrue(storage.flush(timeout=10))
+
+        self.assertEqual(self.stored(name), b"frame")
+        self.assertFalse(os.path.exists(os.path.join(self.spool_dir, "photos", "ab", "cd", "a.jpg")))
+        with storage.open(name) as f:
+            self.assertEqual(f.read(), b"frame")
+        self.assertTrue(storage.exists(name))
+        self.assertEqual(storage.size(name), 5)
+        self.assertEqual(storage.listdir("photos/ab/cd"), ([], ["a.jpg"]))
+
+        storage.delete(name)
+        self.assertFalse(storage.exists(name))
+        with self.assertRaises(FileNotFoundError):
+            storage.open(name)
+
+    def test_multipart_upload(self):
+        storage = self.storage(multipart_threshold=5 * 1024 ** 2, part_size=5 * 1024 ** 2)
+        data = os.urandom(6 * 1024 ** 2)
+        name = storage.save("videos/1/clip.mp4", ContentFile(data))
+        self.assertTrue(storage.flush(timeout=30))
+        self.assertEqual(self.stored(name), data)
+        self.assertEqual(self.server.buckets["bucket"][name][1].split("-")[1], "2")
+
+    def test_only_unique_prefixes_skip_the_existence_check(self):
+        storage = self.storage()
+        for name in ("photos/ab/cd/a.jpg", "videos/1/clip.mp4"):
+            storage.save(name, ContentFile(b"first"))
+        storage.flush(timeout=10)
+
+        self.assertEqual(storage.save("photos/ab/cd/a.jpg", ContentFile(b"second")), "photos/ab/cd/a.jpg")
+        renamed = storage.save("videos/1/clip.mp4", ContentFile(b"second"))
+        self.assertNotEqual(renamed, "videos/1/clip.mp4")
+        self.assertTrue(renamed.startswith("videos/1/clip_"))
+        storage.flush(timeout=10)
+        self.assertEqual(self.stored("videos/1/clip.mp4"), b"first")
+
+    def test_urls_are_cached_and_bounded(self):
+        storage = self.storage(url_cache_size=2)
+        first = storage.url("photos/a.jpg")
+        self.assertIn("photos/a.jpg", first)
+        storage.url("photos/b.jpg")
+        self.assertIs(storage.url("photos/a.jpg"), first)
+
+        storage.url("photos/c.jpg")
+        self.assertEqual(list(storage.urls), ["photos/a.jpg", "photos/c.jpg"])
+
+    def test_failed_uploads_are_retried(self):
+        self.server.fail_every = 2
+        storage = self.storage(retry_delay=0.01)
+        for i in range(5):
+            storage.save(f"photos/ab/cd/{i}.jpg", ContentFile(b"frame"))
+        self.assertTrue(storage.flush(timeout=30))
+        self.assertEqual(len(self.server.buckets["bucket"]), 5)
+
+    def test_files_left_in_the_spool_are_uploaded_by_one_process(self):
+        self.server.fail_every = 1
+        storage = self.storage(retries=2, retry_delay=0.01)
+        with self.assertLogs("core.storages", "WARNING") as logs:
+            storage.save("photos/ab/cd/a.jpg", ContentFile(b"frame"))
+            self.assertTrue(storage.flush(timeout=30))
+        self.assertIn("left in the spool", logs.output[-1])
+        self.assertEqual(self.server.buckets["bucket"], {})
+        self.server.fail_every = 0
+
+        # The spool is still locked by the first storage.
+        self.spool("photos/ab/cd/b.jpg", b"other")
+        other = self.storage()
+        self.assertEqual(other.pending, {})
+
+        storage.close()
+        recovering = self.storage()
+        self.assertTrue(recovering.flush(timeout=10))
+        self.assertEqual(self.stored("photos/ab/cd/a.jpg"), b"frame")
+        self.assertEqual(self.stored("photos/ab/cd/b.jpg"), b"other")
+
+
+class SharedMetricsTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.enterContext(mock.patch.object(metrics, "_directory", self.directory))
+        self.counter = metrics.counter("test_requests_total", "Test requests.")
+        self.gauge = metrics.gauge("test_in_flight", "Test requests in flight.")
+        self.histogram = metrics.histogram("test_request_seconds", "Test request durations.", buckets=(0.1, 1.0))
+        for metric in (self.counter, self.gauge, self.histogram):
+            self.addCleanup(metrics.REGISTRY.pop, metric.name)
+
+    def write_process(self, pid, requests, in_flight, durations):
+        counts = [sum(1 for d in durations if d <= 0.1), sum(1 for d in durations if 0.1 < d <= 1.0), 0]
+        with open(os.path.join(self.directory, f"{pid}-test.json"), "w") as f:
+            json.dump({
+                "test_requests_total": {"type": "counter", "documentation": "Test requests.", "value": requests},
+                "test_in_flight": {"type": "gauge", "documentation": "Test requests in flight.", "value": in_flight},
+                "test_request_seconds": {
+                    "type": "histogram",
+                    "documentation": "Test request durations.",
+                    "buckets": [0.1, 1.0],
+                    "counts": counts,
+                    "sum": sum(durations),
+                    "count": len(durations),
+                },
+            }, f)
+
+    def exited_pid(self):
+        process = subprocess.Popen([sys.executable, "-c", "pass"])
+        process.wait()
+        return process.pid
+
+    def test_render_merges_the_processes(self):
+        self.counter.inc(2)
+        self.gauge.set(1)
+        self.histogram.observe(0.05)
+        self.write_process(os.getppid(), requests=3, in_flight=5, durations=[0.5])
+        self.write_process(self.exited_pid(), requests=10, in_flight=7, durations=[0.05, 0.5])
+
+        for _ in range(2):
+            # The exited process is archived once, and still counted.
+            output = metrics.render()
+            self.assertIn("\ntest_requests_total 15\n", output)
+            self.assertIn("\ntest_in_flight 6\n", output)
+            self.assertIn('\ntest_request_seconds_bucket{le="0.1"} 2\n', output)
+            self.assertIn('\ntest_request_seconds_bucket{le="1.0"} 4\n', output)
+            self.assertIn("\ntest_request_seconds_count 4\n", output)
+
+        self.assertEqual(len([name for name in os.listdir(self.directory) if name.endswith("-test.json")]), 1)
+        self.assertEqual(metrics.read(os.path.join(self.directory, metrics.ARCHIVE))["test_requests_total"]["value"], 10)
+
+    def test_without_a_directory_only_this_process_is_rendered(self):
+        self.write_process(os.getppid(), requests=3, in_flight=5, durations=[0.5])
+        self.counter.inc(2)
+        with mock.patch.object(metrics, "_directory", None):
+            self.assertIn("\ntest_requests_total 2\n", metrics.render())
@@ -0,0 +1,21 @@
+"""
+Time zones of the cameras and their photos.
+"""
+
+# The "US/" zones of the tz database, as listed by ``pytz.all_timezones``. Kept literal so
+# loading the models doesn't build the list of every zone, once per ``timezone`` field.
+US_TIMEZONES = (
+    "US/Alaska",
+    "US/Aleutian",
+    "US/Arizona",
+    "US/Central",
+    "US/East-Indiana",
+    "US/Eastern",
+    "US/Hawaii",
+    "US/Indiana-Starke",
+    "US/Michigan",
+    "US/Mountain",
+    "US/Pacific",
+    "US/Samoa",
+)
+US_TIMEZONE_CHOICES = [(tz, tz) for tz in US_TIMEZONES]
@@ -1,6 +1,11 @@
 from django.contrib import admin
-from django.urls import path
+from django.urls import include, path
+
+from core.views import metrics_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('api/analytics/', include('analytics.urls')),
+    path('api/cameras/', include('cameras.urls')),
+    path('metrics', metrics_view, name='metrics'),
 ]
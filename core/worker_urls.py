@@ -0,0 +1,4 @@
+"""
+URLconf of the worker settings, which serve nothing.
+"""
+urlpatterns = []
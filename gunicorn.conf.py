@@ -0,0 +1,51 @@
+"""
+Gunicorn configuration of the production serving profile, read from the working directory::
+
+    gunicorn                   # WSGI, threaded workers (recommended: the views are sync)
+    GUNICORN_ASGI=1 gunicorn   # ASGI, uvicorn workers
+
+Every setting can be overridden with its environment variable. The database pool of a worker
+(DB_POOL_MAX_SIZE) defaults to its number of threads, so a thread never waits for a connection;
+keep ``workers * DB_POOL_MAX_SIZE`` below the ``max_connections`` of Postgres.
+"""
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+os.environ.setdefault("MODE_SETTINGS", "production")
+# Only the web workers get a statement timeout; see core/settings/production.py.
+os.environ.setdefault("DB_STATEMENT_TIMEOUT", "30s")
+# The workers merge their metrics through this directory (see core/metrics.py).
+os.environ.setdefault("METRICS_DIR", os.path.join(tempfile.gettempdir(), "wvc-metrics"))
+
+asgi = bool(os.getenv("GUNICORN_ASGI"))
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.getenv("GUNICORN_WORKERS", multiprocessing.cpu_count() * 2 + 1))
+if asgi:
+    wsgi_app = "core.asgi:application"
+    worker_class = "uvicorn_worker.UvicornWorker"
+    # Sync views run one at a time per worker under ASGI, on the thread of sync_to_async.
+    threads = 1
+else:
+    wsgi_app = "core.wsgi:application"
+    worker_class = "gthread"
+    threads = int(os.getenv("GUNICORN_THREADS", 4))
+os.environ.setdefault("DB_POOL_MAX_SIZE", str(max(threads, 2)))
+
+# Recycle the workers now and then to bound the growth of their memory, staggered.
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", 5000))
+max_requests_jitter = max_requests // 10
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 60))
+graceful_timeout = 30
+keepalive = 5
+# Load the application before forking: less memory per worker and faster restarts. The
+# connection pool is opened lazily, in each worker, on its first query.
+preload_app = True
+accesslog = os.getenv("GUNICORN_ACCESS_LOG", "-")
+
+
+def on_starting(server):
+    # The metrics of a previous run of the server start over, like those of a single process.
+    shutil.rmtree(os.environ["METRICS_DIR"], ignore_errors=True)
@@ -0,0 +1,18 @@
+from django.contrib import admin
+from django.utils import timezone
+
+from . import models
+
+
+@admin.register(models.Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ["id", "task", "queue", "status", "priority", "attempts", "run_at", "created_at"]
+    list_filter = ["status", "queue"]
+    search_fields = ["task"]
+    readonly_fields = ["attempts", "locked_by", "last_error", "created_at"]
+    actions = ["retry"]
+
+    @admin.action(description="Retry the selected jobs now")
+    def retry(self, request, queryset):
+        updated = queryset.update(status=models.Job.Status.QUEUED, attempts=0, run_at=timezone.now(), locked_by="")
+        self.message_user(request, f"{updated} jobs queued again.")
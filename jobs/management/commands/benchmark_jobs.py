@@ -0,0 +1,47 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from jobs import queue
+from jobs.management.commands.run_jobs import start_workers
+from jobs.models import Job
+
+
+class Command(BaseCommand):
+    help = 'Measure the throughput of the job queue with no-op jobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--jobs', type=int, default=100000, help='Number of jobs (default: 100000)')
+        parser.add_argument('--workers', type=int, default=4, help='Worker processes (default: 4)')
+        parser.add_argument('--batch-size', type=int, default=500, help='Jobs taken per query (default: 500)')
+
+    def handle(self, *args, **options):
+        name = f'benchmark-{int(time.time())}'
+
+        started = time.perf_counter()
+        with transaction.atomic():
+            queue.enqueue_many('jobs.tasks.noop', [{'i': i} for i in range(options['jobs'])], queue=name)
+        enqueue_seconds = time.perf_counter() - started
+        self.stdout.write(
+            f"Enqueued {options['jobs']} jobs in {enqueue_seconds:.2f}s "
+            f"({options['jobs'] / enqueue_seconds:,.0f} jobs/s)"
+        )
+
+        started = time.perf_counter()
+        processes = start_workers(
+            options['workers'],
+            {'queues': [name], 'batch_size': options['batch_size']},
+            until_empty=True,
+        )
+        for process in processes:
+            process.join()
+        run_seconds = time.perf_counter() - started
+
+        left = Job.objects.filter(queue=name).count()
+        Job.objects.filter(queue=name).delete()
+        done = options['jobs'] - left
+        self.stdout.write(self.style.SUCCESS(
+            f"Ran {done} jobs with {options['workers']} workers in {run_seconds:.2f}s "
+            f"({done / run_seconds:,.0f} jobs/s, including worker start-up), {left} left"
+        ))
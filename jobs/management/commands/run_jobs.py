@@ -0,0 +1,67 @@
+import multiprocessing
+import os
+import signal
+
+from django.core.management.base import BaseCommand
+
+from jobs.runner import run_worker
+
+
+def start_workers(count, worker_options, until_empty=False):
+    """
+    Starts ``count`` worker processes.
+
+    :return: The list of processes.
+    """
+    context = multiprocessing.get_context('spawn')
+    processes = [
+        context.Process(target=run_worker, args=(worker_options, until_empty), daemon=True)
+        for _ in range(count)
+    ]
+    for process in processes:
+        process.start()
+    return processes
+
+
+class Command(BaseCommand):
+    help = 'Run workers taking jobs from the Postgres job queue'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--queue',
+            action='append',
+            help='Queue to serve, repeatable (default: default)'
+        )
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 4, help='Worker processes (default: CPU count)')
+        parser.add_argument('--batch-size', type=int, default=100, help='Jobs taken per query (default: 100)')
+        parser.add_argument(
+            '--visibility',
+            type=int,
+            default=300,
+            help='Seconds before a job taken by a dead worker is run again (default: 300)'
+        )
+        parser.add_argument('--until-empty', action='store_true', help='Exit when the queues are empty')
+
+    def handle(self, *args, **options):
+        worker_options = {
+            'queues': options['queue'] or ['default'],
+            'batch_size': options['batch_size'],
+            'visibility': options['visibility'],
+        }
+        self.stdout.write(f"Starting {options['workers']} workers on {', '.join(worker_options['queues'])}")
+        processes = start_workers(options['workers'], worker_options, options['until_empty'])
+
+        # Each worker finishes its current job, puts the rest of its batch back and exits on
+        # SIGTERM; Ctrl-C reaches them directly.
+        signal.signal(signal.SIGTERM, lambda *_: [process.terminate() for process in processes])
+        for process in processes:
+            while True:
+                try:
+                    process.join()
+                    break
+                except KeyboardInterrupt:
+                    continue
+
+        failed = sum(1 for process in processes if process.exitcode)
+        style = self.style.WARNING if failed else self.style.SUCCESS
+        self.stdout.write(style(f'{len(processes)} workers stopped, {failed} with an error'))
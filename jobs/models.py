@@ -0,0 +1,46 @@
+from django.db import models
+from django.utils.timezone import now
+
+
+class Job(models.Model):
+    """
+    A unit of background work: a task (the dotted path of a function) and its keyword arguments.
+
+    A queued job runs once ``run_at`` has passed. A worker taking a job marks it running and
+    moves ``run_at`` to the end of its lease (the visibility timeout): a running job whose
+    ``run_at`` has passed belongs to a worker that died, and is taken again. Jobs that
+    succeed are deleted; jobs that keep failing are kept as failed.
+    """
+
+    class Status(models.TextChoices):
+        QUEUED = "queued", "Queued"
+        RUNNING = "running", "Running"
+        FAILED = "failed", "Failed"
+
+    id = models.BigAutoField(primary_key=True)
+    queue = models.CharField(max_length=64, default="default")
+    task = models.CharField(max_length=255)
+    payload = models.JSONField(blank=True, default=dict)
+    priority = models.SmallIntegerField(default=0, help_text="Higher runs first.")
+    status = models.CharField(max_length=10, choices=Status, default=Status.QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    run_at = models.DateTimeField(default=now)
+    locked_by = models.CharField(max_length=64, blank=True, default="")
+    last_error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                "queue",
+                models.F("priority").desc(),
+                "run_at",
+                "id",
+                condition=models.Q(status__in=["queued", "running"]),
+                name="job_dequeue_idx",
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.task} {self.id}"
@@ -0,0 +1,197 @@
+"""
+A durable job queue on a Postgres table.
+
+Workers take jobs in batches with ``SELECT ... FOR UPDATE SKIP LOCKED``, so any number of
+them share a queue without blocking each other. Enqueuing sends a ``NOTIFY`` on commit
+which wakes the idle workers listening on ``CHANNEL``; they only poll every few seconds to
+pick up delayed jobs and expired leases.
+"""
+import random
+import select
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import F
+from django.db.models.functions import Now
+from django.utils import timezone
+
+from .models import Job
+
+CHANNEL = "jobs"
+
+DEQUEUE_SQL = f"""
+WITH next AS (
+    SELECT id FROM {Job._meta.db_table}
+    WHERE queue = ANY(%(queues)s)
+      AND status IN ('queued', 'running')
+      AND run_at <= now()
+    ORDER BY priority DESC, run_at, id
+    LIMIT %(limit)s
+    FOR UPDATE SKIP LOCKED
+)
+UPDATE {Job._meta.db_table} AS job
+SET status = 'running',
+    attempts = job.attempts + 1,
+    run_at = now() + %(visibility)s * interval '1 second',
+    locked_by = %(worker)s
+FROM next
+WHERE job.id = next.id
+RETURNING job.id, job.task, job.payload, job.attempts, job.max_attempts
+"""
+
+EXTEND_SQL = f"""
+UPDATE {Job._meta.db_table}
+SET run_at = now() + %(visibility)s * interval '1 second'
+WHERE id = ANY(%(ids)s)
+  AND status = 'running'
+  AND locked_by = %(worker)s
+RETURNING id
+"""
+
+
+def notify(queue):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_notify(%s, %s)", [CHANNEL, queue])
+
+
+def enqueue(task, payload=None, queue="default", priority=0, delay=0, max_attempts=5):
+    """
+    Adds a job to a queue. Idle workers are woken up when the transaction commits.
+
+    :param task: The dotted path of the function, called with ``payload`` as keyword arguments.
+    :param delay: Seconds before the job may run.
+    :return: The ``Job``.
+    """
+    return enqueue_many(task, [payload or {}], queue, priority, delay, max_attempts)[0]
+
+
+def enqueue_many(task, payloads, queue="default", priority=0, delay=0, max_attempts=5, batch_size=5000):
+    """
+    Adds one job per payload to a queue with a single notification.
+
+    :return: The list of ``Job``.
+    """
+    if not payloads:
+        return []
+    run_at = timezone.now() + timedelta(seconds=delay)
+    jobs = Job.objects.bulk_create(
+        [
+            Job(
+                queue=queue,
+                task=task,
+                payload=payload,
+                priority=priority,
+                run_at=run_at,
+                max_attempts=max_attempts,
+            )
+            for payload in payloads
+        ],
+        batch_size=batch_size,
+    )
+    transaction.on_commit(lambda: notify(queue))
+    return jobs
+
+
+def dequeue(queues, limit, visibility, worker):
+    """
+    Takes up to ``limit`` due jobs and leases them to ``worker`` for ``visibility`` seconds.
+
+    :return: A list of ``(id, task, payload, attempts, max_attempts)``.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(DEQUEUE_SQL, {"queues": list(queues), "limit": limit, "visibility": visibility, "worker": worker})
+        return cursor.fetchall()
+
+
+def extend(job_ids, visibility, worker):
+    """
+    Renews the lease of running jobs for ``visibility`` seconds from now.
+
+    :return: The set of the ids still leased to ``worker``; a job missing from it outlived its
+        lease and was taken by another worker.
+    """
+    if not job_ids:
+        return set()
+    with connection.cursor() as cursor:
+        cursor.execute(EXTEND_SQL, {"ids": list(job_ids), "visibility": visibility, "worker": worker})
+        return {job_id for job_id, in cursor.fetchall()}
+
+
+def release(job_ids, worker):
+    """
+    Puts back the jobs leased to ``worker`` that it did not start, without counting an attempt.
+    """
+    if job_ids:
+        Job.objects.filter(id__in=job_ids, status=Job.Status.RUNNING, locked_by=worker).update(
+            status=Job.Status.QUEUED,
+            attempts=F("attempts") - 1,
+            run_at=Now(),
+            locked_by="",
+        )
+
+
+def complete(job_ids):
+    """
+    Deletes the jobs that succeeded.
+    """
+    if job_ids:
+        Job.objects.filter(id__in=job_ids).delete()
+
+
+def backoff(attempts, base=5.0, cap=3600.0):
+    """
+    Returns the delay before a retry, exponential with full jitter.
+    """
+    return random.uniform(0, min(cap, base * 2 ** (attempts - 1)))
+
+
+def fail(failures, base=5.0, cap=3600.0):
+    """
+    Schedules the retry of failed jobs, or marks them failed after their last attempt.
+
+    :param failures: A list of ``(id, attempts, max_attempts, error)``.
+    """
+    if not failures:
+        return
+    now = timezone.now()
+    jobs = []
+    for job_id, attempts, max_attempts, error in failures:
+        final = attempts >= max_attempts
+        jobs.append(Job(
+            id=job_id,
+            status=Job.Status.FAILED if final else Job.Status.QUEUED,
+            run_at=now if final else now + timedelta(seconds=backoff(attempts, base, cap)),
+            locked_by="",
+            last_error=error,
+        ))
+    Job.objects.bulk_update(jobs, ["status", "run_at", "locked_by", "last_error"])
+
+
+def listen():
+    """
+    Subscribes the current connection to the job notifications.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(f'LISTEN "{CHANNEL}"')
+
+
+def wait(queues, timeout):
+    """
+    Blocks until a job is enqueued in one of ``queues`` or ``timeout`` seconds have passed.
+
+    :return: Whether a notification came in.
+    """
+    connection.ensure_connection()
+    raw = connection.connection
+    notified = False
+    if hasattr(raw, "poll"):
+        # psycopg2
+        if not raw.notifies:
+            select.select([raw], [], [], timeout)
+        raw.poll()
+        while raw.notifies:
+            notified |= raw.notifies.pop(0).payload in queues
+    else:
+        for notify in raw.notifies(timeout=timeout, stop_after=1):
+            notified |= notify.payload in queues
+    return notified
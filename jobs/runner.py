@@ -0,0 +1,24 @@
+"""
+Entry point of the worker processes.
+
+Workers are spawned, so this module must not import models at import time.
+"""
+import signal
+
+from core.startup import setup_worker
+
+
+def run_worker(options, until_empty=False):
+    """
+    Sets Django up and runs a ``Worker`` until it receives SIGTERM or SIGINT.
+
+    :param options: The keyword arguments of the ``Worker``.
+    :return: The number of jobs that succeeded.
+    """
+    setup_worker()
+    from .worker import Worker
+
+    worker = Worker(**options)
+    signal.signal(signal.SIGTERM, worker.stop)
+    signal.signal(signal.SIGINT, worker.stop)
+    return worker.run(until_empty=until_empty)
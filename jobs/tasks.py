@@ -0,0 +1,9 @@
+"""
+Built-in tasks.
+"""
+
+
+def noop(**payload):
+    """
+    Does nothing; used to benchmark the queue itself.
+    """
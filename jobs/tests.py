@@ -0,0 +1,166 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from unittest import mock
+
+from django.db import connection, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.utils import timezone
+
+from core.testing import AdminQueryBudgetMixin, QueryBudgetMixin
+from . import queue
+from .models import Job
+from .queue import enqueue, enqueue_many
+from .worker import Worker
+
+
+class JobsAdminQueryBudgetTests(AdminQueryBudgetMixin, TestCase):
+    admin_models = [Job]
+
+    def setUp(self):
+        enqueue_many("jobs.tasks.noop", [{"n": n} for n in range(5)])
+
+    def grow(self):
+        enqueue_many("jobs.tasks.noop", [{"n": n} for n in range(200)], queue="other")
+
+
+class EnqueueTests(QueryBudgetMixin, TestCase):
+    def test_enqueue_many_is_one_query_per_batch(self):
+        with self.assertNumQueries(1):
+            enqueue_many("jobs.tasks.noop", [{"n": n} for n in range(1000)])
+        with self.assertNumQueries(2):
+            enqueue_many("jobs.tasks.noop", [{"n": n} for n in range(1500)], batch_size=1000)
+
+    def test_enqueue_many_is_fast(self):
+        jobs = self.assertFasterThan(5, lambda: enqueue_many("jobs.tasks.noop", [{"n": n} for n in range(20000)]))
+        self.assertEqual(len(jobs), 20000)
+        self.assertEqual(Job.objects.count(), 20000)
+
+
+def explode(**payload):
+    raise ValueError("boom")
+
+
+def in_thread(function):
+    """
+    Calls a function in another thread, hence on another database connection.
+    """
+    def run():
+        try:
+            return function()
+        finally:
+            connection.close()
+
+    with ThreadPoolExecutor(1) as executor:
+        return executor.submit(run).result(timeout=30)
+
+
+class BackoffTests(SimpleTestCase):
+    def test_backoff_is_exponential_and_capped(self):
+        with mock.patch("jobs.queue.random.uniform", side_effect=lambda low, high: high):
+            self.assertEqual([queue.backoff(attempts) for attempts in (1, 2, 3, 20)], [5, 10, 20, 3600])
+
+
+# Dequeuing compares run_at with now(), which is frozen for the whole transaction of a TestCase.
+class WorkerTests(TransactionTestCase):
+    def run_worker(self, **options):
+        return Worker(**options).run(until_empty=True)
+
+    def test_successful_jobs_are_deleted(self):
+        enqueue_many("jobs.tasks.noop", [{"n": n} for n in range(5)])
+        self.assertEqual(self.run_worker(batch_size=2), 5)
+        self.assertFalse(Job.objects.exists())
+
+    def test_failed_job_is_retried_with_backoff(self):
+        job = enqueue("jobs.tests.explode", max_attempts=2)
+        with mock.patch("jobs.queue.random.uniform", side_effect=lambda low, high: high):
+            self.assertEqual(self.run_worker(), 0)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.locked_by), (Job.Status.QUEUED, 1, ""))
+        self.assertIn("ValueError: boom", job.last_error)
+        self.assertGreater(job.run_at, timezone.now() + timedelta(seconds=4))
+
+        # Not due yet.
+        self.assertEqual(self.run_worker(), 0)
+        job.refresh_from_db()
+        self.assertEqual(job.attempts, 1)
+
+        Job.objects.update(run_at=timezone.now() - timedelta(seconds=1))
+        self.run_worker()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.Status.FAILED, 2))
+        # Failed jobs are kept, and never taken again.
+        self.assertEqual(queue.dequeue(["default"], 10, 300, "worker"), [])
+
+    def test_expired_lease_is_taken_again(self):
+        job = enqueue("jobs.tasks.noop", max_attempts=2)
+        [(job_id, *_)] = queue.dequeue(["default"], 10, 300, "dead")
+        self.assertEqual(queue.dequeue(["default"], 10, 300, "alive"), [])
+
+        Job.objects.update(run_at=timezone.now() - timedelta(seconds=1))
+        [(job_id, _, _, attempts, _)] = queue.dequeue(["default"], 10, 300, "alive")
+        self.assertEqual((job_id, attempts), (job.id, 2))
+        job.refresh_from_db()
+        self.assertEqual(job.locked_by, "alive")
+
+    def test_job_outliving_its_last_lease_fails(self):
+        job = enqueue("jobs.tasks.noop", max_attempts=1)
+        queue.dequeue(["default"], 10, 300, "dead")
+        Job.objects.update(run_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(self.run_worker(), 0)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.last_error), (Job.Status.FAILED, "lease expired"))
+
+    def test_lease_is_renewed_while_the_batch_runs(self):
+        jobs = enqueue_many("jobs.tasks.noop", [{"n": n} for n in range(3)])
+        worker = Worker(visibility=0)
+        leased = queue.dequeue(["default"], 10, 600, worker.name)
+        # Its lease expired and another worker took it.
+        Job.objects.filter(id=jobs[1].id).update(locked_by="other")
+
+        self.assertEqual(worker.run_batch(leased), 2)
+        self.assertEqual(list(Job.objects.values_list("id", "locked_by")), [(jobs[1].id, "other")])
+
+    def test_extend(self):
+        jobs = enqueue_many("jobs.tasks.noop", [{"n": n} for n in range(2)])
+        queue.dequeue(["default"], 10, 1, "worker")
+        self.assertEqual(queue.extend([job.id for job in jobs], 600, "worker"), {job.id for job in jobs})
+        self.assertEqual(queue.extend([job.id for job in jobs], 600, "other"), set())
+        self.assertFalse(Job.objects.filter(run_at__lt=timezone.now() + timedelta(seconds=500)).exists())
+
+    def test_stopped_worker_puts_its_batch_back(self):
+        enqueue_many("jobs.tasks.noop", [{"n": n} for n in range(3)])
+        worker = Worker()
+        leased = queue.dequeue(["default"], 10, 300, worker.name)
+        worker.stop()
+
+        self.assertEqual(worker.run_batch(leased), 0)
+        self.assertEqual(
+            set(Job.objects.values_list("status", "attempts", "locked_by")), {(Job.Status.QUEUED, 0, "")}
+        )
+        self.assertEqual(len(queue.dequeue(["default"], 10, 300, "worker")), 3)
+
+
+class ConcurrencyTests(TransactionTestCase):
+    def test_locked_jobs_are_skipped(self):
+        jobs = enqueue_many("jobs.tasks.noop", [{"n": n} for n in range(10)])
+        with transaction.atomic():
+            first = queue.dequeue(["default"], 6, 300, "first")
+            # The rows of the first batch stay locked until this transaction ends.
+            second = in_thread(lambda: queue.dequeue(["default"], 10, 300, "second"))
+
+        self.assertEqual(len(first), 6)
+        self.assertEqual(len(second), 4)
+        self.assertEqual({row[0] for row in first} | {row[0] for row in second}, {job.id for job in jobs})
+
+    def test_enqueue_wakes_up_listeners(self):
+        queue.listen()
+        self.assertFalse(queue.wait(["default"], 0.1))
+
+        in_thread(lambda: enqueue("jobs.tasks.noop", queue="other"))
+        self.assertFalse(queue.wait(["default"], 0.1))
+
+        started = time.monotonic()
+        in_thread(lambda: enqueue("jobs.tasks.noop"))
+        self.assertTrue(queue.wait(["default"], 10))
+        self.assertLess(time.monotonic() - started, 5)
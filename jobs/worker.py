@@ -0,0 +1,118 @@
+"""
+Workers running the jobs of the queue.
+"""
+import json
+import logging
+import os
+import socket
+import time
+import traceback
+
+from django.db import connection
+from django.utils.module_loading import import_string
+
+from core import metrics
+from . import queue
+
+logger = logging.getLogger(__name__)
+
+JOBS_DONE = metrics.counter("jobs_done_total", "Jobs that succeeded.")
+JOBS_FAILED = metrics.counter("jobs_failed_total", "Job attempts that raised.")
+JOB_SECONDS = metrics.histogram("jobs_batch_seconds", "Time to run a batch of jobs.")
+
+
+class Worker:
+    """
+    Takes batches of jobs from some queues and runs them until stopped.
+
+    :param queues: The names of the queues to serve.
+    :param batch_size: Number of jobs taken per query.
+    :param visibility: Seconds a job stays leased to this worker before another one may take it,
+        renewed while the batch runs.
+    :param poll_interval: Seconds between two looks at the queue when no notification comes in.
+    """
+
+    def __init__(self, queues=("default",), batch_size=100, visibility=300, poll_interval=5.0):
+        self.queues = list(queues)
+        self.batch_size = batch_size
+        self.visibility = visibility
+        self.poll_interval = poll_interval
+        self.name = f"{socket.gethostname()}:{os.getpid()}"
+        self.tasks = {}
+        self.stopped = False
+        self.listening = None
+
+    def task(self, path):
+        if path not in self.tasks:
+            self.tasks[path] = import_string(path)
+        return self.tasks[path]
+
+    def run_batch(self, jobs):
+        """
+        Runs a batch of dequeued jobs, then deletes the successful ones and reschedules the others.
+
+        The batch is leased as a whole, so the lease of the jobs not run yet is renewed once
+        half of it has passed; the jobs another worker took over meanwhile are dropped. When
+        the worker is stopped, the jobs not started are put back in the queue.
+
+        :return: The number of jobs that succeeded.
+        """
+        started = time.perf_counter()
+        renew_at = time.monotonic() + self.visibility / 2
+        pending = list(jobs)
+        done, failures = [], []
+        while pending:
+            if self.stopped:
+                queue.release([job[0] for job in pending], self.name)
+                break
+            if time.monotonic() >= renew_at:
+                held = queue.extend([job[0] for job in pending], self.visibility, self.name)
+                pending = [job for job in pending if job[0] in held]
+                renew_at = time.monotonic() + self.visibility / 2
+                if not pending:
+                    break
+            job_id, task, payload, attempts, max_attempts = pending.pop(0)
+            if attempts > max_attempts:
+                # Its last lease expired: the worker running it died.
+                failures.append((job_id, attempts, max_attempts, "lease expired"))
+                continue
+            if isinstance(payload, str):
+                payload = json.loads(payload)
+            try:
+                self.task(task)(**payload)
+            except Exception:
+                logger.exception("Job %s (%s) failed", job_id, task)
+                failures.append((job_id, attempts, max_attempts, traceback.format_exc(limit=20)))
+            else:
+                done.append(job_id)
+
+        queue.complete(done)
+        queue.fail(failures)
+        JOBS_DONE.inc(len(done))
+        JOBS_FAILED.inc(len(failures))
+        JOB_SECONDS.observe(time.perf_counter() - started)
+        return len(done)
+
+    def run(self, until_empty=False):
+        """
+        Runs jobs until ``stop`` is called, or until the queues are empty when ``until_empty``.
+
+        :return: The number of jobs that succeeded.
+        """
+        total = 0
+        while not self.stopped:
+            jobs = queue.dequeue(self.queues, self.batch_size, self.visibility, self.name)
+            if jobs:
+                total += self.run_batch(jobs)
+                continue
+            if until_empty:
+                break
+            if connection.connection is not self.listening:
+                # First wait, or Django reconnected since: subscribe again.
+                queue.listen()
+                self.listening = connection.connection
+            queue.wait(self.queues, self.poll_interval)
+        return total
+
+    def stop(self, *args):
+        self.stopped = True
@@ -1,18 +1,31 @@
 from django.contrib import admin
-from django.db.models import Count
 from import_export.admin import ImportExportMixin
 
-from cameras.models import Camera, DetectedObject, Photo
+from cameras.admin import ActivityCountsMixin, ReferenceAdminMixin, count_subquery
+from cameras.models import Camera
+from core.admin import ReplicaChangeListMixin
 from . import models
 
+ACTIVITY_COUNTS = [
+    "deer_count",
+    "unique_deer_count",
+    "car_count",
+    "truck_count",
+    "person_count",
+    "connected_count",
+    "disconnected_count",
+    "photo_count",
+]
+
 
 @admin.register(models.State)
-class StateAdmin(ImportExportMixin, admin.ModelAdmin):
+class StateAdmin(ReferenceAdminMixin, ReplicaChangeListMixin, ActivityCountsMixin, ImportExportMixin, admin.ModelAdmin):
     list_display = [
         "name",
         "is_active",
         "total_cameras",
         "total_deer",
+        "unique_deer",
         "total_cars",
         "total_trucks",
         "total_people",
@@ -23,46 +36,24 @@ class StateAdmin(ImportExportMixin, admin.ModelAdmin):
     list_editable = ["is_active"]
     search_fields = ["name"]
     prepopulated_fields = {"slug": ("name",)}
+    activity_field = "camera__city__state"
+    activity_counts = ACTIVITY_COUNTS
 
-    @admin.display
-    def total_cameras(self, obj):
-        return Camera.objects.filter(city__state=obj).count()
-
-    @admin.display
-    def total_deer(self, obj):
-        return DetectedObject.objects.filter(name="deer", photo__camera__city__state=obj).count()
-
-    @admin.display
-    def total_cars(self, obj):
-        return DetectedObject.objects.filter(name="car", photo__camera__city__state=obj).count()
-
-    @admin.display
-    def total_trucks(self, obj):
-        return DetectedObject.objects.filter(name="truck", photo__camera__city__state=obj).count()
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(camera_count=count_subquery(Camera.objects.all(), "city__state"))
 
-    @admin.display
-    def total_people(self, obj):
-        return DetectedObject.objects.filter(name="person", photo__camera__city__state=obj).count()
-
-    @admin.display
-    def total_connected(self, obj):
-        return Photo.objects.filter(camera__city__state=obj).exclude(file="").aggregate(Count("id"))["id__count"]
-
-    @admin.display
-    def total_disconnected(self, obj):
-        return Photo.objects.filter(camera__city__state=obj).filter(file="").aggregate(Count("id"))["id__count"]
-
-    @admin.display
-    def total_photo(self, obj):
-        return Photo.objects.filter(camera__city__state=obj).aggregate(Count("id"))["id__count"]
+    @admin.display(ordering="camera_count")
+    def total_cameras(self, obj):
+        return obj.camera_count
 
 
 @admin.register(models.Road)
-class RoadAdmin(ImportExportMixin, admin.ModelAdmin):
+class RoadAdmin(ReferenceAdminMixin, ReplicaChangeListMixin, ActivityCountsMixin, ImportExportMixin, admin.ModelAdmin):
     list_display = [
         "name",
         "total_cameras",
         "total_deer",
+        "unique_deer",
         "total_cars",
         "total_trucks",
         "total_people",
@@ -73,55 +64,35 @@ class RoadAdmin(ImportExportMixin, admin.ModelAdmin):
     search_fields = ["name"]
     list_filter = ["states"]
     prepopulated_fields = {"slug": ("name",)}
+    activity_field = "camera__road"
+    activity_counts = ACTIVITY_COUNTS
 
-    @admin.display
-    def total_cameras(self, obj):
-        return obj.cameras.count()
-
-    @admin.display
-    def total_deer(self, obj):
-        return DetectedObject.objects.filter(name="deer", photo__camera__road=obj).count()
-
-    @admin.display
-    def total_cars(self, obj):
-        return DetectedObject.objects.filter(name="car", photo__camera__road=obj).count()
-
-    @admin.display
-    def total_trucks(self, obj):
-        return DetectedObject.objects.filter(name="truck", photo__camera__road=obj).count()
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(camera_count=count_subquery(Camera.objects.all(), "road"))
 
-    @admin.display
-    def total_people(self, obj):
-        return DetectedObject.objects.filter(name="person", photo__camera__road=obj).count()
-
-    @admin.display
-    def total_connected(self, obj):
-        return Photo.objects.filter(camera__road=obj).exclude(file="").aggregate(Count("id"))["id__count"]
-
-    @admin.display
-    def total_disconnected(self, obj):
-        return Photo.objects.filter(camera__road=obj).filter(file="").aggregate(Count("id"))["id__count"]
-
-    @admin.display
-    def total_photo(self, obj):
-        return Photo.objects.filter(camera__road=obj).aggregate(Count("id"))["id__count"]
+    @admin.display(ordering="camera_count")
+    def total_cameras(self, obj):
+        return obj.camera_count
 
 
 @admin.register(models.StateRoad)
 class StateRoadAdmin(ImportExportMixin, admin.ModelAdmin):
     list_display = ["road", "state"]
     list_filter = ["state"]
+    list_select_related = ["road", "state"]
 
 
 @admin.register(models.CityRoad)
 class CityRoadAdmin(ImportExportMixin, admin.ModelAdmin):
     list_display = ["road", "city"]
     list_filter = ["city"]
+    list_select_related = ["road", "city"]
 
 
 @admin.register(models.City)
-class CityAdmin(ImportExportMixin, admin.ModelAdmin):
+class CityAdmin(ReferenceAdminMixin, ImportExportMixin, admin.ModelAdmin):
     list_display = ["name", "abbreviation", "state"]
+    list_select_related = ["state"]
     search_fields = ["name"]
     list_filter = ["state"]
     prepopulated_fields = {"slug": ("name",)}
\ No newline at end of file
@@ -0,0 +1,142 @@
+"""
+Assignment of coordinates to the nearest known city, in one vectorized pass.
+
+The index holds the centroid and bounding box of every city of the ``data/Cities`` files,
+whose ``id`` is ``<state abbreviation>_<city abbreviation>``. A point is assigned among the
+cities of its own state: its preferred city when that box contains it, else the nearest
+centroid among the boxes containing it, or the nearest centroid of the state when it falls
+outside every box. Distances are equirectangular, which
+is accurate to well under 1% at the scale of a state.
+"""
+import json
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def read_cities(directory):
+    """
+    Reads the city records of the JSON files of a directory, skipping the ones without an id
+    of the form ``<state>_<city>``.
+
+    :return: A list of dicts.
+    """
+    records = []
+    for path in sorted(Path(directory).glob("*.json")):
+        with open(path, encoding="utf-8") as f:
+            records.extend(record for record in json.load(f) if "_" in record.get("id", ""))
+    return records
+
+
+class CityIndex:
+    """
+    Centroids and bounding boxes of cities as NumPy arrays.
+
+    :param records: City dicts with ``id``, ``latitude``, ``longitude``, the ``north``/``south``
+        latitudes and ``east``/``west`` longitudes of their box, and ``timeZone``.
+    """
+
+    def __init__(self, records):
+        self.records = list(records)
+        self.keys = [tuple(record["id"].split("_", 1)) for record in self.records]
+        self.positions = {key: position for position, key in enumerate(self.keys)}
+        self.state_codes = {state: code for code, state in enumerate(sorted({state for state, _ in self.keys}))}
+
+        def column(field, fallback=None):
+            return np.array(
+                [record.get(field, record.get(fallback)) for record in self.records], dtype=np.float64
+            ).reshape(-1)
+
+        self.latitude = column("latitude")
+        self.longitude = column("longitude")
+        # Cities without a box only match by distance.
+        self.north = column("northLatitude", "latitude")
+        self.south = column("southLatitude", "latitude")
+        self.east = column("eastLongitude", "longitude")
+        self.west = column("westLongitude", "longitude")
+        self.state = np.array([self.state_codes[state] for state, _ in self.keys], dtype=np.int64)
+
+    @classmethod
+    def from_directory(cls, directory):
+        return cls(read_cities(directory))
+
+    def __len__(self):
+        return len(self.records)
+
+    def get(self, state, city):
+        """
+        Returns the record of a city by state and city abbreviations, None when unknown.
+        """
+        position = self.positions.get((state, city))
+        return None if position is None else self.records[position]
+
+    def state_timezone(self, state, choices=None):
+        """
+        Returns the most common time zone of the known cities of a state, None without any.
+
+        :param choices: When given, only the time zones among them count.
+        """
+        timezones = Counter(
+            record["timeZone"] for (city_state, _), record in zip(self.keys, self.records)
+            if city_state == state and record.get("timeZone") and (choices is None or record["timeZone"] in choices)
+        )
+        return timezones.most_common(1)[0][0] if timezones else None
+
+    def locate(self, latitudes, longitudes, states, preferred=None, chunk_size=4096):
+        """
+        Assigns points to the nearest city of their state.
+
+        :param latitudes: Latitudes of the points, NaN when unknown.
+        :param longitudes: Longitudes of the points, NaN when unknown.
+        :param states: State abbreviation of every point.
+        :param preferred: Index in ``records`` of the city every point claims to be in, -1 for
+            none; it is kept when its box contains the point, even if other boxes overlap.
+        :param chunk_size: Points compared to all the cities at once, bounding the memory used.
+        :return: A ``(index, inside, distance)`` tuple of arrays: the index of the city of every
+            point in ``records`` (-1 when the point has no coordinates or its state no city),
+            whether the point is inside the box of that city, and the distance in kilometres
+            to its centroid.
+        """
+        latitudes = np.asarray(latitudes, dtype=np.float64).reshape(-1)
+        longitudes = np.asarray(longitudes, dtype=np.float64).reshape(-1)
+        states = np.array([self.state_codes.get(state, -1) for state in states], dtype=np.int64).reshape(-1)
+        if preferred is None:
+            preferred = np.full(len(latitudes), -1, dtype=np.int64)
+        preferred = np.asarray(preferred, dtype=np.int64).reshape(-1)
+        index = np.full(len(latitudes), -1, dtype=np.int64)
+        inside = np.zeros(len(latitudes), dtype=bool)
+        distance = np.full(len(latitudes), np.nan)
+        if not len(self.records):
+            return index, inside, distance
+
+        for start in range(0, len(latitudes), chunk_size):
+            rows = slice(start, start + chunk_size)
+            lat, lon = latitudes[rows, None], longitudes[rows, None]
+            same_state = states[rows, None] == self.state[None, :]
+            x = np.radians(lon - self.longitude) * np.cos(np.radians((lat + self.latitude) / 2))
+            y = np.radians(lat - self.latitude)
+            # NaN coordinates compare false and give an infinite distance.
+            distances = np.where(same_state, EARTH_RADIUS_KM * np.hypot(x, y), np.inf)
+            distances[np.isnan(distances)] = np.inf
+            contained = (lat >= self.south) & (lat <= self.north) & (lon >= self.west) & (lon <= self.east)
+
+            nearest = np.argmin(distances, axis=1)
+            # The preferred city comes first among the boxes containing the point.
+            ranking = np.where(contained, distances, np.inf)
+            claimed = preferred[rows] >= 0
+            ranking[claimed, preferred[rows][claimed]] = np.where(
+                contained[claimed, preferred[rows][claimed]], -1.0, np.inf
+            )
+            nearest_inside = np.argmin(ranking, axis=1)
+            chunk_inside = np.take_along_axis(contained & same_state, nearest_inside[:, None], axis=1)[:, 0]
+            chosen = np.where(chunk_inside, nearest_inside, nearest)
+            chosen_distance = np.take_along_axis(distances, chosen[:, None], axis=1)[:, 0]
+            found = np.isfinite(chosen_distance)
+
+            index[rows] = np.where(found, chosen, -1)
+            inside[rows] = chunk_inside & found
+            distance[rows] = np.where(found, chosen_distance, np.nan)
+        return index, inside, distance
@@ -3,6 +3,7 @@ import os
 from pathlib import Path
 from django.core.management.base import BaseCommand
 from django.utils.text import slugify
+from cameras.reference import bump_version
 from states.models import State, City
 
 
@@ -37,6 +38,11 @@ class Command(BaseCommand):
         updated_count = 0
         error_count = 0
 
+        # The states and cities are looked up in memory, and the cities written in one upsert.
+        states = {state.name: state for state in State.objects.all()}
+        existing = set(City.objects.values_list('state_id', 'abbreviation'))
+        cities = {}
+
         for json_file in json_files:
             self.stdout.write(f'\nProcessing: {json_file.name}')
 
@@ -55,9 +61,8 @@ class Command(BaseCommand):
                             error_count += 1
                             continue
 
-                        try:
-                            state = State.objects.get(name=region_name)
-                        except State.DoesNotExist:
+                        state = states.get(region_name)
+                        if state is None:
                             self.stdout.write(self.style.ERROR(
                                 f'  ✗ {city_data.get("name")}: State "{region_name}" not found'
                             ))
@@ -73,31 +78,17 @@ class Command(BaseCommand):
                         # ایجاد slug
                         slug = slugify(city_data['name'])
 
-                        # به‌روزرسانی یا ایجاد
-                        city, created = City.objects.update_or_create(
+                        cities[(state.id, abbreviation)] = City(
                             state=state,
                             abbreviation=abbreviation,
-                            defaults={
-                                'name': city_data['name'],
-                                'slug': slug,
-                                'timezone': city_data.get('timeZone', 'US/Eastern'),
-                                'latitude': city_data.get('latitude', 0.0),
-                                'longitude': city_data.get('longitude', 0.0),
-                                'zoom': city_data.get('zoom', 12),
-                            }
+                            name=city_data['name'],
+                            slug=slug,
+                            timezone=city_data.get('timeZone', 'US/Eastern'),
+                            latitude=city_data.get('latitude', 0.0),
+                            longitude=city_data.get('longitude', 0.0),
+                            zoom=city_data.get('zoom', 12),
                         )
 
-                        if created:
-                            created_count += 1
-                            self.stdout.write(self.style.SUCCESS(
-                                f'  ✓ Created: {city.name} ({state.abbreviation})'
-                            ))
-                        else:
-                            updated_count += 1
-                            self.stdout.write(self.style.WARNING(
-                                f'  ⟳ Updated: {city.name} ({state.abbreviation})'
-                            ))
-
                     except Exception as e:
                         error_count += 1
                         self.stdout.write(self.style.ERROR(
@@ -111,6 +102,23 @@ class Command(BaseCommand):
                 self.stdout.write(self.style.ERROR(f'  ✗ Error reading {json_file.name}: {str(e)}'))
                 error_count += 1
 
+        City.objects.bulk_create(
+            cities.values(),
+            batch_size=1000,
+            update_conflicts=True,
+            unique_fields=['state', 'abbreviation'],
+            update_fields=['name', 'slug', 'timezone', 'latitude', 'longitude', 'zoom'],
+        )
+        for key, city in cities.items():
+            if key not in existing:
+                created_count += 1
+                self.stdout.write(self.style.SUCCESS(f'  ✓ Created: {city.name} ({city.state.abbreviation})'))
+            else:
+                updated_count += 1
+                self.stdout.write(self.style.WARNING(f'  ⟳ Updated: {city.name} ({city.state.abbreviation})'))
+
+        bump_version()
+
         self.stdout.write(self.style.SUCCESS(
             f'\n{"=" * 50}\nTotal: {created_count} created, {updated_count} updated, {error_count} errors'
         ))
\ No newline at end of file
@@ -1,6 +1,7 @@
 import json
 from django.core.management.base import BaseCommand
 from django.utils.text import slugify
+from cameras.reference import bump_version
 from states.models import State
 
 
@@ -16,35 +17,45 @@ class Command(BaseCommand):
         with open(json_file, 'r') as f:
             states_data = json.load(f)
 
-        created_count = 0
-        updated_count = 0
-
+        existing = set(State.objects.values_list('abbreviation', flat=True))
+        states = {}
         for index, state_data in enumerate(states_data, start=1):
             slug = slugify(state_data['name'])
 
             latitude = state_data.get('northLatitude') or 0.0
             longitude = state_data.get('westLongitude') or 0.0
 
-            state, created = State.objects.update_or_create(
+            states[state_data['abbreviation']] = State(
+                id=index,
                 abbreviation=state_data['abbreviation'],
-                defaults={
-                    'id': index,
-                    'name': state_data['name'],
-                    'slug': slug,
-                    'is_active': state_data['active'],
-                    'latitude': latitude,
-                    'longitude': longitude,
-                    'zoom': 8,
-                }
+                name=state_data['name'],
+                slug=slug,
+                is_active=state_data['active'],
+                latitude=latitude,
+                longitude=longitude,
+                zoom=8,
             )
 
-            if created:
+        # One upsert for all the states instead of a lookup and a write per state.
+        State.objects.bulk_create(
+            states.values(),
+            update_conflicts=True,
+            unique_fields=['abbreviation'],
+            update_fields=['name', 'slug', 'is_active', 'latitude', 'longitude', 'zoom'],
+        )
+
+        created_count = 0
+        updated_count = 0
+        for abbreviation, state in states.items():
+            if abbreviation not in existing:
                 created_count += 1
                 self.stdout.write(self.style.SUCCESS(f'✓ Created: {state.name}'))
             else:
                 updated_count += 1
                 self.stdout.write(self.style.WARNING(f'⟳ Updated: {state.name}'))
 
+        bump_version()
+
         self.stdout.write(self.style.SUCCESS(
             f'\nTotal: {created_count} created, {updated_count} updated'
         ))
\ No newline at end of file
@@ -1,5 +1,5 @@
 from django.core.management.base import BaseCommand
-from states.models import State, City, Road, StateRoad, CityRoad
+from states.models import StateRoad, CityRoad
 from cameras.models import Camera
 
 
@@ -9,11 +9,8 @@ class Command(BaseCommand):
     def handle(self, *args, **options):
         self.stdout.write('Starting to populate road relations...\n')
 
-        state_road_count = 0
-        city_road_count = 0
-
         # دریافت تمام Camera ها
-        cameras = Camera.objects.select_related('city', 'city__state', 'road').all()
+        cameras = Camera.objects.values_list('city__state_id', 'city_id', 'road_id')
 
         total = cameras.count()
         self.stdout.write(f'Processing {total} cameras...\n')
@@ -22,35 +19,33 @@ class Command(BaseCommand):
         state_roads = set()
         city_roads = set()
 
-        for i, camera in enumerate(cameras, 1):
+        for i, (state_id, city_id, road_id) in enumerate(cameras, 1):
             if i % 1000 == 0:
                 self.stdout.write(f'  Progress: {i}/{total}')
 
             # StateRoad
-            state_roads.add((camera.city.state.id, camera.road.id))
+            state_roads.add((state_id, road_id))
 
             # CityRoad
-            city_roads.add((camera.city.id, camera.road.id))
+            city_roads.add((city_id, road_id))
 
         # ایجاد StateRoad
         self.stdout.write('\nCreating StateRoad relations...')
-        for state_id, road_id in state_roads:
-            _, created = StateRoad.objects.get_or_create(
-                state_id=state_id,
-                road_id=road_id
-            )
-            if created:
-                state_road_count += 1
+        state_roads -= set(StateRoad.objects.values_list('state_id', 'road_id'))
+        StateRoad.objects.bulk_create(
+            [StateRoad(state_id=state_id, road_id=road_id) for state_id, road_id in state_roads],
+            batch_size=1000,
+        )
+        state_road_count = len(state_roads)
 
         # ایجاد CityRoad
         self.stdout.write('Creating CityRoad relations...')
-        for city_id, road_id in city_roads:
-            _, created = CityRoad.objects.get_or_create(
-                city_id=city_id,
-                road_id=road_id
-            )
-            if created:
-                city_road_count += 1
+        city_roads -= set(CityRoad.objects.values_list('city_id', 'road_id'))
+        CityRoad.objects.bulk_create(
+            [CityRoad(city_id=city_id, road_id=road_id) for city_id, road_id in city_roads],
+            batch_size=1000,
+        )
+        city_road_count = len(city_roads)
 
         self.stdout.write(self.style.SUCCESS(
             f'\n{"=" * 50}'
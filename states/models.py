@@ -1,5 +1,8 @@
+from django.contrib.postgres.indexes import GinIndex, OpClass
 from django.db import models
-import pytz
+from django.db.models.functions import Upper
+
+from core.timezones import US_TIMEZONE_CHOICES
 
 class State(models.Model):
     """
@@ -49,6 +52,11 @@ class Road(models.Model):
     cities = models.ManyToManyField(to="states.City", through="states.CityRoad", related_name="roads")
     is_interstate = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            GinIndex(OpClass(Upper("name"), name="gin_trgm_ops"), name="road_name_trgm_idx"),
+        ]
+
     def __str__(self) -> str:
         """
         Returns the string representation of the road.
@@ -81,7 +89,7 @@ class City(models.Model):
         max_length=17,
         blank=True,
         default="UTC",
-        choices=[(tz, tz) for tz in filter(lambda t: t.startswith("US/"), pytz.all_timezones)],
+        choices=US_TIMEZONE_CHOICES,
     )
     state = models.ForeignKey(
         to="states.State",
@@ -99,6 +107,9 @@ class City(models.Model):
             models.UniqueConstraint(fields=["state", "slug"], name="unique_slug_per_state"),
             models.UniqueConstraint(fields=["state", "abbreviation"], name="unique_abbreviation_per_state"),
         ]
+        indexes = [
+            GinIndex(OpClass(Upper("name"), name="gin_trgm_ops"), name="city_name_trgm_idx"),
+        ]
 
     def __str__(self) -> str:
         return self.name
@@ -1,3 +1,150 @@
-from django.test import TestCase
+import json
+import math
+import os
+import tempfile
 
-# Create your tests here.
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase
+
+from core.testing import AdminQueryBudgetMixin, QueryBudgetMixin, build_activity, build_network, state_code
+from .locating import CityIndex
+from .models import City, CityRoad, Road, State, StateRoad
+
+
+def call_quietly(*args, **options):
+    with open(os.devnull, "w") as devnull:
+        call_command(*args, stdout=devnull, stderr=devnull, **options)
+
+
+class StatesAdminQueryBudgetTests(AdminQueryBudgetMixin, TestCase):
+    admin_models = [State, Road, City, StateRoad, CityRoad]
+
+    def setUp(self):
+        network = build_network(states=1, cities_per_state=2, roads=2, cameras_per_city=2)
+        build_activity(network["cameras"])
+
+    def grow(self):
+        network = build_network(states=3, cities_per_state=3, roads=3, cameras_per_city=4)
+        build_activity(network["cameras"], photos_per_camera=8, detections_per_photo=3)
+
+
+class ImportQueryBudgetTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.dir = directory.name
+
+    def write(self, name, data):
+        path = os.path.join(self.dir, name)
+        with open(path, "w") as f:
+            json.dump(data, f)
+        return path
+
+    def states_data(self, count):
+        return [
+            {
+                "name": f"Imported State {n}",
+                "abbreviation": state_code(n),
+                "active": True,
+                "northLatitude": 39.0,
+                "westLongitude": -79.0,
+            }
+            for n in range(count)
+        ]
+
+    def cities_data(self, states, per_state):
+        return [
+            {
+                "id": f"{state.abbreviation}_C{n}",
+                "name": f"City {n}",
+                "regionName": state.name,
+                "timeZone": "US/Eastern",
+                "latitude": 39.0,
+                "longitude": -77.0,
+                "zoom": 12,
+            }
+            for state in states
+            for n in range(per_state)
+        ]
+
+    def test_import_states(self):
+        path = self.write("states.json", self.states_data(3))
+
+        def grow():
+            self.write("states.json", self.states_data(40))
+
+        self.assertFixedQueries(lambda: call_quietly("import_states", path), grow, budget=10)
+        self.assertEqual(State.objects.count(), 40)
+
+    def test_import_cities(self):
+        states = build_network(states=2, cities_per_state=0, roads=1)["states"]
+        cities_dir = os.path.join(self.dir, "Cities")
+        os.mkdir(cities_dir)
+        self.write("Cities/cities.json", self.cities_data(states, 2))
+
+        def grow():
+            more_states = build_network(states=3, cities_per_state=0, roads=1)["states"]
+            self.write("Cities/cities.json", self.cities_data(states + more_states, 20))
+
+        self.assertFixedQueries(lambda: call_quietly("import_cities", dir=cities_dir), grow, budget=10)
+        self.assertEqual(City.objects.count(), 100)
+
+    def test_populate_road_relations(self):
+        build_network(states=1, cities_per_state=2, roads=2, cameras_per_city=2)
+
+        def populate():
+            StateRoad.objects.all().delete()
+            CityRoad.objects.all().delete()
+            call_quietly("populate_road_relations")
+
+        def grow():
+            build_network(states=3, cities_per_state=3, roads=4, cameras_per_city=5)
+
+        self.assertFixedQueries(populate, grow, budget=12)
+        self.assertEqual(StateRoad.objects.count(), 2 + 3 * 4)
+        self.assertEqual(CityRoad.objects.count(), 2 * 2 + 9 * 4)
+
+    def test_bulk_imports_are_fast(self):
+        states = build_network(states=10, cities_per_state=0, roads=1)["states"]
+        cities_dir = os.path.join(self.dir, "Cities")
+        os.mkdir(cities_dir)
+        self.write("Cities/cities.json", self.cities_data(states, 200))
+
+        self.assertFasterThan(5, lambda: call_quietly("import_cities", dir=cities_dir))
+        self.assertEqual(City.objects.count(), 2000)
+
+
+class CityIndexTests(SimpleTestCase):
+    def setUp(self):
+        def city(key, latitude, longitude, size, timezone):
+            return {
+                "id": key, "latitude": latitude, "longitude": longitude, "timeZone": timezone,
+                "northLatitude": latitude + size, "southLatitude": latitude - size,
+                "eastLongitude": longitude + size, "westLongitude": longitude - size,
+            }
+
+        self.index = CityIndex([
+            city("CO_DE", 39.74, -104.99, 0.5, "US/Mountain"),
+            city("CO_BO", 40.01, -105.27, 0.5, "US/Mountain"),
+            city("KS_WI", 37.69, -97.34, 0.5, "US/Central"),
+        ])
+
+    def test_locate(self):
+        index, inside, distance = self.index.locate(
+            [39.9, 39.9, 38.0, 39.9, math.nan, 39.9],
+            [-105.2, -105.2, -104.0, -105.2, math.nan, -105.2],
+            ["CO", "CO", "CO", "KS", "CO", "ZZ"],
+            preferred=[-1, 0, -1, -1, -1, -1],
+        )
+        # Nearest containing box; the preferred box when it contains the point; nearest centroid
+        # outside every box; only cities of the same state; nothing without coordinates or cities.
+        self.assertEqual(index.tolist(), [1, 0, 0, 2, -1, -1])
+        self.assertEqual(inside.tolist(), [True, True, False, False, False, False])
+        self.assertAlmostEqual(distance[2], 211.6, delta=1)
+        self.assertTrue(math.isnan(distance[4]))
+
+    def test_lookups(self):
+        self.assertEqual(self.index.get("CO", "BO")["timeZone"], "US/Mountain")
+        self.assertIsNone(self.index.get("CO", "XX"))
+        self.assertEqual(self.index.state_timezone("KS"), "US/Central")
+        self.assertIsNone(self.index.state_timezone("ZZ"))